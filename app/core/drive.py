@@ -0,0 +1,181 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+TREE_FIELDS = "nextPageToken, files(id, name, mimeType, modifiedTime)"
+
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_SIZE = 100
+
+
+def build_drive_service(credentials_dict):
+    """Builds a Drive v3 client from the credentials dict stored in the Flask session."""
+    creds = Credentials.from_authorized_user_info(credentials_dict)
+    return build('drive', 'v3', credentials=creds)
+
+
+def list_folder_children(service, folder_id):
+    """Lists the direct children (files and folders) of a Drive folder, following pagination."""
+    children = []
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            fields="nextPageToken, files(id, name, mimeType, modifiedTime)",
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        children.extend(response.get('files', []))
+        page_token = response.get('nextPageToken', None)
+        if not page_token:
+            return children
+
+
+class DriveTreeCrawler:
+    """
+    Walks a Drive folder tree breadth-first.
+
+    All folders of one level are listed together: their files().list calls are
+    grouped into Drive batch requests of up to ``batch_size`` calls, and with
+    a ``service_factory`` the batches run on up to ``max_workers`` threads,
+    each with its own service (googleapiclient services are not thread-safe).
+    Folders with more entries than one page are continued in the next round
+    with their nextPageToken. A deep tree therefore costs about one round trip
+    per level instead of one per folder.
+
+    Services without batch support (e.g. simple mocks) get one call per folder page.
+    """
+
+    def __init__(self, service, service_factory: Optional[Callable[[], Any]] = None,
+                 max_workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 fields: str = TREE_FIELDS, max_attempts: int = 3):
+        self.service = service
+        self.service_factory = service_factory
+        self.max_workers = max_workers or int(os.getenv("DRIVE_CRAWL_WORKERS", "4"))
+        self.batch_size = min(batch_size or int(os.getenv("DRIVE_BATCH_SIZE", str(MAX_BATCH_SIZE))), MAX_BATCH_SIZE)
+        self.fields = fields
+        self.max_attempts = max_attempts
+        self.round_trips = 0
+        self._local = threading.local()
+
+    def _thread_service(self):
+        if self.service_factory is None:
+            return self.service
+        if not hasattr(self._local, "service"):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def _list_request(self, service, folder_id: str, page_token: Optional[str]):
+        return service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            fields=self.fields,
+            pageSize=1000,
+            pageToken=page_token
+        )
+
+    def _run_chunk(self, chunk: List[Tuple[str, Optional[str]]]) -> List[Tuple[Tuple[str, Optional[str]], Any, Optional[Exception]]]:
+        """Lists one page for each (folder_id, page_token), returning (page, response, error) triples."""
+        service = self._thread_service()
+        if not hasattr(service, "new_batch_http_request") or len(chunk) == 1:
+            results = []
+            for page in chunk:
+                try:
+                    results.append((page, self._list_request(service, *page).execute(), None))
+                except Exception as e:
+                    results.append((page, None, e))
+            return results
+
+        results = []
+        batch = service.new_batch_http_request(
+            callback=lambda request_id, response, exception: results.append((chunk[int(request_id)], response, exception)))
+        for i, page in enumerate(chunk):
+            batch.add(self._list_request(service, *page), request_id=str(i))
+        try:
+            batch.execute()
+        except Exception as e:
+            answered = {page for page, _, _ in results}
+            results.extend((page, None, e) for page in chunk if page not in answered)
+        return results
+
+    def _fetch_round(self, pages: List[Tuple[str, Optional[str]]]) -> List[Tuple[Tuple[str, Optional[str]], Any, Optional[Exception]]]:
+        chunks = [pages[i:i + self.batch_size] for i in range(0, len(pages), self.batch_size)]
+        self.round_trips += 1
+        if self.service_factory is None or len(chunks) == 1:
+            return [result for chunk in chunks for result in self._run_chunk(chunk)]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)), thread_name_prefix="drive-crawl") as pool:
+            return [result for chunk_results in pool.map(self._run_chunk, chunks) for result in chunk_results]
+
+    def _walk(self, folder_ids: List[str], recursive: bool) -> List[Dict[str, Any]]:
+        nodes: List[Dict[str, Any]] = []
+        pending: List[Tuple[str, Optional[str]]] = [(folder_id, None) for folder_id in folder_ids]
+        seen_folders = set(folder_ids)
+        attempts: Dict[Tuple[str, Optional[str]], int] = {}
+        while pending:
+            next_pending = []
+            for page, response, error in self._fetch_round(pending):
+                if error is not None:
+                    attempts[page] = attempts.get(page, 0) + 1
+                    if attempts[page] >= self.max_attempts:
+                        raise error
+                    logger.warning(f"Listing folder {page[0]} failed, retrying: {error}")
+                    next_pending.append(page)
+                    continue
+                parent_id = page[0]
+                for item in response.get('files', []):
+                    nodes.append({
+                        'id': item['id'],
+                        'name': item['name'],
+                        'mimeType': item['mimeType'],
+                        'modifiedTime': item.get('modifiedTime', ''),
+                        'parentId': parent_id
+                    })
+                    if recursive and item['mimeType'] == FOLDER_MIME_TYPE and item['id'] not in seen_folders:
+                        seen_folders.add(item['id'])
+                        next_pending.append((item['id'], None))
+                if response.get('nextPageToken'):
+                    next_pending.append((parent_id, response['nextPageToken']))
+            pending = next_pending
+        return nodes
+
+    def crawl(self, folder_id: str) -> List[Dict[str, Any]]:
+        """
+        Lists every file and subfolder below folder_id.
+        Returns a list of dicts: [{id, name, mimeType, modifiedTime, parentId}]
+        """
+        nodes = self._walk([folder_id], recursive=True)
+        logger.info(f"Crawled folder {folder_id}: {len(nodes)} items in {self.round_trips} rounds.")
+        return nodes
+
+    def list_children(self, folder_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Lists the direct children of several folders at once, keyed by folder ID."""
+        children: Dict[str, List[Dict[str, Any]]] = {folder_id: [] for folder_id in folder_ids}
+        for node in self._walk(list(folder_ids), recursive=False):
+            children[node['parentId']].append(node)
+        return children
+
+
+def list_folder_tree(service, folder_id, service_factory=None):
+    """
+    Lists every file and subfolder below a Drive folder (see DriveTreeCrawler).
+    Returns a list of dicts: [{id, name, mimeType, modifiedTime, parentId}]
+    """
+    return DriveTreeCrawler(service, service_factory=service_factory).crawl(folder_id)
+
+
+def list_all_files_in_folder(service, folder_id):
+    """
+    Recursively list all files in a Google Drive folder by folder_id.
+    Returns a list of dicts: [{id, name, modifiedTime}]
+    """
+    return [
+        {key: node[key] for key in ('id', 'name', 'mimeType', 'modifiedTime')}
+        for node in list_folder_tree(service, folder_id)
+        if node['mimeType'] != FOLDER_MIME_TYPE
+    ]
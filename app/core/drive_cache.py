@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.drive import FOLDER_MIME_TYPE, DriveTreeCrawler, list_folder_children
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+
+class FolderListingCache:
+    """
+    Per-user, in-process cache of Drive folder listings for the folder picker.
+
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted beyond ``max_entries``. Whenever a folder is listed, its subfolders
+    are listed in the background with one batched request, so expanding them
+    in the picker is served from the cache.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None, prefetch: bool = True):
+        self.ttl = ttl if ttl is not None else float(os.getenv("DRIVE_LISTING_TTL", "300"))
+        self.max_entries = max_entries or int(os.getenv("DRIVE_LISTING_CACHE_SIZE", "2000"))
+        self.prefetch = prefetch
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="drive-prefetch")
+
+    def get(self, user: str, folder_id: str) -> Optional[List[Dict[str, Any]]]:
+        key = (user, folder_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: str, folder_id: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries[(user, folder_id)] = (time.monotonic() + self.ttl, items)
+            self._entries.move_to_end((user, folder_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _is_fresh(self, user: str, folder_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get((user, folder_id))
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def invalidate(self, user: str, folder_id: Optional[str] = None) -> None:
+        """Drops one cached folder of a user, or all of them."""
+        with self._lock:
+            if folder_id is not None:
+                self._entries.pop((user, folder_id), None)
+                return
+            for key in [key for key in self._entries if key[0] == user]:
+                del self._entries[key]
+
+    def _prefetch_children(self, user: str, folder_ids: List[str], service_factory: Callable[[], Any]) -> None:
+        try:
+            crawler = DriveTreeCrawler(service_factory(), service_factory=service_factory)
+            for folder_id, children in crawler.list_children(folder_ids).items():
+                self.put(user, folder_id, children)
+        except Exception as e:
+            logger.warning(f"Prefetching {len(folder_ids)} Drive folders failed: {e}")
+
+    def listing(self, user: str, folder_id: str, service, service_factory: Optional[Callable[[], Any]] = None,
+                refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Returns the direct children of folder_id, from the cache when fresh.
+        With a ``service_factory`` the uncached subfolders are prefetched in the
+        background (googleapiclient services cannot be shared across threads).
+        """
+        items = None if refresh else self.get(user, folder_id)
+        if items is None:
+            items = list_folder_children(service, folder_id)
+            self.put(user, folder_id, items)
+
+        if self.prefetch and service_factory is not None:
+            subfolders = [item['id'] for item in items
+                          if item['mimeType'] == FOLDER_MIME_TYPE and not self._is_fresh(user, item['id'])]
+            if subfolders:
+                self._prefetch_pool.submit(self._prefetch_children, user, subfolders, service_factory)
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+drive_listing_cache = FolderListingCache()
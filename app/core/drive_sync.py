@@ -0,0 +1,176 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+from googleapiclient.errors import HttpError
+from app.core.drive import FOLDER_MIME_TYPE, DriveTreeCrawler
+from app.core.logger import setup_logger
+from db.crud import (
+    apply_drive_file_changes, apply_drive_sync_node_changes, delete_drive_sync_state,
+    get_drive_sync_nodes, get_drive_sync_state, get_last_synced_folder_id,
+    save_drive_sync_state, upsert_drive_files_sqlalchemy,
+)
+
+logger = setup_logger()
+
+CHANGE_FIELDS = ("nextPageToken, newStartPageToken, "
+                 "changes(fileId, removed, file(id, name, mimeType, modifiedTime, parents, trashed))")
+
+
+@dataclass
+class SyncResult:
+    folder_id: str
+    files: List[Dict[str, Any]]  # Every file currently in the folder tree
+    changed: List[Dict[str, Any]] = field(default_factory=list)  # Files added or modified by this sync
+    removed: List[str] = field(default_factory=list)  # IDs of files no longer in the tree
+    full: bool = False  # True if the tree was listed from scratch
+    requests: int = 0  # Drive API round trips made (a batch request counts once)
+
+
+def _files_only(nodes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {node_id: node for node_id, node in nodes.items() if node['mimeType'] != FOLDER_MIME_TYPE}
+
+
+def _diff_files(previous: Dict[str, Dict[str, Any]],
+                current: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    old_files = _files_only(previous)
+    files = _files_only(current)
+    changed = [f for f_id, f in files.items()
+               if f_id not in old_files or old_files[f_id].get('modifiedTime') != f['modifiedTime']]
+    removed = [f_id for f_id in old_files if f_id not in files]
+    return changed, removed
+
+
+def _fetch_changes(service, page_token: str) -> Tuple[List[Dict[str, Any]], str, int]:
+    """Returns every change since page_token, the token to resume from next time and the request count."""
+    changes = []
+    requests = 0
+    while True:
+        response = service.changes().list(
+            pageToken=page_token,
+            fields=CHANGE_FIELDS,
+            pageSize=1000,
+            includeRemoved=True,
+            spaces='drive'
+        ).execute()
+        requests += 1
+        changes.extend(response.get('changes', []))
+        if 'newStartPageToken' in response:
+            return changes, response['newStartPageToken'], requests
+        page_token = response['nextPageToken']
+
+
+def _drop_subtree(nodes: Dict[str, Dict[str, Any]], node_id: str) -> None:
+    doomed = {node_id}
+    while True:
+        children = {n['id'] for n in nodes.values() if n.get('parentId') in doomed} - doomed
+        if not children:
+            break
+        doomed |= children
+    for doomed_id in doomed:
+        nodes.pop(doomed_id, None)
+
+
+def _apply_changes(service, folder_id: str, nodes: Dict[str, Dict[str, Any]],
+                   changes: List[Dict[str, Any]], service_factory=None) -> int:
+    """
+    Applies Drive changes to the in-memory tree below folder_id. Only changes
+    to items inside the tree matter; an item moved out, trashed or deleted is
+    dropped with its descendants, and a folder moved in is listed once.
+    Returns the number of extra listing round trips made.
+    """
+    requests = 0
+    for change in changes:
+        file_id = change.get('fileId')
+        item = change.get('file') or {}
+        gone = change.get('removed') or item.get('trashed')
+        parent_id = next(
+            (p for p in item.get('parents', [])
+             if p == folder_id or nodes.get(p, {}).get('mimeType') == FOLDER_MIME_TYPE),
+            None
+        )
+        if gone or parent_id is None:
+            if file_id in nodes:
+                _drop_subtree(nodes, file_id)
+            continue
+
+        is_new_folder = item['mimeType'] == FOLDER_MIME_TYPE and file_id not in nodes
+        nodes[file_id] = {
+            'id': file_id,
+            'name': item.get('name'),
+            'mimeType': item['mimeType'],
+            'modifiedTime': item.get('modifiedTime', ''),
+            'parentId': parent_id
+        }
+        if is_new_folder:
+            # A folder moved into the tree brings children that have no change entries of their own
+            crawler = DriveTreeCrawler(service, service_factory=service_factory)
+            for child in crawler.crawl(file_id):
+                nodes[child['id']] = child
+            requests += crawler.round_trips
+    return requests
+
+
+def _full_sync(service, folder_id: str, previous: Dict[str, Dict[str, Any]], service_factory=None) -> SyncResult:
+    # Take the token before listing so changes made during the listing are not lost
+    page_token = service.changes().getStartPageToken().execute()['startPageToken']
+    crawler = DriveTreeCrawler(service, service_factory=service_factory)
+    nodes = crawler.crawl(folder_id)
+    apply_drive_sync_node_changes(folder_id, nodes, [], replace=True)
+    save_drive_sync_state(folder_id, page_token)
+
+    current = {n['id']: n for n in nodes}
+    changed, removed = _diff_files(previous, current)
+    return SyncResult(folder_id, list(_files_only(current).values()), changed, removed,
+                      full=True, requests=1 + crawler.round_trips)
+
+
+def sync_drive_folder(service, folder_id: str, service_factory=None) -> SyncResult:
+    """
+    Brings the stored copy of a Drive folder tree up to date.
+
+    The first sync of a folder lists it recursively and stores a Drive changes
+    page token. Later syncs only fetch the changes since that token (usually a
+    single request) and apply the ones inside the folder. If the token has
+    expired the folder is listed again. The drive_files table is updated with
+    the result, so it keeps mirroring the most recently synced folder.
+
+    Folder listings use DriveTreeCrawler; pass ``service_factory`` to let it
+    list several batches concurrently.
+    """
+    previous = {n['id']: n for n in get_drive_sync_nodes(folder_id)}
+    state = get_drive_sync_state(folder_id)
+    mirrored_folder = get_last_synced_folder_id()
+
+    result = None
+    if state:
+        try:
+            changes, page_token, requests = _fetch_changes(service, state['page_token'])
+        except HttpError as e:
+            logger.warning(f"Drive changes token for folder {folder_id} rejected, resyncing: {e}")
+        else:
+            if any(c.get('fileId') == folder_id and (c.get('removed') or (c.get('file') or {}).get('trashed'))
+                   for c in changes):
+                logger.info(f"Synced folder {folder_id} was removed from Drive.")
+                delete_drive_sync_state(folder_id)
+                result = SyncResult(folder_id, [], [], list(_files_only(previous)), requests=requests)
+            else:
+                nodes = dict(previous)
+                requests += _apply_changes(service, folder_id, nodes, changes, service_factory)
+                upserts = [n for n_id, n in nodes.items() if previous.get(n_id) != n]
+                removed_nodes = [n_id for n_id in previous if n_id not in nodes]
+                apply_drive_sync_node_changes(folder_id, upserts, removed_nodes)
+                save_drive_sync_state(folder_id, page_token)
+
+                changed, removed = _diff_files(previous, nodes)
+                result = SyncResult(folder_id, list(_files_only(nodes).values()), changed, removed,
+                                    requests=requests)
+    if result is None:
+        result = _full_sync(service, folder_id, previous, service_factory)
+
+    if mirrored_folder == folder_id and not result.full:
+        counts = apply_drive_file_changes(result.changed, result.removed)
+    else:
+        counts = upsert_drive_files_sqlalchemy(result.files)
+    logger.info(f"Synced folder {folder_id} ({'full' if result.full else 'incremental'}, {result.requests} round trips): "
+                f"{len(result.files)} files, {len(result.changed)} changed, {len(result.removed)} removed; "
+                f"drive_files {counts}.")
+    return result
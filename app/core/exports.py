@@ -0,0 +1,214 @@
+import csv
+import io
+import os
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+from openpyxl import Workbook
+from sqlalchemy import select
+from db.database import engine, LaptopInvoice, LaptopItem, LaptopAssignment, CurrentAssignment, User
+
+# Rows fetched from the cursor at a time, and rows written per streamed CSV chunk
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+XLSX_CHUNK_BYTES = 64 * 1024
+
+
+def iter_rows(statement, to_row: Callable[[Any], Sequence[Any]], bind=None) -> Iterator[Sequence[Any]]:
+    """
+    Runs a select and yields one converted row at a time, fetching
+    EXPORT_BATCH_ROWS rows from the cursor per round instead of loading the
+    whole result. The connection is held until the generator is exhausted or closed.
+    """
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_ROWS).execute(statement)
+        for row in result:
+            yield to_row(row)
+
+
+def stream_csv(columns: List[str], rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """Writes rows as CSV, yielding the text every EXPORT_BATCH_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def stream_xlsx(columns: List[str], rows: Iterable[Sequence[Any]], sheet_title: str = "Sheet1") -> Iterator[bytes]:
+    """
+    Writes rows with openpyxl's write-only mode, which keeps memory constant
+    by spooling rows to disk. An XLSX file is a zip archive that can only be
+    sent once complete, so it is built in a private temporary file first.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(XLSX_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+INVOICE_COLUMNS = [
+    'Invoice Number', 'Order Date', 'Invoice Date', 'Order Number', 'Supplier Name', 'Laptop Model',
+    'Processor', 'RAM', 'Storage', 'Color', 'Screen Size', 'OS', 'OS Version', 'Serial Number',
+    'Warranty Duration', 'Price', 'Created At', 'Warranty Expiry', 'Is Retired',
+]
+
+
+def invoice_rows(bind=None, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[Sequence[Any]]:
+    """
+    All laptops, including those not linked to an invoice, with their invoice
+    details. With start or end, only laptops invoiced in that range (inclusive).
+    """
+    statement = (
+        select(
+            LaptopInvoice.invoice_number, LaptopInvoice.order_date, LaptopInvoice.invoice_date,
+            LaptopInvoice.order_number, LaptopInvoice.supplier_name,
+            LaptopItem.laptop_model, LaptopItem.processor, LaptopItem.ram, LaptopItem.storage,
+            LaptopItem.model_color, LaptopItem.screen_size, LaptopItem.laptop_os, LaptopItem.laptop_os_version,
+            LaptopItem.laptop_serial_number, LaptopItem.warranty_duration, LaptopItem.laptop_price,
+            LaptopItem.created_at, LaptopItem.warranty_expiry, LaptopItem.is_retired,
+        )
+        .select_from(LaptopItem)
+        .outerjoin(LaptopInvoice, LaptopInvoice.id == LaptopItem.invoice_id)
+        .order_by(LaptopItem.id)
+    )
+    if start:
+        statement = statement.where(LaptopInvoice.invoice_date >= start)
+    if end:
+        statement = statement.where(LaptopInvoice.invoice_date <= end)
+    # The first five columns come from the invoice and are blank for laptops without one
+    return iter_rows(statement, lambda row: ['' if value is None else value for value in row[:5]] + list(row[5:]), bind)
+
+
+ASSET_RECORD_COLUMNS = [
+    'Laptop ID', 'Model', 'Serial Number', 'Status', 'Is Retired', 'Assigned', 'Assigned To',
+    'Assigned To Email', 'Created At', 'Warranty Expiry', 'Price',
+]
+
+
+def asset_record_rows(bind=None) -> Iterator[Sequence[Any]]:
+    """Every laptop with its current holder, if any."""
+    statement = (
+        select(
+            LaptopItem.id, LaptopItem.laptop_model, LaptopItem.laptop_serial_number, LaptopItem.is_retired,
+            User.name, User.email, LaptopItem.created_at, LaptopItem.warranty_expiry, LaptopItem.laptop_price,
+        )
+        .select_from(LaptopItem)
+        .outerjoin(CurrentAssignment, CurrentAssignment.laptop_item_id == LaptopItem.id)
+        .outerjoin(User, User.id == CurrentAssignment.user_id)
+        .order_by(LaptopItem.id)
+    )
+    return iter_rows(statement, lambda row: [
+        row.id, row.laptop_model, row.laptop_serial_number,
+        'Retired/Disposed' if row.is_retired else 'Active', row.is_retired,
+        bool(row.name), row.name or '', row.email or '',
+        row.created_at, row.warranty_expiry, row.laptop_price,
+    ], bind)
+
+
+ASSIGNMENT_HISTORY_COLUMNS = [
+    'Assignment ID', 'Laptop ID', 'Laptop Model', 'Laptop Serial Number', 'User ID', 'User Name',
+    'User Email', 'Assigned At', 'Unassigned At',
+]
+
+
+def assignment_history_rows(bind=None, start: Optional[date] = None,
+                            end: Optional[date] = None) -> Iterator[Sequence[Any]]:
+    """Every assignment, ordered by laptop. With start or end, only those made in that range of days."""
+    statement = (
+        select(
+            LaptopAssignment.id, LaptopAssignment.laptop_item_id, LaptopItem.laptop_model,
+            LaptopItem.laptop_serial_number, LaptopAssignment.user_id, User.name, User.email,
+            LaptopAssignment.assigned_at, LaptopAssignment.unassigned_at,
+        )
+        .select_from(LaptopAssignment)
+        .outerjoin(LaptopItem, LaptopItem.id == LaptopAssignment.laptop_item_id)
+        .outerjoin(User, User.id == LaptopAssignment.user_id)
+        .order_by(LaptopAssignment.laptop_item_id, LaptopAssignment.id)
+    )
+    if start:
+        statement = statement.where(LaptopAssignment.assigned_at >= datetime.combine(start, time.min))
+    if end:
+        statement = statement.where(LaptopAssignment.assigned_at < datetime.combine(end + timedelta(days=1), time.min))
+    return iter_rows(statement, lambda row: [
+        row.id, row.laptop_item_id, row.laptop_model or '', row.laptop_serial_number or '',
+        row.user_id, row.name or '', row.email or '', row.assigned_at, row.unassigned_at or '',
+    ], bind)
+
+
+EXPORTS: Dict[str, Callable[..., Iterator[Sequence[Any]]]] = {
+    "invoices": invoice_rows,
+    "asset records": asset_record_rows,
+    "assignment history": assignment_history_rows,
+}
+
+
+def _sample_database(laptops: int):
+    """An in-memory database with the given number of laptops, each assigned once and half of them returned."""
+    from sqlalchemy import create_engine, insert
+    from db.database import Base
+
+    sample = create_engine("sqlite://")
+    Base.metadata.create_all(sample)
+    with sample.begin() as conn:
+        conn.execute(insert(LaptopInvoice), [{"id": 1, "invoice_number": "INV-1"}])
+        conn.execute(insert(User), [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"}
+                                    for i in range(1, laptops + 1)])
+        conn.execute(insert(LaptopItem), [{"id": i, "invoice_id": 1 if i % 2 else None, "laptop_model": "Laptop",
+                                           "laptop_serial_number": f"SN{i}"} for i in range(1, laptops + 1)])
+        conn.execute(insert(LaptopAssignment), [{"id": i, "laptop_item_id": i, "user_id": i,
+                                                 "assigned_at": datetime(2024, 1, 1),
+                                                 "unassigned_at": datetime(2024, 6, 1) if i % 2 else None}
+                                                for i in range(1, laptops + 1)])
+        conn.execute(insert(CurrentAssignment), [{"laptop_item_id": i, "assignment_id": i, "user_id": i,
+                                                  "assigned_at": datetime(2024, 1, 1)}
+                                                 for i in range(2, laptops + 1, 2)])
+    return sample
+
+
+def count_export_queries(sizes: Sequence[int] = (10, 1000)) -> Dict[str, List[int]]:
+    """
+    Returns the number of SQL statements each export issues on sample databases
+    of the given sizes. Every export must issue the same number at every size.
+    """
+    from sqlalchemy import event
+
+    counts: Dict[str, List[int]] = {name: [] for name in EXPORTS}
+    for size in sizes:
+        sample = _sample_database(size)
+        for name, rows in EXPORTS.items():
+            statements = []
+            listener = lambda *args: statements.append(args[2])  # noqa: E731
+            event.listen(sample, "before_cursor_execute", listener)
+            try:
+                exported = sum(1 for _ in rows(sample))
+            finally:
+                event.remove(sample, "before_cursor_execute", listener)
+            if exported != size:
+                raise AssertionError(f"{name} export returned {exported} rows for {size}")
+            counts[name].append(len(statements))
+        sample.dispose()
+    return counts
+
+
+if __name__ == "__main__":
+    failed = False
+    for name, counts in count_export_queries().items():
+        ok = len(set(counts)) == 1
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {counts} queries for 10 and 1000 rows")
+    sys.exit(1 if failed else 0)
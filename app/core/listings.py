@@ -0,0 +1,198 @@
+import base64
+import json
+import os
+from datetime import date
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Date, DateTime, and_, or_
+from db.database import CurrentAssignment, LaptopItem, User
+
+PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+
+LAPTOP_SORTS = {
+    "id": LaptopItem.id,
+    "model": LaptopItem.laptop_model,
+    "warranty": LaptopItem.warranty_expiry,
+    "created": LaptopItem.created_at,
+    "price": LaptopItem.laptop_price,
+}
+LAPTOP_STATUSES = ("in_service", "retired", "all")
+USER_SORTS = {"name": User.name, "email": User.email, "id": User.id}
+USER_STATUSES = ("active", "inactive", "all")
+
+
+@dataclass
+class Page:
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    filters: Dict[str, Any] = field(default_factory=dict)
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """Returns [sort value, id] of the last row of the previous page, or None for a missing or bad cursor."""
+    if not cursor:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    return value if isinstance(value, list) and len(value) == 2 and isinstance(value[1], int) else None
+
+
+def _after(sort_column, id_column, cursor: List[Any], descending: bool):
+    """
+    Rows after the cursor in (sort_column, id) order. SQLite sorts NULLs
+    first ascending and last descending, so NULL sort values need their own cases.
+    """
+    value, last_id = cursor
+    if isinstance(sort_column.type, (Date, DateTime)) and value is not None:
+        value = sort_column.type.python_type.fromisoformat(value)
+    if sort_column is id_column:
+        return id_column < last_id if descending else id_column > last_id
+    if descending:
+        if value is None:
+            return and_(sort_column.is_(None), id_column < last_id)
+        return or_(sort_column < value, and_(sort_column == value, id_column < last_id), sort_column.is_(None))
+    if value is None:
+        return or_(sort_column.isnot(None), and_(sort_column.is_(None), id_column > last_id))
+    return or_(sort_column > value, and_(sort_column == value, id_column > last_id))
+
+
+def _paginate(query, sort_key: str, sort_column, id_column, descending: bool,
+              cursor: Optional[str], limit: Optional[int]) -> Page:
+    """Keyset pagination: seeks past the last row of the previous page instead of using OFFSET."""
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor)
+    if after is not None:
+        try:
+            query = query.filter(_after(sort_column, id_column, after, descending))
+        except (TypeError, ValueError):
+            pass  # A cursor from another sort order; start from the first page
+    if sort_column is id_column:
+        order = [id_column.desc() if descending else id_column.asc()]
+    elif descending:
+        order = [sort_column.desc(), id_column.desc()]
+    else:
+        order = [sort_column.asc(), id_column.asc()]
+    # Dates as ISO strings, for the cursor and the JSON listing
+    rows = [{key: value.isoformat() if isinstance(value, date) else value for key, value in row._asdict().items()}
+            for row in query.order_by(*order).limit(limit + 1)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][sort_key], rows[-1]["id"])
+    return Page(rows, next_cursor)
+
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    try:
+        return date.fromisoformat(value).isoformat() if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class LaptopFilters:
+    model: Optional[str] = None  # Part of the model name
+    status: str = "in_service"  # in_service, retired or all
+    assignee: Optional[str] = None  # "none" for unassigned laptops, a user ID, or part of a name or email
+    warranty_from: Optional[str] = None  # Warranty expiring on or after this ISO date
+    warranty_to: Optional[str] = None  # ... and on or before this one
+    sort: str = "id"
+    descending: bool = False
+
+    @classmethod
+    def from_args(cls, args) -> "LaptopFilters":
+        assignee = args.get("assignee") or ("none" if args.get("unassigned") == "1" else None)
+        return cls(
+            model=args.get("model") or None,
+            status=args.get("status") if args.get("status") in LAPTOP_STATUSES else "in_service",
+            assignee=assignee,
+            warranty_from=_iso_date(args.get("warranty_from")),
+            warranty_to=_iso_date(args.get("warranty_to")),
+            sort=args.get("sort") if args.get("sort") in LAPTOP_SORTS else "id",
+            descending=args.get("order") == "desc",
+        )
+
+    def to_args(self) -> Dict[str, Any]:
+        args = {key: value for key, value in asdict(self).items() if value and key != "descending"}
+        if self.descending:
+            args["order"] = "desc"
+        return args
+
+
+def list_laptops_page(session, filters: LaptopFilters, cursor: Optional[str] = None,
+                      limit: Optional[int] = None) -> Page:
+    """One page of laptops matching the filters, with their current holder."""
+    sort_column = LAPTOP_SORTS[filters.sort]
+    query = session.query(
+        LaptopItem.id, LaptopItem.laptop_model, LaptopItem.laptop_serial_number, LaptopItem.laptop_price,
+        LaptopItem.created_at, LaptopItem.warranty_expiry, LaptopItem.is_retired,
+        User.id.label("assigned_to_id"), User.name.label("assigned_to"),
+    ).outerjoin(CurrentAssignment, CurrentAssignment.laptop_item_id == LaptopItem.id)\
+        .outerjoin(User, User.id == CurrentAssignment.user_id)\
+        .filter(LaptopItem.is_active == True)
+
+    if filters.status == "in_service":
+        query = query.filter(LaptopItem.is_retired == False)
+    elif filters.status == "retired":
+        query = query.filter(LaptopItem.is_retired == True)
+    if filters.model:
+        query = query.filter(LaptopItem.laptop_model.ilike(f"%{filters.model}%"))
+    if filters.assignee == "none":
+        query = query.filter(CurrentAssignment.laptop_item_id.is_(None))
+    elif filters.assignee and filters.assignee.isdigit():
+        query = query.filter(CurrentAssignment.user_id == int(filters.assignee))
+    elif filters.assignee:
+        query = query.filter(or_(User.name.ilike(f"%{filters.assignee}%"), User.email.ilike(f"%{filters.assignee}%")))
+    if filters.warranty_from:
+        query = query.filter(LaptopItem.warranty_expiry >= date.fromisoformat(filters.warranty_from))
+    if filters.warranty_to:
+        query = query.filter(LaptopItem.warranty_expiry <= date.fromisoformat(filters.warranty_to))
+
+    page = _paginate(query, sort_column.key, sort_column, LaptopItem.id, filters.descending, cursor, limit)
+    page.filters = filters.to_args()
+    return page
+
+
+@dataclass
+class UserFilters:
+    q: Optional[str] = None  # Part of the name or email
+    status: str = "active"  # active, inactive or all
+    sort: str = "name"
+    descending: bool = False
+
+    @classmethod
+    def from_args(cls, args) -> "UserFilters":
+        return cls(
+            q=args.get("q") or None,
+            status=args.get("status") if args.get("status") in USER_STATUSES else "active",
+            sort=args.get("sort") if args.get("sort") in USER_SORTS else "name",
+            descending=args.get("order") == "desc",
+        )
+
+    def to_args(self) -> Dict[str, Any]:
+        args = {key: value for key, value in asdict(self).items() if value and key != "descending"}
+        if self.descending:
+            args["order"] = "desc"
+        return args
+
+
+def list_users_page(session, filters: UserFilters, cursor: Optional[str] = None,
+                    limit: Optional[int] = None) -> Page:
+    sort_column = USER_SORTS[filters.sort]
+    query = session.query(User.id, User.name, User.email, User.is_active)
+    if filters.status == "active":
+        query = query.filter(User.is_active == True)
+    elif filters.status == "inactive":
+        query = query.filter(User.is_active == False)
+    if filters.q:
+        query = query.filter(or_(User.name.ilike(f"%{filters.q}%"), User.email.ilike(f"%{filters.q}%")))
+    page = _paginate(query, sort_column.key, sort_column, User.id, filters.descending, cursor, limit)
+    page.filters = filters.to_args()
+    return page
@@ -0,0 +1,63 @@
+"""
+Parsing of extracted and submitted values into the column types they are stored as.
+
+Dates arrive as DD-MM-YYYY strings from the extractors and as ISO strings
+from forms and older rows; prices arrive as whatever JSON the LLM produced
+("55,000", "₹ 55000.00", 55000). They are normalized once, when written.
+"""
+import re
+from datetime import date, datetime
+from typing import Any, Optional
+
+# Extracted invoice dates are DD-MM-YYYY; ISO and DD/MM/YYYY are accepted too
+DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y")
+# Format of the dates in the extractor's invoice JSON, which the invoice exports keep
+INVOICE_DATE_FORMAT = "%d-%m-%Y"
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """A date from a date, datetime or date string. Returns None for anything unparseable."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """A datetime from an ISO timestamp (T or space separated) or a date, which becomes midnight."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.strip())
+        except ValueError:
+            pass
+    day = parse_date(value)
+    return datetime.combine(day, datetime.min.time()) if day else None
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """A price from a number or a string with currency symbols and thousands separators."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = _NUMBER.search(value.replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def format_invoice_date(value: Optional[date]) -> Optional[str]:
+    return value.strftime(INVOICE_DATE_FORMAT) if value else None
@@ -0,0 +1,59 @@
+"""
+Full-text search over laptops, users and invoices.
+
+search_index is an SQLite FTS5 table with one row per active laptop (model,
+serial number, processor), active user (name, email) and invoice (supplier,
+invoice number), kept in sync by triggers (see migration 8). Every word of
+the query must match the start of a word in the row, and results are
+ranked by bm25 with serial numbers, emails and invoice numbers weighted highest.
+
+Ranking costs time per matching row, so a query matching more than
+SEARCH_CANDIDATES rows (a one- or two-letter prefix on a large inventory)
+ranks only the first SEARCH_CANDIDATES of them, in rowid order.
+"""
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from db.migrations import SEARCH_ROWID_STRIDE, SEARCH_SOURCES
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_TERMS = 8
+SEARCH_CANDIDATES = 1000
+
+KINDS = {number: kind for kind, (number, *_rest) in SEARCH_SOURCES.items()}
+# Words as the unicode61 tokenizer splits them: letters and digits, everything else separates
+_TERM = re.compile(r"[^\W_]+")
+
+
+def match_expression(query: str) -> Optional[str]:
+    """An FTS5 query matching rows that have a word starting with each word of query, or None if it has none."""
+    terms = _TERM.findall(query or "")[:MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+def search(session, query: str, kind: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Best matches first; kind restricts them to "laptop", "user" or "invoice"."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    params = {"query": expression, "limit": max(1, min(limit or SEARCH_LIMIT, MAX_SEARCH_LIMIT))}
+    where = "search_index MATCH :query"
+    if kind in SEARCH_SOURCES:
+        where += f" AND rowid % {SEARCH_ROWID_STRIDE} = :kind"
+        params["kind"] = SEARCH_SOURCES[kind][0]
+    # Unranked matches come straight from the index in rowid order, so finding the cut-off is cheap
+    cutoff = session.execute(text(
+        f"SELECT rowid FROM search_index WHERE {where} ORDER BY rowid LIMIT 1 OFFSET :candidates"
+    ), dict(params, candidates=SEARCH_CANDIDATES)).scalar()
+    if cutoff is not None:
+        where += " AND rowid < :cutoff"
+        params["cutoff"] = cutoff
+    rows = session.execute(text(
+        f"SELECT rowid, name, code, detail FROM search_index WHERE {where} ORDER BY rank LIMIT :limit"
+    ), params)
+    return [
+        {"kind": KINDS[rowid % SEARCH_ROWID_STRIDE], "id": rowid // SEARCH_ROWID_STRIDE,
+         "name": name, "code": code, "detail": detail}
+        for rowid, name, code, detail in rows
+    ]
@@ -0,0 +1,108 @@
+"""
+Fleet aggregates for the dashboard.
+
+    python -m app.core.stats            # compare the counters with a full recount
+    python -m app.core.stats --rebuild  # recompute the counters from laptop_items
+
+The counts are not computed per request: fleet_counters holds one row per
+(dimension, key) with the number and total price of the laptops in it, and
+triggers on laptop_items, current_assignments and laptop_invoices keep it up
+to date on every write (see migration 9). Reading the dashboard is one scan
+of fleet_counters, whose size depends on the number of models, suppliers,
+months and expiry dates rather than on the number of laptops.
+"""
+import argparse
+import sys
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from db.migrations import FLEET_DIMENSIONS, fleet_counter_query, rebuild_fleet_counters
+
+STATUSES = ("assigned", "unassigned", "retired")
+# Warranty buckets by days left: (label, first day, last day)
+WARRANTY_BUCKETS = (
+    ("expired", None, -1),
+    ("0-30 days", 0, 30),
+    ("31-90 days", 31, 90),
+    ("91-365 days", 91, 365),
+    ("over a year", 366, None),
+)
+NO_WARRANTY = "unknown"
+
+
+def _warranty_bucket(expiry: str, today: date) -> str:
+    try:
+        days_left = (date.fromisoformat(expiry) - today).days
+    except ValueError:
+        return NO_WARRANTY
+    for label, first, last in WARRANTY_BUCKETS:
+        if (first is None or days_left >= first) and (last is None or days_left <= last):
+            return label
+    return NO_WARRANTY
+
+
+def _ranked(counts: Dict[str, Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """Rows of a dimension, largest field value first; laptops without a value are listed as "Unknown"."""
+    rows = [dict(value, key=key or "Unknown") for key, value in counts.items()]
+    return sorted(rows, key=lambda row: (-row[field], row["key"]))
+
+
+def fleet_stats(session, today: Optional[date] = None) -> Dict[str, Any]:
+    """Laptop totals by status and model, spend by supplier and month, and in-service laptops by warranty left."""
+    today = today or date.today()
+    counters: Dict[str, Dict[str, Dict[str, Any]]] = {dimension: {} for dimension in FLEET_DIMENSIONS}
+    rows = session.execute(text(
+        "SELECT dimension, key, laptops, spend FROM fleet_counters WHERE laptops != 0"
+    ))
+    for dimension, key, laptops, spend in rows:
+        if dimension in counters:
+            counters[dimension][key] = {"laptops": laptops, "spend": round(spend or 0, 2)}
+
+    warranty = {label: 0 for label, _, _ in WARRANTY_BUCKETS}
+    warranty[NO_WARRANTY] = 0
+    for expiry, value in counters["warranty"].items():
+        warranty[_warranty_bucket(expiry, today)] += value["laptops"]
+
+    status = counters["status"]
+    return {
+        "total": sum(value["laptops"] for value in status.values()),
+        "spend": round(sum(value["spend"] for value in status.values()), 2),
+        "by_status": {name: status.get(name, {}).get("laptops", 0) for name in STATUSES},
+        "by_model": _ranked(counters["model"], "laptops"),
+        "spend_by_supplier": _ranked(counters["supplier"], "spend"),
+        "spend_by_month": [dict(value, key=key or "Unknown") for key, value in sorted(counters["month"].items())],
+        "warranty": warranty,
+    }
+
+
+def counter_drift(conn) -> List[Tuple[str, str, int, int]]:
+    """(dimension, key, stored laptops, recounted laptops) for every counter that disagrees with a full recount."""
+    recount = " UNION ALL ".join(fleet_counter_query(dimension) for dimension in FLEET_DIMENSIONS)
+    rows = conn.execute(text(
+        f"WITH recount (dimension, key, laptops, spend) AS ({recount}) "
+        "SELECT dimension, key, COALESCE(c.laptops, 0), COALESCE(r.laptops, 0), "
+        "COALESCE(c.spend, 0), COALESCE(r.spend, 0) "
+        "FROM recount AS r LEFT JOIN fleet_counters AS c USING (dimension, key) "
+        "UNION "
+        "SELECT dimension, key, c.laptops, COALESCE(r.laptops, 0), c.spend, COALESCE(r.spend, 0) "
+        "FROM fleet_counters AS c LEFT JOIN recount AS r USING (dimension, key)"
+    ))
+    return [(dimension, key, stored, counted) for dimension, key, stored, counted, stored_spend, counted_spend in rows
+            if stored != counted or abs(stored_spend - counted_spend) > 0.005]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="recompute the counters from laptop_items")
+    args = parser.parse_args()
+
+    from db.database import engine, init_db
+    init_db()
+    with engine.begin() as conn:
+        if args.rebuild:
+            rebuild_fleet_counters(conn)
+        drift = counter_drift(conn)
+    for dimension, key, stored, counted in drift:
+        print(f"{dimension} {key!r}: {stored} counted, {counted} in laptop_items")
+    print(f"{len(drift)} counters differ from a full recount")
+    sys.exit(1 if drift else 0)
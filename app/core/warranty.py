@@ -0,0 +1,145 @@
+"""
+Warranty expiry dates and reports.
+
+    python -m app.core.warranty           # build (or rebuild) today's digest
+    python -m app.core.warranty --days 30 # print the laptops expiring in 30 days
+
+A laptop's warranty expires warranty_duration months after its invoice date
+(or the date it was added, for laptops entered by hand). The date is stored in
+laptop_items.warranty_expiry when the laptop is written, so reports are range
+scans on ix_laptop_items_warranty_id instead of per-row date arithmetic.
+"""
+import argparse
+import calendar
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select
+from db.database import SessionLocal, CurrentAssignment, LaptopInvoice, LaptopItem, User, WarrantyDigest
+from app.core.logger import setup_logger
+from app.core.normalize import parse_date
+
+logger = setup_logger()
+
+MAX_REPORT_DAYS = 3660
+# Windows counted in the daily digest; the digest lists laptops up to the longest one
+DIGEST_WINDOWS = tuple(int(days) for days in os.getenv("WARRANTY_DIGEST_WINDOWS", "30,60,90").split(","))
+
+REPORT_COLUMNS = ["Laptop ID", "Model", "Serial Number", "Warranty Expiry", "Days Left", "Invoice Number",
+                  "Supplier Name", "Assigned To", "Assigned To Email"]
+
+
+def add_months(day: date, months: int) -> date:
+    """The same day months later, clamped to the end of shorter months (31 Jan + 1 = 28/29 Feb)."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def warranty_expiry(purchase_date: Any, warranty_months: Any) -> Optional[date]:
+    """Expiry date for a purchase date and a warranty duration in months, or None if either is missing."""
+    start = parse_date(purchase_date)
+    try:
+        months = int(warranty_months)
+    except (TypeError, ValueError):
+        return None
+    if start is None or months <= 0:
+        return None
+    return add_months(start, months)
+
+
+def report_window(days: int, today: Optional[date] = None) -> Tuple[date, date]:
+    """Today and the last day of a days-long report window (capped at MAX_REPORT_DAYS)."""
+    today = today or date.today()
+    return today, today + timedelta(days=max(0, min(days, MAX_REPORT_DAYS)))
+
+
+def expiring_statement(start: date, end: date):
+    """In-service laptops whose warranty expires between start and end (inclusive), soonest first."""
+    return (
+        select(
+            LaptopItem.id, LaptopItem.laptop_model, LaptopItem.laptop_serial_number, LaptopItem.warranty_expiry,
+            LaptopInvoice.invoice_number, LaptopInvoice.supplier_name, User.name, User.email,
+        )
+        .select_from(LaptopItem)
+        .outerjoin(LaptopInvoice, LaptopInvoice.id == LaptopItem.invoice_id)
+        .outerjoin(CurrentAssignment, CurrentAssignment.laptop_item_id == LaptopItem.id)
+        .outerjoin(User, User.id == CurrentAssignment.user_id)
+        .where(LaptopItem.warranty_expiry >= start, LaptopItem.warranty_expiry <= end,
+               LaptopItem.is_active == True, LaptopItem.is_retired == False)
+        .order_by(LaptopItem.warranty_expiry, LaptopItem.id)
+    )
+
+
+def report_row(row, today: date) -> List[Any]:
+    return [row.id, row.laptop_model, row.laptop_serial_number, row.warranty_expiry.isoformat(),
+            (row.warranty_expiry - today).days, row.invoice_number or '', row.supplier_name or '',
+            row.name or '', row.email or '']
+
+
+def expiring_laptops(session, days: int, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Laptops in service whose warranty expires in the next days days (today included)."""
+    today, end = report_window(days, today)
+    rows = session.execute(expiring_statement(today, end))
+    keys = ["id", "laptop_model", "laptop_serial_number", "warranty_expiry", "days_left", "invoice_number",
+            "supplier_name", "assigned_to", "assigned_to_email"]
+    return [dict(zip(keys, report_row(row, today))) for row in rows]
+
+
+def build_warranty_digest(day: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Computes the digest for a day (today by default) and stores it in
+    warranty_digests, replacing any digest already stored for that day.
+    """
+    day = day or date.today()
+    session = SessionLocal()
+    try:
+        laptops = expiring_laptops(session, max(DIGEST_WINDOWS), today=day)
+        digest = {
+            "date": day.isoformat(),
+            "counts": {str(window): sum(1 for laptop in laptops if laptop["days_left"] <= window)
+                       for window in DIGEST_WINDOWS},
+            "laptops": laptops,
+        }
+        session.merge(WarrantyDigest(digest_date=day, generated_at=datetime.now(), payload=json.dumps(digest)))
+        session.commit()
+    finally:
+        session.close()
+    logger.info(f"Warranty digest for {day}: {digest['counts']}")
+    return digest
+
+
+def get_warranty_digest(day: Optional[date] = None) -> Dict[str, Any]:
+    """The stored digest for a day; today's is built on first use if the scheduled run has not made it yet."""
+    day = day or date.today()
+    session = SessionLocal()
+    try:
+        stored = session.get(WarrantyDigest, day)
+        payload = stored.payload if stored else None
+    finally:
+        session.close()
+    if payload is not None:
+        return json.loads(payload)
+    if day != date.today():
+        return {}
+    return build_warranty_digest(day)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, help="print the laptops expiring in this many days instead")
+    args = parser.parse_args()
+
+    from db.database import init_db
+    init_db()
+    if args.days is not None:
+        session = SessionLocal()
+        try:
+            for laptop in expiring_laptops(session, args.days):
+                print(f"{laptop['warranty_expiry']}  {laptop['laptop_serial_number'] or '-'}  "
+                      f"{laptop['laptop_model']}  {laptop['assigned_to'] or 'unassigned'}")
+        finally:
+            session.close()
+    else:
+        print(json.dumps(build_warranty_digest()["counts"]))
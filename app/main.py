@@ -1,22 +1,33 @@
-import io
 import os
-import tempfile
 from dotenv import load_dotenv
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
-from googleapiclient.http import MediaIoBaseDownload
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, jsonify, flash, g
-from db.crud import create_user, delete_invoice_by_drive_file_id, get_all_drive_files, get_all_users, get_user_by_id, insert_or_replace_laptop_invoice, update_user, soft_delete_user, soft_delete_laptop, get_assignments_for_user, upsert_drive_files_sqlalchemy
+from flask import Flask, Response, render_template, request, redirect, url_for, session, jsonify, flash, g, stream_with_context
+from db.crud import create_user, delete_invoice_by_drive_file_id, get_all_drive_files, get_all_users, get_user_by_id, insert_or_replace_laptop_invoice, update_user, soft_delete_user, soft_delete_laptop, get_assignments_for_user, get_extraction_job_progress, mark_interrupted_extraction_jobs, open_assignment, close_assignment, get_current_assignment, query_unassigned_laptops
 from db.database import SessionLocal, LaptopItem, LaptopAssignment, User, LaptopInvoice, MaintenanceLog, DriveFile, init_db
-import pandas as pd
 from functools import wraps
 from datetime import datetime
-from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash, check_password_hash
 from db.database import SessionLocal, LaptopItem, LaptopAssignment, User, LaptopInvoice, MaintenanceLog
 from db.crud import create_user, get_all_users, get_user_by_id, update_user, soft_delete_user, soft_delete_laptop, get_assignments_for_user
-from extractor.run_extraction import run_pipeline
+from extractor.jobs import ExtractionJobRunner
+from app.core.drive import build_drive_service
+from app.core.drive_cache import drive_listing_cache
+from app.core.drive_sync import sync_drive_folder
+from app.core.normalize import parse_date, parse_price
+from app.core.warranty import (
+    REPORT_COLUMNS, expiring_laptops, expiring_statement, get_warranty_digest, report_row, report_window, warranty_expiry,
+)
+from app.core.search import search as search_index
+from app.core.stats import fleet_stats
+from app.core.listings import LaptopFilters, UserFilters, list_laptops_page, list_users_page
+from app.core.exports import (
+    ASSET_RECORD_COLUMNS, ASSIGNMENT_HISTORY_COLUMNS, INVOICE_COLUMNS,
+    asset_record_rows, assignment_history_rows, invoice_rows, iter_rows, stream_csv, stream_xlsx,
+)
 # import sys
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -38,6 +49,13 @@ for i in range(1, 10):
     if username and password:
         USERS[username] = password  
 
+job_runner = ExtractionJobRunner()
+
+# At import, so this also runs under flask run and WSGI servers, not only the dev entry point:
+# jobs a previous process left running are marked interrupted and can be resumed
+init_db()
+mark_interrupted_extraction_jobs()
+
 
 def build_credentials(creds_dict):
     return Credentials(**creds_dict)
@@ -60,6 +78,21 @@ def load_logged_in_user():
         g.user = session['username']
 
 
+@app.before_request
+def open_db_session():
+    # One session per request; it is only connected once a query runs
+    g.db_session = SessionLocal()
+
+
+@app.teardown_request
+def close_db_session(exc):
+    db_session = g.pop('db_session', None)
+    if db_session is not None:
+        if exc is not None:
+            db_session.rollback()
+        db_session.close()
+
+
 @app.route("/")
 def index():
     return render_template("login.html")
@@ -89,6 +122,7 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    drive_listing_cache.invalidate(session.get('username', ''))
     session.pop('logged_in', None)
     session.pop('username', None)
     session.pop('credentials', None)
@@ -120,16 +154,20 @@ def oauth2callback():
     flow.fetch_token(authorization_response=request.url)
     creds = flow.credentials
     session['credentials'] = creds_to_dict(creds)
-    users = [u for u in get_all_users() if u.is_active]
     return redirect(url_for('users'))
 
 
 @app.route('/users')
 @login_required
 def users():
-
-    users = [u for u in get_all_users() if u.is_active]
-    return render_template("users.html", users=users)
+    filters = UserFilters.from_args(request.args)
+    db_session = g.db_session
+    page = list_users_page(db_session, filters, request.args.get("after"), request.args.get("limit", type=int))
+    next_url = url_for("users", format="json", after=page.next_cursor, **page.filters) if page.next_cursor else None
+    if request.args.get("format") == "json":
+        return jsonify(items=page.items, next_cursor=page.next_cursor, next_url=next_url,
+                       html=render_template("_user_rows.html", users=page.items))
+    return render_template("users.html", users=page.items, filters=filters, next_url=next_url)
 
 
 @app.route("/users/add", methods=["GET", "POST"])
@@ -141,15 +179,14 @@ def add_user():
     if request.method == "POST":
         name = request.form["name"]
         email = request.form["email"]
-        db_session = SessionLocal()
+        db_session = g.db_session
         # Duplicate email check
         exists = db_session.query(User).filter_by(email=email).first()
         if exists:
             error = "A user with this email already exists."
-            db_session.close()
             return render_template("add_user.html", error=error)
-        db_session.close()
-        create_user(name, email)
+        create_user(db_session, name, email)
+        db_session.commit()
         return redirect(url_for("users"))
     return render_template("add_user.html", error=error)
 
@@ -159,8 +196,10 @@ def add_user():
 def user_detail(user_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    user = get_user_by_id(user_id)
-    assignments = get_assignments_for_user(user_id)
+    user = g.db_session.query(User).options(
+        selectinload(User.assignments).joinedload(LaptopAssignment.laptop_item)
+    ).filter_by(id=user_id).first()
+    assignments = sorted(user.assignments, key=lambda a: a.id) if user else []
     return render_template("user_detail.html", user=user, assignments=assignments)
 
 
@@ -169,21 +208,20 @@ def user_detail(user_id):
 def edit_user(user_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    user = get_user_by_id(user_id)
+    user = g.db_session.get(User, user_id)
     error = None
     if request.method == "POST":
         name = request.form["name"]
         email = request.form["email"]
-        db_session = SessionLocal()
+        db_session = g.db_session
 
         exists = db_session.query(User).filter(
             User.email == email, User.id != user_id).first()
         if exists:
             error = "A user with this email already exists."
-            db_session.close()
             return render_template("edit_user.html", user=user, error=error)
-        db_session.close()
-        update_user(user_id, name, email)
+        update_user(db_session, user_id, name, email)
+        db_session.commit()
         return redirect(url_for("user_detail", user_id=user_id))
     return render_template("edit_user.html", user=user, error=error)
 
@@ -193,7 +231,8 @@ def edit_user(user_id):
 def delete_user_route(user_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    success = soft_delete_user(user_id)
+    if soft_delete_user(g.db_session, user_id):
+        g.db_session.commit()
     return redirect(url_for("index"))
 
 
@@ -202,19 +241,15 @@ def delete_user_route(user_id):
 def list_laptops():
     if 'credentials' not in session:
         return redirect('authorize')
-    show_unassigned = request.args.get("unassigned") == "1"
-    db_session = SessionLocal()
-    if show_unassigned:
-        # Get all laptop IDs that are currently assigned
-        assigned_ids = set([a.laptop_item_id for a in db_session.query(
-            LaptopAssignment).filter_by(unassigned_at=None).all()])
-        laptops = db_session.query(LaptopItem).filter(~LaptopItem.id.in_(
-            assigned_ids), LaptopItem.is_retired == False, LaptopItem.is_active == True).all()
-    else:
-        laptops = db_session.query(LaptopItem).filter(
-            LaptopItem.is_retired == False, LaptopItem.is_active == True).all()
-    db_session.close()
-    return render_template("laptops.html", laptops=laptops, show_unassigned=show_unassigned)
+    filters = LaptopFilters.from_args(request.args)
+    db_session = g.db_session
+    page = list_laptops_page(db_session, filters, request.args.get("after"), request.args.get("limit", type=int))
+    next_url = url_for("list_laptops", format="json", after=page.next_cursor, **page.filters) if page.next_cursor else None
+    if request.args.get("format") == "json":
+        return jsonify(items=page.items, next_cursor=page.next_cursor, next_url=next_url,
+                       html=render_template("_laptop_rows.html", laptops=page.items))
+    return render_template("laptops.html", laptops=page.items, filters=filters, next_url=next_url,
+                           show_unassigned=filters.assignee == "none")
 
 
 @app.route("/assign", methods=["GET", "POST"])
@@ -222,36 +257,27 @@ def list_laptops():
 def assign_laptop():
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     users = db_session.query(User).all()
     # Only show laptops that are not assigned and not retired
-    assigned_ids = set([a.laptop_item_id for a in db_session.query(
-        LaptopAssignment).filter_by(unassigned_at=None).all()])
-    laptops = db_session.query(LaptopItem).filter(~LaptopItem.id.in_(
-        assigned_ids), LaptopItem.is_retired == False).all()
-    db_session.close()
+    laptops = query_unassigned_laptops(db_session).all()
     error = None
     if request.method == "POST":
         user_id = int(request.form["user_id"])
         laptop_item_id = int(request.form["laptop_item_id"])
-        db_session = SessionLocal()
-        # Prevent double assignment
-        active_assignment = db_session.query(LaptopAssignment).filter_by(
-            laptop_item_id=laptop_item_id, unassigned_at=None).first()
-        if active_assignment:
+        # Prevent double assignment; current_assignments has one row per laptop, so a
+        # concurrent assignment of the same laptop fails with IntegrityError
+        already_assigned = get_current_assignment(db_session, laptop_item_id) is not None
+        if not already_assigned:
+            try:
+                open_assignment(db_session, laptop_item_id, user_id)
+            except IntegrityError:
+                db_session.rollback()
+                already_assigned = True
+        if already_assigned:
             error = "This laptop is already assigned. Please unassign it first."
-            db_session.close()
             return render_template("assign_laptop.html", users=users, laptops=laptops, error=error)
-        now = datetime.now().isoformat()
-        assignment = LaptopAssignment(
-            laptop_item_id=laptop_item_id,
-            user_id=user_id,
-            assigned_at=now,
-            unassigned_at=None
-        )
-        db_session.add(assignment)
         db_session.commit()
-        db_session.close()
         return redirect(url_for("user_detail", user_id=user_id))
     return render_template("assign_laptop.html", users=users, laptops=laptops, error=error)
 
@@ -261,14 +287,13 @@ def assign_laptop():
 def unassign_laptop_route(assignment_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     assignment = db_session.query(LaptopAssignment).filter_by(
         id=assignment_id).first()
     user_id = assignment.user_id if assignment else None
     if assignment and assignment.unassigned_at is None:
-        assignment.unassigned_at = datetime.now().isoformat()
+        close_assignment(db_session, assignment)
         db_session.commit()
-    db_session.close()
     if user_id:
         return redirect(url_for("user_detail", user_id=user_id))
     return redirect(url_for("index"))
@@ -281,7 +306,7 @@ def add_laptop():
         return redirect('authorize')
     error = None
     if request.method == "POST":
-        db_session = SessionLocal()
+        db_session = g.db_session
 
         def get_field(name):
             value = request.form.get(name)
@@ -296,7 +321,6 @@ def add_laptop():
             quantity = 1
         if not model:
             error = "Model is required."
-            db_session.close()
             return render_template("add_laptop.html", error=error)
         # Unique serial number validation (if provided and quantity==1)
         if serial and quantity == 1:
@@ -304,12 +328,12 @@ def add_laptop():
                 laptop_serial_number=serial).first()
             if exists:
                 error = "A laptop with this serial number already exists."
-                db_session.close()
                 return render_template("add_laptop.html", error=error)
         # Warranty duration: ensure integer or None
         warranty_raw = get_field("warranty_duration")
         warranty_duration = int(
             warranty_raw) if warranty_raw is not None else None
+        created_at = datetime.now()
         # Add laptops
         for i in range(quantity):
             serial_number = serial if (serial and quantity == 1) else None
@@ -327,13 +351,13 @@ def add_laptop():
                 laptop_os_version=get_field("laptop_os_version"),
                 laptop_serial_number=serial_number,
                 warranty_duration=warranty_duration,
-                laptop_price=get_field("laptop_price"),
+                laptop_price=parse_price(get_field("laptop_price")),
                 invoice_id=None,  # Manually added
-                created_at=datetime.now().isoformat()
+                created_at=created_at,
+                warranty_expiry=warranty_expiry(created_at, warranty_duration),
             )
             db_session.add(laptop)
         db_session.commit()
-        db_session.close()
         return redirect(url_for("list_laptops"))
     return render_template("add_laptop.html", error=error)
 
@@ -343,11 +367,10 @@ def add_laptop():
 def edit_laptop(laptop_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     laptop = db_session.query(LaptopItem).filter_by(id=laptop_id).first()
     error = None
     if not laptop:
-        db_session.close()
         return redirect(url_for("list_laptops"))
     if request.method == "POST":
         def get_field(name):
@@ -357,14 +380,12 @@ def edit_laptop(laptop_id):
         serial = get_field("laptop_serial_number")
         if not model or not serial:
             error = "Model and Serial Number are required."
-            db_session.close()
             return render_template("edit_laptop.html", laptop=laptop, error=error)
         # Unique serial number validation (ignore self)
         exists = db_session.query(LaptopItem).filter(
             LaptopItem.laptop_serial_number == serial, LaptopItem.id != laptop_id).first()
         if exists:
             error = "A laptop with this serial number already exists."
-            db_session.close()
             return render_template("edit_laptop.html", laptop=laptop, error=error)
         # Warranty duration: ensure integer or None
         warranty_raw = get_field("warranty_duration")
@@ -380,27 +401,30 @@ def edit_laptop(laptop_id):
         laptop.laptop_os_version = get_field("laptop_os_version")
         laptop.laptop_serial_number = serial
         laptop.warranty_duration = warranty_duration
-        laptop.laptop_price = get_field("laptop_price")
+        laptop.warranty_expiry = warranty_expiry(
+            laptop.invoice.invoice_date if laptop.invoice else laptop.created_at, warranty_duration)
+        laptop.laptop_price = parse_price(get_field("laptop_price"))
         db_session.commit()
-        db_session.close()
         return redirect(url_for("list_laptops"))
-    db_session.close()
     return render_template("edit_laptop.html", laptop=laptop, error=error)
 
 
+def load_laptop_detail(db_session, laptop_id):
+    """The laptop with its maintenance logs and assignments (and their users) in three queries."""
+    laptop = db_session.query(LaptopItem).options(
+        selectinload(LaptopItem.maintenance_logs),
+        selectinload(LaptopItem.assignments).joinedload(LaptopAssignment.user),
+    ).filter_by(id=laptop_id).first()
+    assignments = sorted(laptop.assignments, key=lambda a: a.id) if laptop else []
+    return laptop, assignments
+
+
 @app.route("/laptops/<int:laptop_id>")
 @login_required
 def laptop_detail(laptop_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
-    laptop = db_session.query(LaptopItem).options(joinedload(
-        LaptopItem.maintenance_logs)).filter_by(id=laptop_id).first()
-    assignments = []
-    if laptop:
-        assignments = db_session.query(LaptopAssignment).options(joinedload(
-            LaptopAssignment.user)).filter_by(laptop_item_id=laptop_id).all()
-    db_session.close()
+    laptop, assignments = load_laptop_detail(g.db_session, laptop_id)
     return render_template("laptop_detail.html", laptop=laptop, assignments=assignments)
 
 
@@ -409,30 +433,20 @@ def laptop_detail(laptop_id):
 def retire_laptop(laptop_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     laptop = db_session.query(LaptopItem).filter_by(id=laptop_id).first()
     # Check if currently assigned
-    active_assignment = db_session.query(LaptopAssignment).filter_by(
-        laptop_item_id=laptop_id, unassigned_at=None).first()
+    active_assignment = get_current_assignment(db_session, laptop_id)
     if active_assignment:
         user = db_session.query(User).filter_by(
             id=active_assignment.user_id).first()
-        db_session.close()
         error = f"Cannot retire: Laptop is currently assigned to {user.name} ({user.email})"
         # Re-render the laptop detail page with error
-        db_session = SessionLocal()
-        laptop = db_session.query(LaptopItem).options(joinedload(
-            LaptopItem.maintenance_logs)).filter_by(id=laptop_id).first()
-        assignments = []
-        if laptop:
-            assignments = db_session.query(LaptopAssignment).options(joinedload(
-                LaptopAssignment.user)).filter_by(laptop_item_id=laptop_id).all()
-        db_session.close()
+        laptop, assignments = load_laptop_detail(db_session, laptop_id)
         return render_template("laptop_detail.html", laptop=laptop, assignments=assignments, error=error)
     if laptop:
         laptop.is_retired = True
         db_session.commit()
-    db_session.close()
     return redirect(url_for("laptop_detail", laptop_id=laptop_id))
 
 
@@ -441,30 +455,26 @@ def retire_laptop(laptop_id):
 def add_maintenance_log(laptop_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     laptop = db_session.query(LaptopItem).filter_by(id=laptop_id).first()
     error = None
     if not laptop:
-        db_session.close()
         return redirect(url_for("list_laptops"))
     if request.method == "POST":
         description = request.form.get("description")
         performed_by = request.form.get("performed_by")
         if not description or not performed_by:
             error = "Description and Performed By are required."
-            db_session.close()
             return render_template("add_maintenance.html", laptop=laptop, error=error)
         log = MaintenanceLog(
             laptop_item_id=laptop_id,
-            date=datetime.now().isoformat(),
+            date=datetime.now(),
             description=description,
             performed_by=performed_by
         )
         db_session.add(log)
         db_session.commit()
-        db_session.close()
         return redirect(url_for("laptop_detail", laptop_id=laptop_id))
-    db_session.close()
     return render_template("add_maintenance.html", laptop=laptop, error=error)
 
 
@@ -473,83 +483,100 @@ def add_maintenance_log(laptop_id):
 def replace_device(assignment_id):
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
+    db_session = g.db_session
     assignment = db_session.query(LaptopAssignment).filter_by(
         id=assignment_id).first()
     if not assignment or assignment.unassigned_at:
-        db_session.close()
         return redirect(url_for("user_detail", user_id=assignment.user_id if assignment else 1))
     user_id = assignment.user_id
     old_laptop_id = assignment.laptop_item_id
     # Get all unassigned and not retired laptops
-    assigned_ids = set([a.laptop_item_id for a in db_session.query(
-        LaptopAssignment).filter_by(unassigned_at=None).all()])
-    unassigned_laptops = db_session.query(LaptopItem).filter(
-        ~LaptopItem.id.in_(assigned_ids), LaptopItem.is_retired == False).all()
+    unassigned_laptops = query_unassigned_laptops(db_session).all()
     error = None
     if request.method == "POST":
         new_laptop_id = int(request.form["new_laptop_id"])
-        # Unassign the old device
-        assignment.unassigned_at = datetime.now().isoformat()
-        # Assign the new device
-        new_assignment = LaptopAssignment(
-            laptop_item_id=new_laptop_id,
-            user_id=user_id,
-            assigned_at=datetime.now().isoformat(),
-            unassigned_at=None
-        )
-        db_session.add(new_assignment)
+        try:
+            # Unassign the old device and assign the new one in one transaction
+            close_assignment(db_session, assignment)
+            open_assignment(db_session, new_laptop_id, user_id)
+        except IntegrityError:
+            db_session.rollback()
+            error = "The selected laptop is already assigned."
+            assignment = db_session.query(LaptopAssignment).filter_by(id=assignment_id).first()
+            unassigned_laptops = query_unassigned_laptops(db_session).all()
+            return render_template("replace_device.html", assignment=assignment, unassigned_laptops=unassigned_laptops, error=error)
         db_session.commit()
-        db_session.close()
         return redirect(url_for("user_detail", user_id=user_id))
-    db_session.close()
     return render_template("replace_device.html", assignment=assignment, unassigned_laptops=unassigned_laptops, error=error)
 
 
+def export_response(chunks, filename, mimetype):
+    """Streams an export to the browser as a download while it is being written."""
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
+@app.route("/search")
+@login_required
+def search():
+    """Ranked prefix search over laptops, users and invoices: ?q=, optional ?kind= and ?limit=."""
+    query = request.args.get("q", "")
+    try:
+        results = search_index(g.db_session, query, request.args.get("kind"), request.args.get("limit", type=int))
+    except OperationalError:
+        app.logger.exception("Search failed")
+        return jsonify({"error": "Search is unavailable; rebuild the index with "
+                                 "python -m db.migrations --rebuild-search"}), 503
+    for result in results:
+        if result["kind"] == "laptop":
+            result["url"] = url_for("laptop_detail", laptop_id=result["id"])
+        elif result["kind"] == "user":
+            result["url"] = url_for("user_detail", user_id=result["id"])
+    return jsonify(query=query, results=results)
+
+
+@app.route("/stats")
+@login_required
+def stats():
+    """Fleet dashboard, or its numbers as JSON with ?format=json; read from the trigger-maintained fleet_counters."""
+    fleet = fleet_stats(g.db_session)
+    if request.args.get("format") == "json":
+        return jsonify(fleet)
+    return render_template("stats.html", stats=fleet)
+
+
+@app.route("/reports/warranty-expiry")
+@login_required
+def warranty_expiry_report():
+    """Laptops in service whose warranty expires in the next ?days= days (30 by default), as JSON or ?format=csv."""
+    days = request.args.get("days", 30, type=int)
+    if request.args.get("format") == "csv":
+        today, end = report_window(days)
+        rows = iter_rows(expiring_statement(today, end), lambda row: report_row(row, today))
+        return export_response(stream_csv(REPORT_COLUMNS, rows), f"warranty_expiring_{today}_{end}.csv", "text/csv")
+    return jsonify(days=days, laptops=expiring_laptops(g.db_session, days))
+
+
+@app.route("/reports/warranty-digest")
+@login_required
+def warranty_digest():
+    """The precomputed daily digest for ?date= (today by default)."""
+    day = parse_date(request.args.get("date")) if request.args.get("date") else None
+    digest = get_warranty_digest(day)
+    if not digest:
+        return jsonify({"error": "No digest for that date"}), 404
+    return jsonify(digest)
+
+
 @app.route("/download_invoices")
 @login_required
 def download_invoices():
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
-    invoices = db_session.query(LaptopInvoice).all()
-    data = []
-    # Add all laptops, including those not linked to an invoice
-    all_laptops = db_session.query(LaptopItem).all()
-    for item in all_laptops:
-        invoice = item.invoice if item.invoice_id else None
-        row = {
-            'Invoice Number': invoice.invoice_number if invoice else '',
-            'Order Date': invoice.order_date if invoice else '',
-            'Invoice Date': invoice.invoice_date if invoice else '',
-            'Order Number': invoice.order_number if invoice else '',
-            'Supplier Name': invoice.supplier_name if invoice else '',
-            'Laptop Model': item.laptop_model,
-            'Processor': item.processor,
-            'RAM': item.ram,
-            'Storage': item.storage,
-            'Color': item.model_color,
-            'Screen Size': item.screen_size,
-            'OS': item.laptop_os,
-            'OS Version': item.laptop_os_version,
-            'Serial Number': item.laptop_serial_number,
-            'Warranty Duration': item.warranty_duration,
-            'Price': item.laptop_price,
-            'Created At': item.created_at,
-            'Warranty Expiry': item.warranty_expiry,
-            'Is Retired': item.is_retired
-        }
-        data.append(row)
-    db_session.close()
-
-    # Ensure output/assets directory exists
-    output_dir = os.path.join(os.path.dirname(
-        __file__), '..', 'output', 'assets')
-    os.makedirs(output_dir, exist_ok=True)
-    file_path = os.path.join(output_dir, "laptop_invoices_download.xlsx")
-    df = pd.DataFrame(data)
-    df.to_excel(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    start, end = parse_date(request.args.get("from")), parse_date(request.args.get("to"))
+    return export_response(stream_xlsx(INVOICE_COLUMNS, invoice_rows(start=start, end=end)),
+                           "laptop_invoices_download.xlsx",
+                           "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 
 @app.route("/download_asset_records")
@@ -557,46 +584,8 @@ def download_invoices():
 def download_asset_records():
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
-    laptops = db_session.query(LaptopItem).all()
-    data = []
-    for laptop in laptops:
-        # Find active assignment
-        active_assignment = (
-            db_session.query(LaptopAssignment)
-            .filter_by(laptop_item_id=laptop.id, unassigned_at=None)
-            .first()
-        )
-        assigned_to = None
-        assigned_to_email = None
-        if active_assignment:
-            user = db_session.query(User).filter_by(
-                id=active_assignment.user_id).first()
-            if user:
-                assigned_to = user.name
-                assigned_to_email = user.email
-        row = {
-            'Laptop ID': laptop.id,
-            'Model': laptop.laptop_model,
-            'Serial Number': laptop.laptop_serial_number,
-            'Status': 'Retired/Disposed' if laptop.is_retired else 'Active',
-            'Is Retired': laptop.is_retired,
-            'Assigned': True if assigned_to else False,
-            'Assigned To': assigned_to or '',
-            'Assigned To Email': assigned_to_email or '',
-            'Created At': laptop.created_at,
-            'Warranty Expiry': laptop.warranty_expiry,
-            'Price': laptop.laptop_price
-        }
-        data.append(row)
-    db_session.close()
-    output_dir = os.path.join(os.path.dirname(
-        __file__), '..', 'output', 'assets')
-    os.makedirs(output_dir, exist_ok=True)
-    file_path = os.path.join(output_dir, "asset_records_download.csv")
-    df = pd.DataFrame(data)
-    df.to_csv(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    return export_response(stream_csv(ASSET_RECORD_COLUMNS, asset_record_rows()),
+                           "asset_records_download.csv", "text/csv")
 
 
 @app.route("/download_assignment_history")
@@ -604,33 +593,9 @@ def download_asset_records():
 def download_assignment_history():
     if 'credentials' not in session:
         return redirect('authorize')
-    db_session = SessionLocal()
-    assignments = db_session.query(LaptopAssignment).all()
-    data = []
-    for assignment in assignments:
-        laptop = db_session.query(LaptopItem).filter_by(
-            id=assignment.laptop_item_id).first()
-        user = db_session.query(User).filter_by(id=assignment.user_id).first()
-        row = {
-            'Assignment ID': assignment.id,
-            'Laptop ID': assignment.laptop_item_id,
-            'Laptop Model': laptop.laptop_model if laptop else '',
-            'Laptop Serial Number': laptop.laptop_serial_number if laptop else '',
-            'User ID': assignment.user_id,
-            'User Name': user.name if user else '',
-            'User Email': user.email if user else '',
-            'Assigned At': assignment.assigned_at,
-            'Unassigned At': assignment.unassigned_at or '',
-        }
-        data.append(row)
-    db_session.close()
-    output_dir = os.path.join(os.path.dirname(
-        __file__), '..', 'output', 'assets')
-    os.makedirs(output_dir, exist_ok=True)
-    file_path = os.path.join(output_dir, "assignment_history_download.csv")
-    df = pd.DataFrame(data).sort_values(by="Laptop ID")
-    df.to_csv(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    start, end = parse_date(request.args.get("from")), parse_date(request.args.get("to"))
+    return export_response(stream_csv(ASSIGNMENT_HISTORY_COLUMNS, assignment_history_rows(start=start, end=end)),
+                           "assignment_history_download.csv", "text/csv")
 
 
 def creds_to_dict(creds):
@@ -644,26 +609,17 @@ def creds_to_dict(creds):
     }
 
 
-def get_drive_tree(service, parent_id='root'):
+def get_drive_tree(service, parent_id='root', refresh=False):
     """
-    Recursively builds a tree of files/folders from Google Drive.
-    Returns a nested dict structure.
+    Lists one level of the Drive tree. Subfolders are loaded lazily by the
+    page through /drive_tree_children when expanded, so they are not walked here.
+    Listings come from the per-user drive_listing_cache, which also prefetches
+    the subfolders so expanding them does not wait on Drive.
     """
-    query = f"'{parent_id}' in parents and trashed = false"
-    results = service.files().list(
-        q=query, fields="files(id, name, mimeType)", pageSize=1000).execute()
-    items = results.get('files', [])
-    tree = []
-    for item in items:
-        node = {
-            'id': item['id'],
-            'name': item['name'],
-            'mimeType': item['mimeType']
-        }
-        if item['mimeType'] == 'application/vnd.google-apps.folder':
-            node['children'] = get_drive_tree(service, item['id'])
-        tree.append(node)
-    return tree
+    credentials = session['credentials']
+    items = drive_listing_cache.listing(session.get('username', ''), parent_id, service,
+                                        lambda: build_drive_service(credentials), refresh=refresh)
+    return [{'id': item['id'], 'name': item['name'], 'mimeType': item['mimeType']} for item in items]
 
 
 @app.route('/drive_tree_children/<folder_id>')
@@ -697,7 +653,7 @@ def drive_tree():
 
     creds = Credentials.from_authorized_user_info(session['credentials'])
     service = build('drive', 'v3', credentials=creds)
-    tree = get_drive_tree(service)
+    tree = get_drive_tree(service, refresh=request.args.get('refresh') == '1')
 
     def render_tree(nodes, parent_path=""):
         html = '<ul>'
@@ -721,35 +677,6 @@ def drive_tree():
     return render_template("drive_tree.html", tree_html=tree_html)
 
 
-def list_all_files_in_folder(service, folder_id):
-    """
-    Recursively list all files in a Google Drive folder by folder_id.
-    Returns a list of dicts: [{id, name, modifiedTime}]
-    """
-    files = []
-    page_token = None
-    while True:
-        response = service.files().list(
-            q=f"'{folder_id}' in parents and trashed = false",
-            fields="nextPageToken, files(id, name, mimeType, modifiedTime)",
-            pageToken=page_token
-        ).execute()
-        for file in response.get('files', []):
-            if file['mimeType'] == 'application/vnd.google-apps.folder':
-                files.extend(list_all_files_in_folder(service, file['id']))
-            else:
-                files.append({
-                    'id': file['id'],
-                    'name': file['name'],
-                    'mimeType': file['mimeType'],
-                    'modifiedTime': file.get('modifiedTime', '')
-                })
-        page_token = response.get('nextPageToken', None)
-        if not page_token:
-            break
-    return files
-
-
 def render_files_table(files):
     if not files:
         return '<p>No files found in this folder.</p>'
@@ -770,9 +697,9 @@ def confirm_folder():
     folder_id = data.get('folder_id')
     if not folder_id:
         return '<p>No folder selected.</p>', 400
-    files = list_all_files_in_folder(service, folder_id)
+    credentials = session['credentials']
     try:
-        upsert_drive_files_sqlalchemy(files)
+        files = sync_drive_folder(service, folder_id, lambda: build_drive_service(credentials)).files
     except Exception as e:
         # Log the error e.g., app.logger.error(f"Error upserting drive files: {e}")
         return f"<p>Error updating database: {e}</p>", 500
@@ -801,101 +728,38 @@ def extract_text_from_drive_folder():
     except Exception as e:
         return f"Invalid folder_id or error accessing folder: {e}", 400
 
-    all_files_in_folder = list_all_files_in_folder(service, folder_id)
-    pdf_files_found = False
-    extracted_texts_summary = []
-
-    print(f"\nStarting PDF text extraction for folder ID: {folder_id}")
-    # 1. Get current DB state for drive files
-    db_files = {f.id: f for f in SessionLocal().query(DriveFile).all()}  # id -> DriveFile
-    # 2. For each file in Drive, decide to skip, update, or add
-    for file_item in all_files_in_folder:
-        if file_item.get('mimeType') != 'application/pdf':
-            continue
-        file_id = file_item['id']
-        file_name = file_item['name']
-        file_last_edited = file_item.get('modifiedTime')
-        from datetime import datetime
-        file_last_edited_dt = None
-        if file_last_edited:
-            try:
-                if file_last_edited.endswith('Z'):
-                    file_last_edited_dt = datetime.fromisoformat(file_last_edited[:-1] + '+00:00')
-                else:
-                    file_last_edited_dt = datetime.fromisoformat(file_last_edited)
-            except Exception:
-                pass
-        db_drive_file = db_files.get(file_id)
-        if db_drive_file:
-            if db_drive_file.last_edited == file_last_edited_dt:
-                print(f"Skipping {file_name} (unchanged)")
-                continue  # Skip unchanged
-            else:
-                print(f"Updating {file_name} (timestamp changed)")
-                # Remove old laptops for this file id before reprocessing
-                db_session = SessionLocal()
-                db_session.query(LaptopItem).filter_by(drive_file_id=file_id).delete()
-                db_session.commit()
-                db_session.close()
-        else:
-            print(f"Adding new file {file_name}")
-        # Process the file (download, extract, insert/update)
-        try:
-            fh = None
-            request_file = service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request_file)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            fh.seek(0)
-            temp_pdf_path = None
-            try:
-                temp_dir = tempfile.gettempdir()
-                temp_pdf_filename = f"temp_drive_pdf_{file_id}_{os.urandom(4).hex()}.pdf"
-                temp_pdf_path = os.path.join(temp_dir, temp_pdf_filename)
-                with open(temp_pdf_path, 'wb') as f_temp:
-                    f_temp.write(fh.getvalue())
-                print(f"PDF content for {file_name} saved to temporary file: {temp_pdf_path}")
-                print(f"  Running extraction pipeline for {file_name}...")
-                po_json_data_for_db = run_pipeline(temp_pdf_path)
-                if po_json_data_for_db:
-                    insert_or_replace_laptop_invoice(po_json_data_for_db, drive_file_id=file_id)
-                    print(f"Successfully inserted/replaced Invoice data for {file_name} into database.")
-                    extracted_texts_summary.append(f"Inserted/replaced Invoices data for: {file_name}")
-                else:
-                    print(f"  Warning: No data extracted from {file_name}. Skipping database insertion for this file.")
-                    extracted_texts_summary.append(f"No data extracted from {file_name}. DB insert skipped.")
-            finally:
-                if temp_pdf_path and os.path.exists(temp_pdf_path):
-                    print(f"Deleting temporary file: {temp_pdf_path}")
-                    os.remove(temp_pdf_path)
-        except Exception as error:
-            error_message = f"Error processing file {file_name} (ID: {file_id}): {error}"
-            print(f"{error_message}\n{'-'*80}")
-            extracted_texts_summary.append(f"Error processing: {file_name} - {error}")
-        finally:
-            if fh:
-                fh.close()
-    # --- Export and Forecast steps (like main.py) ---
-    print("\n--- Exporting Data to JSON and CSV ---")
-    from extractor.export import export_all_laptop_invoices_csv, export_all_laptop_invoices_json
-    export_all_laptop_invoices_json()
-    export_all_laptop_invoices_csv()
-    print("--- Data Export Complete ---")
-
-
-    print("\nAll processes finished successfully!")
-
-    if not pdf_files_found:
-        message = f"No PDF files found in the specified folder '{folder_metadata.get('name')}' (ID: {folder_id})."
-        print(message)
-        return message
-    else:
-        response_message = f"PDF text extraction process initiated for folder '{folder_metadata.get('name')}' (ID: {folder_id}). Check your terminal for output. Summary of processed files:<br>"
-        response_message += "<br>".join(extracted_texts_summary)
-        return response_message
+    job_id = job_runner.submit(folder_id, session['credentials'], folder_metadata.get('name'))
+    if request.args.get('format') == 'json':
+        return jsonify({"job_id": job_id, "status_url": url_for('extraction_job_status', job_id=job_id)}), 202
+    return (f"PDF text extraction job {job_id} queued for folder '{folder_metadata.get('name')}' (ID: {folder_id}). "
+            f"Track progress at <a href=\"{url_for('extraction_job_status', job_id=job_id)}\">job {job_id}</a>."), 202
+
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def extraction_job_status(job_id):
+    progress = get_extraction_job_progress(job_id)
+    if not progress:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(progress)
+
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_extraction_job(job_id):
+    if not job_runner.cancel(job_id):
+        return jsonify({"error": "Job not found or already finished"}), 409
+    return jsonify(get_extraction_job_progress(job_id))
+
+
+@app.route('/jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+def resume_extraction_job(job_id):
+    if 'credentials' not in session:
+        return jsonify({"error": "Not authorized"}), 401
+    if not job_runner.resume(job_id, session['credentials']):
+        return jsonify({"error": "Only interrupted, failed or cancelled jobs can be resumed"}), 409
+    return jsonify(get_extraction_job_progress(job_id)), 202
 
 if __name__ == "__main__":
-    init_db()
     app.run(port=8000, debug=True)
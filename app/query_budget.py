@@ -0,0 +1,111 @@
+"""
+Query budgets of the web pages.
+
+    python -m app.query_budget
+
+Renders each page against a temporary database seeded at two sizes and fails
+if a page issues more SQL statements than its budget, or a different number
+at the larger size (a sign of a lazy load per row).
+"""
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime
+from typing import Dict, List, Sequence
+
+# The app binds its engine at import time, so point it at a scratch database first
+_tmp_dir = tempfile.mkdtemp(prefix="query_budget_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'budget.db')}"
+
+from sqlalchemy import delete, event, insert  # noqa: E402
+from db.migrations import rebuild_fleet_counters  # noqa: E402
+from db.database import (  # noqa: E402
+    Base, engine, init_db, CurrentAssignment, LaptopAssignment, LaptopInvoice, LaptopItem, MaintenanceLog, User,
+)
+from app.main import app  # noqa: E402
+
+# Page: (URL, maximum statements per request)
+PAGE_QUERY_BUDGETS = {
+    "user detail": ("/users/1", 2),
+    "edit user": ("/users/1/edit", 1),
+    "user list": ("/users", 1),
+    "laptop detail": ("/laptops/1", 3),
+    "edit laptop": ("/laptops/1/edit", 1),
+    "laptop list": ("/laptops", 1),
+    "maintenance form": ("/laptops/1/maintenance", 1),
+    "warranty report": ("/reports/warranty-expiry?days=3650", 1),
+    "search": ("/search?q=user", 2),
+    "fleet stats": ("/stats", 1),
+}
+
+
+def _seed(size: int) -> None:
+    """
+    Replaces the data with size users and laptops. User 1 has held every
+    laptop and laptop 1 has been held by every user and has size maintenance logs.
+    """
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+        conn.execute(insert(LaptopInvoice), [{"id": 1, "invoice_number": "INV-1"}])
+        conn.execute(insert(User), [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"}
+                                    for i in range(1, size + 1)])
+        conn.execute(insert(LaptopItem), [{"id": i, "invoice_id": 1, "laptop_model": "Laptop",
+                                           "laptop_serial_number": f"SN{i}", "laptop_price": 1000.0,
+                                           "warranty_duration": 3, "created_at": datetime(2024, 1, 1),
+                                           "warranty_expiry": date(2027, 1, 1), "is_retired": False, "is_active": True}
+                                          for i in range(1, size + 1)])
+        history = [(1, laptop) for laptop in range(2, size + 1)] + [(user, 1) for user in range(2, size + 1)]
+        conn.execute(insert(LaptopAssignment), [{"user_id": user, "laptop_item_id": laptop,
+                                                 "assigned_at": datetime(2024, 1, 1),
+                                                 "unassigned_at": datetime(2024, 6, 1)} for user, laptop in history])
+        assignment_id = conn.execute(insert(LaptopAssignment).values(
+            user_id=1, laptop_item_id=1, assigned_at=datetime(2024, 7, 1))).inserted_primary_key[0]
+        conn.execute(insert(CurrentAssignment).values(
+            laptop_item_id=1, assignment_id=assignment_id, user_id=1, assigned_at=datetime(2024, 7, 1)))
+        conn.execute(insert(MaintenanceLog), [{"laptop_item_id": 1, "date": datetime(2024, 3, 1),
+                                               "description": f"Check {i}", "performed_by": "IT"}
+                                              for i in range(size)])
+        # The deletes above ran the counter triggers in table order, so recount from scratch
+        rebuild_fleet_counters(conn)
+
+
+def count_page_queries(sizes: Sequence[int] = (3, 100)) -> Dict[str, List[int]]:
+    """Returns the number of SQL statements each page issues at each of the given sizes."""
+    init_db()
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["logged_in"] = True
+        flask_session["username"] = "budget"
+        flask_session["credentials"] = {}
+
+    counts: Dict[str, List[int]] = {name: [] for name in PAGE_QUERY_BUDGETS}
+    for size in sizes:
+        _seed(size)
+        for name, (url, _) in PAGE_QUERY_BUDGETS.items():
+            statements = []
+            listener = lambda *args: statements.append(args[2])  # noqa: E731
+            event.listen(engine, "before_cursor_execute", listener)
+            try:
+                response = client.get(url)
+            finally:
+                event.remove(engine, "before_cursor_execute", listener)
+            if response.status_code != 200:
+                raise AssertionError(f"{name} ({url}) returned {response.status_code}")
+            counts[name].append(len(statements))
+    return counts
+
+
+if __name__ == "__main__":
+    failed = False
+    try:
+        for name, counts in count_page_queries().items():
+            budget = PAGE_QUERY_BUDGETS[name][1]
+            ok = len(set(counts)) == 1 and counts[0] <= budget
+            failed = failed or not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {counts} queries for 3 and 100 rows (budget {budget})")
+    finally:
+        engine.dispose()
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
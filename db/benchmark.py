@@ -0,0 +1,93 @@
+"""
+Measures concurrent read latency and write throughput of the SQLite engine profiles.
+
+    python -m db.benchmark [--seconds 5] [--readers 4]
+
+Each profile runs against a fresh temporary database: reader threads repeat
+the laptops page query while one writer inserts laptops in small committed
+transactions, as an extraction run does.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import text
+from db.database import Base, make_engine
+
+LAPTOPS_QUERY = text("""
+    SELECT l.id, l.laptop_model, l.laptop_serial_number, i.invoice_number, i.supplier_name
+    FROM laptop_items l JOIN laptop_invoices i ON i.id = l.invoice_id
+    WHERE l.is_retired = 0 ORDER BY l.id DESC LIMIT 200
+""")
+
+
+def run_profile(profile: str, seconds: float, readers: int, seed_rows: int = 5000) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile=profile)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO laptop_invoices (id, invoice_number) VALUES (1, 'BENCH')"))
+            conn.execute(text("INSERT INTO laptop_items (invoice_id, laptop_model, laptop_serial_number, is_retired) "
+                              "VALUES (1, 'Model', :serial, 0)"), [{"serial": f"SEED{i}"} for i in range(seed_rows)])
+
+        stop = threading.Event()
+        latencies = []
+        writes = [0]
+        errors = [0]
+        lock = threading.Lock()
+
+        def reader():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(LAPTOPS_QUERY).fetchall()
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        def writer():
+            n = 0
+            while not stop.is_set():
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text("INSERT INTO laptop_items (invoice_id, laptop_model, laptop_serial_number, is_retired) "
+                                          "VALUES (1, 'Model', :serial, 0)"), [{"serial": f"W{n}-{i}"} for i in range(10)])
+                    n += 1
+                    writes[0] += 1
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "profile": profile,
+        "reads": len(latencies),
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "read_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+        "commits_per_s": round(writes[0] / seconds, 1),
+        "errors": errors[0],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+    for profile in ("default", "production"):
+        print(run_profile(profile, args.seconds, args.readers))
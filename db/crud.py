@@ -1,90 +1,166 @@
-from db.database import DriveFile, SessionLocal, LaptopInvoice, LaptopItem, User, LaptopAssignment
+from db.database import DriveFile, SessionLocal, LaptopInvoice, LaptopItem, User, LaptopAssignment, CurrentAssignment, MaintenanceLog, ExtractionJob, ExtractionJobFile, DriveSyncState, DriveSyncNode
 from typing import Dict, Any, Optional, List
 from datetime import datetime
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import joinedload
+from app.core.normalize import format_invoice_date, parse_date, parse_price
+from app.core.warranty import warranty_expiry
+
+# Rows per executemany call, well below SQLite's bound-parameter limit
+BULK_CHUNK_SIZE = 500
+
+LAPTOP_ITEM_FIELDS = {
+    "laptop_model": "Lapotop Model",
+    "processor": "Processor",
+    "ram": "RAM",
+    "storage": "Storage",
+    "model_color": "Model Color",
+    "screen_size": "Screen Size",
+    "laptop_os": "Laptop OS",
+    "laptop_os_version": "Laptop OS Version",
+    "warranty_duration": "Warranty Duration",
+    "laptop_price": "Laptop Price",
+}
+
+
+def _chunks(rows: list, size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
 
 def insert_or_replace_laptop_invoice(invoice_dict: Dict[str, Any], drive_file_id: Optional[str] = None) -> None:
+    """
+    Inserts or updates an invoice and its laptops with a constant number of statements.
+
+    Earlier laptops of the same drive file (or, without a drive file, the
+    invoice's laptops without one) are updated in place, so their assignments
+    and maintenance logs stay attached: units (Quantity expands to one row per
+    unit) with a serial number through INSERT ... ON CONFLICT on the unique
+    serial number, units without one by position, in id order. Remaining units
+    are inserted. Earlier laptops left unmatched are deleted, or marked
+    inactive if they have assignment or maintenance history, in the same
+    transaction. A serial already stored for another drive file violates the
+    unique constraint and raises IntegrityError.
+    """
     session = SessionLocal()
-    invoice_number = invoice_dict.get("Invoice Number")
-
-    # Try to find existing invoice
-    invoice = session.query(LaptopInvoice).filter_by(invoice_number=invoice_number).first()
-    if invoice:
-        # Update invoice fields
-        invoice.order_date = invoice_dict.get("Order Date")
-        invoice.invoice_date = invoice_dict.get("Invoice Date")
-        invoice.order_number = invoice_dict.get("Order Number")
-        invoice.supplier_name = invoice_dict.get("Supplier (Vendor) Name")
-    else:
-        invoice = LaptopInvoice(
-            invoice_number=invoice_dict.get("Invoice Number"),
-            order_date=invoice_dict.get("Order Date"),
-            invoice_date=invoice_dict.get("Invoice Date"),
-            order_number=invoice_dict.get("Order Number"),
-            supplier_name=invoice_dict.get("Supplier (Vendor) Name")
-        )
-        session.add(invoice)
+    try:
+        invoice_number = invoice_dict.get("Invoice Number")
+        # Dates and prices are normalized here, once; unparseable values are stored as NULL
+        order_date = parse_date(invoice_dict.get("Order Date"))
+        invoice_date = parse_date(invoice_dict.get("Invoice Date"))
+
+        # Try to find existing invoice
+        invoice = session.query(LaptopInvoice).filter_by(invoice_number=invoice_number).first()
+        if invoice:
+            # Update invoice fields
+            invoice.order_date = order_date
+            invoice.invoice_date = invoice_date
+            invoice.order_number = invoice_dict.get("Order Number")
+            invoice.supplier_name = invoice_dict.get("Supplier (Vendor) Name")
+        else:
+            invoice = LaptopInvoice(
+                invoice_number=invoice_dict.get("Invoice Number"),
+                order_date=order_date,
+                invoice_date=invoice_date,
+                order_number=invoice_dict.get("Order Number"),
+                supplier_name=invoice_dict.get("Supplier (Vendor) Name")
+            )
+            session.add(invoice)
         session.flush()  # get invoice.id
 
-    # Track serial+drive_file_id pairs in this invoices
-    seen_keys = set()
-    for item in invoice_dict.get("Laptops", []):
-        quantity = item.get("Quantity", 1)
-        serial_numbers = item.get("Laptop Serial Number")
-        if isinstance(serial_numbers, list):
-            serials = serial_numbers
-        elif serial_numbers is not None:
-            serials = [serial_numbers] * quantity
+        # One row per laptop unit
+        rows = []
+        for item in invoice_dict.get("Laptops", []):
+            quantity = item.get("Quantity", 1)
+            serial_numbers = item.get("Laptop Serial Number")
+            if isinstance(serial_numbers, list):
+                serials = serial_numbers
+            elif serial_numbers is not None:
+                serials = [serial_numbers] * quantity
+            else:
+                serials = [None] * quantity
+            values = {column: item.get(key) for column, key in LAPTOP_ITEM_FIELDS.items()}
+            values["laptop_price"] = parse_price(values["laptop_price"])
+            values["warranty_expiry"] = warranty_expiry(invoice_date, values["warranty_duration"])
+            for i in range(quantity):
+                serial = serials[i] if i < len(serials) else None
+                # Units in the invoice are in use again even if an earlier import marked them inactive
+                rows.append(dict(values, invoice_id=invoice.id, laptop_serial_number=serial or None,
+                                 drive_file_id=drive_file_id, is_active=True))
+
+        serial_rows = [row for row in rows if row["laptop_serial_number"]]
+        serialless_rows = [row for row in rows if not row["laptop_serial_number"]]
+        plain_rows = []
+        seen_serials = {row["laptop_serial_number"] for row in serial_rows}
+
+        # Resolve which serials are already stored, and for which drive file
+        owners: Dict[str, Optional[str]] = {}
+        for chunk in _chunks(sorted(seen_serials)):
+            owners.update(session.execute(
+                select(LaptopItem.laptop_serial_number, LaptopItem.drive_file_id)
+                .where(LaptopItem.laptop_serial_number.in_(chunk))
+            ).all())
+        # Serials owned by another drive file are inserted plainly so the unique constraint reports them
+        plain_rows += [row for row in serial_rows
+                       if row["laptop_serial_number"] in owners and owners[row["laptop_serial_number"]] != drive_file_id]
+        upsert_rows = [row for row in serial_rows
+                       if owners.get(row["laptop_serial_number"], drive_file_id) == drive_file_id]
+
+        serial_column = LaptopItem.laptop_serial_number
+        if drive_file_id is None:
+            scope = and_(LaptopItem.invoice_id == invoice.id, LaptopItem.drive_file_id.is_(None))
         else:
-            serials = [None] * quantity
-        for i in range(quantity):
-            serial = serials[i] if i < len(serials) else None
-            key = (serial, drive_file_id)
-            seen_keys.add(key)
-            # Deduplication logic
-            if serial:
-                existing_laptop = session.query(LaptopItem).filter_by(laptop_serial_number=serial, drive_file_id=drive_file_id).first()
-                if existing_laptop:
-                    # Update existing laptop fields
-                    existing_laptop.invoice_id = invoice.id
-                    existing_laptop.laptop_model = item.get("Lapotop Model")
-                    existing_laptop.processor = item.get("Processor")
-                    existing_laptop.ram = item.get("RAM")
-                    existing_laptop.storage = item.get("Storage")
-                    existing_laptop.model_color = item.get("Model Color")
-                    existing_laptop.screen_size = item.get("Screen Size")
-                    existing_laptop.laptop_os = item.get("Laptop OS")
-                    existing_laptop.laptop_os_version = item.get("Laptop OS Version")
-                    existing_laptop.warranty_duration = item.get("Warranty Duration")
-                    existing_laptop.laptop_price = item.get("Laptop Price")
-                    existing_laptop.drive_file_id = drive_file_id
-                    continue  # Don't add a new one
-            # Only add if not found
-            laptop_item = LaptopItem(
-                invoice_id=invoice.id,
-                laptop_model=item.get("Lapotop Model"),
-                processor=item.get("Processor"),
-                ram=item.get("RAM"),
-                storage=item.get("Storage"),
-                model_color=item.get("Model Color"),
-                screen_size=item.get("Screen Size"),
-                laptop_os=item.get("Laptop OS"),
-                laptop_os_version=item.get("Laptop OS Version"),
-                laptop_serial_number=serial,
-                warranty_duration=item.get("Warranty Duration"),
-                laptop_price=item.get("Laptop Price"),
-                drive_file_id=drive_file_id
+            # Any invoice of the drive file, in case the invoice number changed
+            scope = LaptopItem.drive_file_id == drive_file_id
+        # Earlier laptops without a serial (active ones first) take the new serial-less units in order;
+        # extra units are inserted
+        previous_serialless = session.execute(
+            select(LaptopItem.id).where(scope, serial_column.is_(None))
+            .order_by(LaptopItem.is_active.is_(False), LaptopItem.id)).scalars().all()
+        matched = [dict(row, id=laptop_id) for laptop_id, row in zip(previous_serialless, serialless_rows)]
+        plain_rows += serialless_rows[len(matched):]
+
+        # Laptops stored before this call have lower ids than the ones inserted below
+        previous_max_id = session.execute(select(func.coalesce(func.max(LaptopItem.id), 0))).scalar()
+
+        for chunk in _chunks(matched):
+            session.execute(update(LaptopItem), chunk)
+        if upsert_rows:
+            stmt = sqlite_insert(LaptopItem)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[LaptopItem.laptop_serial_number],
+                set_={column: stmt.excluded[column]
+                      for column in list(LAPTOP_ITEM_FIELDS) + ["warranty_expiry", "invoice_id", "is_active"]},
             )
-            session.add(laptop_item)
-    # Remove laptops for this invoice+drive_file_id that are not in the new data (by serial+drive_file_id)
-    if invoice.id:
-        all_laptops = session.query(LaptopItem).filter_by(invoice_id=invoice.id, drive_file_id=drive_file_id).all()
-        for l in all_laptops:
-            key = (l.laptop_serial_number, l.drive_file_id)
-            if key not in seen_keys:
-                session.delete(l)
-    session.commit()
-    session.close()
+            for chunk in _chunks(upsert_rows):
+                session.execute(stmt, chunk)
+        for chunk in _chunks(plain_rows):
+            session.execute(insert(LaptopItem), chunk)
+
+        # Earlier laptops of the drive file that nothing above matched are gone from the invoice
+        unmatched = and_(scope, LaptopItem.id <= previous_max_id,
+                         LaptopItem.id.notin_([row["id"] for row in matched]),
+                         or_(serial_column.is_(None), serial_column.notin_(seen_serials)))
+        has_history = or_(
+            select(LaptopAssignment.id).where(LaptopAssignment.laptop_item_id == LaptopItem.id).exists(),
+            select(MaintenanceLog.id).where(MaintenanceLog.laptop_item_id == LaptopItem.id).exists(),
+        )
+        session.execute(
+            update(LaptopItem).where(unmatched, has_history, LaptopItem.is_active.isnot(False))
+            .values(is_active=False).execution_options(synchronize_session=False)
+        )
+        stale_ids = select(LaptopItem.id).where(unmatched, ~has_history)
+        session.execute(delete(CurrentAssignment).where(CurrentAssignment.laptop_item_id.in_(stale_ids)))
+        session.execute(
+            delete(LaptopItem).where(LaptopItem.id.in_(stale_ids)).execution_options(synchronize_session=False)
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 def get_laptop_invoice(invoice_number: str):
     session = SessionLocal()
@@ -111,8 +187,8 @@ def get_laptop_invoice(invoice_number: str):
             })
         return {
             "Invoice Number": inv.invoice_number,
-            "Order Date": inv.order_date,
-            "Invoice Date": inv.invoice_date,
+            "Order Date": format_invoice_date(inv.order_date),
+            "Invoice Date": format_invoice_date(inv.invoice_date),
             "Order Number": inv.order_number,
             "Supplier (Vendor) Name": inv.supplier_name,
             "Laptops": laptops
@@ -120,13 +196,11 @@ def get_laptop_invoice(invoice_number: str):
     finally:
         session.close()
 
-def create_user(name: str, email: str) -> User:
-    session = SessionLocal()
+def create_user(session, name: str, email: str) -> User:
+    """Adds a user to the session, without committing."""
     user = User(name=name, email=email)
     session.add(user)
-    session.commit()
-    session.refresh(user)
-    session.close()
+    session.flush()
     return user
 
 def get_user_by_email(email: str) -> Optional[User]:
@@ -147,19 +221,15 @@ def get_all_users() -> List[User]:
     session.close()
     return users
 
-def update_user(user_id: int, name: Optional[str] = None, email: Optional[str] = None) -> Optional[User]:
-    session = SessionLocal()
-    user = session.query(User).filter_by(id=user_id).first()
+def update_user(session, user_id: int, name: Optional[str] = None, email: Optional[str] = None) -> Optional[User]:
+    """Updates a user's name and email in the session, without committing."""
+    user = session.get(User, user_id)
     if not user:
-        session.close()
         return None
     if name:
         user.name = name
     if email:
         user.email = email
-    session.commit()
-    session.refresh(user)
-    session.close()
     return user
 
 def delete_user(user_id: int) -> bool:
@@ -168,17 +238,87 @@ def delete_user(user_id: int) -> bool:
     if not user:
         session.close()
         return False
+    session.execute(delete(CurrentAssignment).where(CurrentAssignment.user_id == user_id))
     session.delete(user)
     session.commit()
     session.close()
     return True
 
-def assign_laptop_to_user(laptop_item_id: int, user_id: int, assigned_at: Optional[str] = None) -> LaptopAssignment:
-    session = SessionLocal()
+def open_assignment(session, laptop_item_id: int, user_id: int, assigned_at: Optional[datetime] = None) -> LaptopAssignment:
+    """
+    Adds an assignment and makes it the laptop's current one, without committing.
+    Flushing raises IntegrityError if the laptop already has a current holder.
+    """
     if assigned_at is None:
-        assigned_at = datetime.now().isoformat()
+        assigned_at = datetime.now()
     assignment = LaptopAssignment(laptop_item_id=laptop_item_id, user_id=user_id, assigned_at=assigned_at)
     session.add(assignment)
+    session.flush()
+    session.add(CurrentAssignment(laptop_item_id=laptop_item_id, assignment_id=assignment.id,
+                                  user_id=user_id, assigned_at=assigned_at))
+    session.flush()
+    return assignment
+
+def close_assignment(session, assignment: LaptopAssignment, unassigned_at: Optional[datetime] = None) -> None:
+    """Ends an assignment and clears the laptop's current holder, without committing."""
+    assignment.unassigned_at = unassigned_at or datetime.now()
+    session.execute(delete(CurrentAssignment).where(CurrentAssignment.assignment_id == assignment.id))
+
+def get_current_assignment(session, laptop_item_id: int) -> Optional[CurrentAssignment]:
+    return session.get(CurrentAssignment, laptop_item_id)
+
+def query_unassigned_laptops(session):
+    """Laptops in service without a current holder (an anti-join on current_assignments)."""
+    return session.query(LaptopItem)\
+        .outerjoin(CurrentAssignment, CurrentAssignment.laptop_item_id == LaptopItem.id)\
+        .filter(CurrentAssignment.laptop_item_id.is_(None), LaptopItem.is_retired == False)
+
+def rebuild_current_assignments() -> Dict[str, int]:
+    """
+    Rebuilds current_assignments from the assignment history: the latest open
+    assignment of each existing laptop is its current one, and rows of deleted
+    laptops are dropped. Returns the number of rows added, removed and updated
+    to repair the table.
+    """
+    session = SessionLocal()
+    try:
+        latest_open = select(func.max(LaptopAssignment.id))\
+            .where(LaptopAssignment.unassigned_at.is_(None),
+                   LaptopAssignment.laptop_item_id.in_(select(LaptopItem.id)))\
+            .group_by(LaptopAssignment.laptop_item_id)
+        expected = {
+            row.laptop_item_id: (row.id, row.user_id, row.assigned_at)
+            for row in session.execute(
+                select(LaptopAssignment.id, LaptopAssignment.laptop_item_id, LaptopAssignment.user_id,
+                       LaptopAssignment.assigned_at).where(LaptopAssignment.id.in_(latest_open)))
+        }
+        current = {
+            row.laptop_item_id: (row.assignment_id, row.user_id, row.assigned_at)
+            for row in session.execute(
+                select(CurrentAssignment.laptop_item_id, CurrentAssignment.assignment_id,
+                       CurrentAssignment.user_id, CurrentAssignment.assigned_at))
+        }
+        removed = [laptop_id for laptop_id in current if laptop_id not in expected]
+        added = [laptop_id for laptop_id in expected if laptop_id not in current]
+        updated = [laptop_id for laptop_id in expected if laptop_id in current and current[laptop_id] != expected[laptop_id]]
+
+        for chunk in _chunks(removed + updated):
+            session.execute(delete(CurrentAssignment).where(CurrentAssignment.laptop_item_id.in_(chunk)))
+        rows = [
+            {"laptop_item_id": laptop_id, "assignment_id": expected[laptop_id][0],
+             "user_id": expected[laptop_id][1], "assigned_at": expected[laptop_id][2]}
+            for laptop_id in added + updated
+        ]
+        for chunk in _chunks(rows):
+            session.execute(insert(CurrentAssignment), chunk)
+        session.commit()
+        return {"added": len(added), "removed": len(removed), "updated": len(updated)}
+    finally:
+        session.close()
+
+def assign_laptop_to_user(laptop_item_id: int, user_id: int, assigned_at: Optional[datetime] = None) -> LaptopAssignment:
+    session = SessionLocal()
+    assignment = open_assignment(session, laptop_item_id, user_id, assigned_at)
     session.commit()
     session.refresh(assignment)
     session.close()
@@ -204,94 +344,107 @@ def unassign_laptop(assignment_id: int) -> bool:
     if not assignment:
         session.close()
         return False
+    session.execute(delete(CurrentAssignment).where(CurrentAssignment.assignment_id == assignment_id))
     session.delete(assignment)
     session.commit()
     session.close()
     return True
 
-def soft_delete_user(user_id: int) -> bool:
-    session = SessionLocal()
-    user = session.query(User).filter_by(id=user_id).first()
+def soft_delete_user(session, user_id: int) -> bool:
+    """Marks a user inactive in the session, without committing. False if there is no active user with that ID."""
+    user = session.get(User, user_id)
     if not user or not user.is_active:
-        session.close()
         return False
     user.is_active = False
-    session.commit()
-    session.close()
     return True
 
-def soft_delete_laptop(laptop_id: int) -> bool:
-    session = SessionLocal()
-    laptop = session.query(LaptopItem).filter_by(id=laptop_id).first()
+def soft_delete_laptop(session, laptop_id: int) -> bool:
+    """Marks a laptop inactive in the session, without committing. False if there is no active laptop with that ID."""
+    laptop = session.get(LaptopItem, laptop_id)
     if not laptop or not laptop.is_active:
-        session.close()
         return False
     laptop.is_active = False
-    session.commit()
-    session.close()
-    return 
+    return True
+
+def drive_file_last_edited(modified_time: Optional[str]) -> Optional[datetime]:
+    """The drive_files.last_edited value stored for a Drive modifiedTime."""
+    last_edited_dt = _parse_drive_time(modified_time)
+    # SQLite stores DateTime without timezone; compare and store the same naive value
+    return last_edited_dt.replace(tzinfo=None) if last_edited_dt else None
+
+
+def _stage_drive_files(files_data: list[dict]) -> Dict[str, tuple]:
+    """Maps file ID to (name, last_edited) in one pass over a Drive listing."""
+    return {file_data['id']: (file_data['name'], drive_file_last_edited(file_data.get('modifiedTime')))
+            for file_data in files_data}
+
+
+def _bulk_upsert_drive_files(session, staged: Dict[str, tuple]) -> Dict[str, int]:
+    """
+    Writes staged (name, last_edited) rows with INSERT ... ON CONFLICT DO UPDATE,
+    skipping rows that are already stored unchanged.
+    """
+    existing = {}
+    for chunk in _chunks(list(staged)):
+        existing.update((row.id, (row.name, row.last_edited)) for row in session.execute(
+            select(DriveFile.id, DriveFile.name, DriveFile.last_edited).where(DriveFile.id.in_(chunk))))
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    rows = []
+    for file_id, (name, last_edited) in staged.items():
+        if file_id not in existing:
+            counts["inserted"] += 1
+        elif existing[file_id] != (name, last_edited):
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+        rows.append({"id": file_id, "name": name, "last_edited": last_edited})
+
+    if rows:
+        stmt = sqlite_insert(DriveFile)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DriveFile.id],
+            set_={"name": stmt.excluded.name, "last_edited": stmt.excluded.last_edited},
+        )
+        for chunk in _chunks(rows):
+            session.execute(stmt, chunk)
+    return counts
+
+
+def _delete_drive_files(session, file_ids: list[str]) -> int:
+    deleted = 0
+    for chunk in _chunks(list(file_ids)):
+        deleted += session.execute(
+            delete(DriveFile).where(DriveFile.id.in_(chunk)).execution_options(synchronize_session=False)
+        ).rowcount
+    return deleted
+
 
-def upsert_drive_files_sqlalchemy(files_data: list[dict]):
+def upsert_drive_files_sqlalchemy(files_data: list[dict]) -> Dict[str, int]:
     """
-    Upserts (updates or inserts) DriveFile records using SQLAlchemy.
+    Upserts (updates or inserts) DriveFile records in bulk.
     Deletes records from the DB that are not in the provided files_data list based on ID.
 
     Args:
         files_data: A list of dictionaries, where each dictionary
                     represents a file and contains 'id', 'name',
                     and 'modifiedTime' (as an ISO 8601 string).
+
+    Returns:
+        Counts of inserted, updated, unchanged and deleted rows.
     """
     session = SessionLocal()
     try:
-        # Get all current DB file IDs for efficient deletion check later
-        current_db_file_ids = {db_file.id for db_file in session.query(DriveFile.id).all()}
-        
-        processed_ids = set()
-
-        for file_data in files_data:
-            file_id = file_data['id']
-            file_name = file_data['name']
-            processed_ids.add(file_id)
-
-            try:
-                modified_time_str = file_data.get('modifiedTime')
-                # Ensure Z is handled correctly for UTC, or timezone info is present
-                if modified_time_str:
-                    if modified_time_str.endswith('Z'):
-                        last_edited_dt = datetime.fromisoformat(modified_time_str[:-1] + '+00:00')
-                    else:
-                        last_edited_dt = datetime.fromisoformat(modified_time_str)
-                else:
-                    last_edited_dt = None
-            except ValueError as ve:
-                # Log this error: print(f"ValueError parsing date for file {file_id}: {ve}")
-                last_edited_dt = None # Or handle as appropriate
-
-            existing_file = session.query(DriveFile).filter_by(id=file_id).first()
-
-            if existing_file:
-                # Update if name or modifiedTime is different
-                if existing_file.name != file_name or existing_file.last_edited != last_edited_dt:
-                    existing_file.name = file_name
-                    existing_file.last_edited = last_edited_dt
-            else:
-                # Insert new file
-                new_file = DriveFile(
-                    id=file_id,
-                    name=file_name,
-                    last_edited=last_edited_dt
-                )
-                session.add(new_file)
-
+        staged = _stage_drive_files(files_data)
+        counts = _bulk_upsert_drive_files(session, staged)
         # Delete files from DB that are not in the incoming list
-        ids_to_delete = current_db_file_ids - processed_ids
-        if ids_to_delete:
-            session.query(DriveFile).filter(DriveFile.id.in_(ids_to_delete)).delete(synchronize_session=False)
-        
+        current_db_file_ids = session.execute(select(DriveFile.id)).scalars().all()
+        counts["deleted"] = _delete_drive_files(session, [f for f in current_db_file_ids if f not in staged])
         session.commit()
-    except Exception as e:
+        return counts
+    except Exception:
         session.rollback()
-        # Consider logging the error e, e.g., logger.error(f"Error in upsert_drive_files_sqlalchemy: {e}")
         raise
     finally:
         session.close()
@@ -310,6 +463,137 @@ def get_all_drive_files():
         session.close()
 
 
+def get_imported_drive_file_versions(file_ids: list[str]) -> Dict[str, Optional[datetime]]:
+    """Maps each of the given Drive file IDs that has laptops in laptop_items to its drive_files.last_edited."""
+    session = SessionLocal()
+    try:
+        versions: Dict[str, Optional[datetime]] = {}
+        for chunk in _chunks(list(file_ids)):
+            versions.update(session.execute(
+                select(DriveFile.id, DriveFile.last_edited).where(
+                    DriveFile.id.in_(chunk),
+                    select(LaptopItem.id).where(LaptopItem.drive_file_id == DriveFile.id).exists())
+            ).all())
+        return versions
+    finally:
+        session.close()
+
+
+def _parse_drive_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1] + '+00:00')
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def apply_drive_file_changes(changed_files: list[dict], removed_ids: list[str]) -> Dict[str, int]:
+    """
+    Applies incremental sync results to the drive_files table: upserts the
+    changed files and deletes the removed ones, leaving all other rows alone.
+    """
+    session = SessionLocal()
+    try:
+        counts = _bulk_upsert_drive_files(session, _stage_drive_files(changed_files))
+        counts["deleted"] = _delete_drive_files(session, removed_ids)
+        session.commit()
+        return counts
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_drive_sync_state(folder_id: str) -> Optional[Dict[str, Any]]:
+    session = SessionLocal()
+    try:
+        state = session.query(DriveSyncState).filter_by(folder_id=folder_id).first()
+        if not state:
+            return None
+        return {"folder_id": state.folder_id, "page_token": state.page_token, "synced_at": state.synced_at}
+    finally:
+        session.close()
+
+
+def get_last_synced_folder_id() -> Optional[str]:
+    """Returns the folder most recently synced, i.e. the one drive_files mirrors."""
+    session = SessionLocal()
+    try:
+        state = session.query(DriveSyncState).order_by(DriveSyncState.synced_at.desc()).first()
+        return state.folder_id if state else None
+    finally:
+        session.close()
+
+
+def save_drive_sync_state(folder_id: str, page_token: str) -> None:
+    session = SessionLocal()
+    try:
+        state = session.query(DriveSyncState).filter_by(folder_id=folder_id).first()
+        if state:
+            state.page_token = page_token
+            state.synced_at = datetime.now()
+        else:
+            session.add(DriveSyncState(folder_id=folder_id, page_token=page_token, synced_at=datetime.now()))
+        session.commit()
+    finally:
+        session.close()
+
+
+def get_drive_sync_nodes(root_folder_id: str) -> list[dict]:
+    """Returns the stored files and folders below a synced root, in Drive listing format."""
+    session = SessionLocal()
+    try:
+        rows = session.query(DriveSyncNode).filter_by(root_folder_id=root_folder_id).all()
+        return [{'id': r.id, 'name': r.name, 'mimeType': r.mime_type, 'modifiedTime': r.modified_time,
+                 'parentId': r.parent_id} for r in rows]
+    finally:
+        session.close()
+
+
+def apply_drive_sync_node_changes(root_folder_id: str, upserts: list[dict], removed_ids: list[str],
+                                  replace: bool = False) -> None:
+    """
+    Stores changed nodes of a synced folder tree and drops removed ones.
+    With replace=True all existing nodes of the root are dropped first.
+    """
+    session = SessionLocal()
+    try:
+        query = session.query(DriveSyncNode).filter_by(root_folder_id=root_folder_id)
+        if replace:
+            query.delete(synchronize_session=False)
+        elif removed_ids:
+            query.filter(DriveSyncNode.id.in_(removed_ids)).delete(synchronize_session=False)
+        for node in upserts:
+            session.merge(DriveSyncNode(
+                root_folder_id=root_folder_id,
+                id=node['id'],
+                parent_id=node.get('parentId'),
+                name=node.get('name'),
+                mime_type=node.get('mimeType'),
+                modified_time=node.get('modifiedTime'),
+            ))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def delete_drive_sync_state(folder_id: str) -> None:
+    session = SessionLocal()
+    try:
+        session.query(DriveSyncNode).filter_by(root_folder_id=folder_id).delete(synchronize_session=False)
+        session.query(DriveSyncState).filter_by(folder_id=folder_id).delete(synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
 def delete_invoice_by_drive_file_id(file_id):
     """
     Deletes all PO-related data (purchase order, milestones, payment schedule) for a given drive file id.
@@ -324,4 +608,208 @@ def delete_invoice_by_drive_file_id(file_id):
             session.delete(po)
             session.commit()
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+
+JOB_FILE_DONE_STATUSES = ("inserted", "empty", "error", "skipped")
+
+
+def create_extraction_job(folder_id: str, folder_name: Optional[str] = None) -> int:
+    session = SessionLocal()
+    try:
+        job = ExtractionJob(folder_id=folder_id, folder_name=folder_name, status="queued",
+                            created_at=datetime.now(), cancel_requested=False)
+        session.add(job)
+        session.commit()
+        return job.id
+    finally:
+        session.close()
+
+
+def add_extraction_job_files(job_id: int, files: list[dict]) -> None:
+    """
+    Records the files a job has to process. Files already attached to the job
+    keep their status, so re-planning a resumed job does not redo finished work.
+    """
+    session = SessionLocal()
+    try:
+        existing = {
+            row.drive_file_id: row
+            for row in session.query(ExtractionJobFile).filter_by(job_id=job_id).all()
+        }
+        for f in files:
+            row = existing.get(f['id'])
+            if row is None:
+                session.add(ExtractionJobFile(
+                    job_id=job_id,
+                    drive_file_id=f['id'],
+                    file_name=f.get('name'),
+                    modified_time=f.get('modifiedTime'),
+                    status=f.get('status', 'pending'),
+                    message=f.get('message'),
+                ))
+            elif row.status not in JOB_FILE_DONE_STATUSES or row.modified_time != f.get('modifiedTime'):
+                # Unfinished, or changed on Drive since it was processed
+                row.status = f.get('status', 'pending')
+                row.message = f.get('message')
+                row.modified_time = f.get('modifiedTime')
+        session.commit()
+    finally:
+        session.close()
+
+
+def get_extracted_file_versions(file_ids: list[str]) -> Dict[str, set]:
+    """
+    Maps each Drive file ID to the modifiedTime values it has already been
+    processed at by any extraction job.
+    """
+    session = SessionLocal()
+    try:
+        versions: Dict[str, set] = {}
+        if not file_ids:
+            return versions
+        rows = session.query(ExtractionJobFile.drive_file_id, ExtractionJobFile.modified_time).filter(
+            ExtractionJobFile.drive_file_id.in_(file_ids),
+            ExtractionJobFile.status.in_(("inserted", "empty", "skipped"))
+        ).distinct().all()
+        for file_id, modified_time in rows:
+            versions.setdefault(file_id, set()).add(modified_time)
+        return versions
+    finally:
+        session.close()
+
+
+def get_pending_job_files(job_id: int) -> list[dict]:
+    session = SessionLocal()
+    try:
+        rows = session.query(ExtractionJobFile).filter(
+            ExtractionJobFile.job_id == job_id,
+            ExtractionJobFile.status.notin_(JOB_FILE_DONE_STATUSES)
+        ).order_by(ExtractionJobFile.id).all()
+        return [{'id': r.drive_file_id, 'name': r.file_name, 'modifiedTime': r.modified_time} for r in rows]
+    finally:
+        session.close()
+
+
+def update_extraction_job(job_id: int, **fields) -> None:
+    session = SessionLocal()
+    try:
+        session.query(ExtractionJob).filter_by(id=job_id).update(fields, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
+def update_extraction_job_file(job_id: int, drive_file_id: str, status: str, message: Optional[str] = None) -> None:
+    session = SessionLocal()
+    try:
+        values = {"status": status, "message": message}
+        if status == "processing":
+            values["started_at"] = datetime.now()
+        else:
+            values["finished_at"] = datetime.now()
+        session.query(ExtractionJobFile).filter_by(
+            job_id=job_id, drive_file_id=drive_file_id).update(values, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
+def request_extraction_job_cancel(job_id: int) -> bool:
+    session = SessionLocal()
+    try:
+        job = session.query(ExtractionJob).filter_by(id=job_id).first()
+        if not job or job.status in ("completed", "failed", "cancelled"):
+            return False
+        job.cancel_requested = True
+        if job.status in ("queued", "interrupted"):
+            job.status = "cancelled"
+            job.finished_at = datetime.now()
+        session.commit()
+        return True
+    finally:
+        session.close()
+
+
+def is_extraction_job_cancelled(job_id: int) -> bool:
+    session = SessionLocal()
+    try:
+        job = session.query(ExtractionJob.cancel_requested).filter_by(id=job_id).first()
+        return bool(job and job.cancel_requested)
+    finally:
+        session.close()
+
+
+def mark_interrupted_extraction_jobs() -> list[int]:
+    """
+    Flags jobs left queued or running by a previous process so they can be resumed.
+    Files that were mid-flight go back to pending.
+    """
+    session = SessionLocal()
+    try:
+        jobs = session.query(ExtractionJob).filter(ExtractionJob.status.in_(("queued", "running"))).all()
+        job_ids = [job.id for job in jobs]
+        for job in jobs:
+            job.status = "interrupted"
+        if job_ids:
+            session.query(ExtractionJobFile).filter(
+                ExtractionJobFile.job_id.in_(job_ids),
+                ExtractionJobFile.status == "processing"
+            ).update({"status": "pending"}, synchronize_session=False)
+        session.commit()
+        return job_ids
+    finally:
+        session.close()
+
+
+def get_extraction_job_progress(job_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Returns job status with per-file status, throughput (files/second since the
+    job last started) and an ETA for the remaining files.
+    """
+    session = SessionLocal()
+    try:
+        job = session.query(ExtractionJob).filter_by(id=job_id).first()
+        if not job:
+            return None
+        files = session.query(ExtractionJobFile).filter_by(job_id=job_id).order_by(ExtractionJobFile.id).all()
+        counts: Dict[str, int] = {}
+        for f in files:
+            counts[f.status] = counts.get(f.status, 0) + 1
+        done = sum(counts.get(s, 0) for s in JOB_FILE_DONE_STATUSES)
+        remaining = len(files) - done
+
+        throughput = None
+        eta_seconds = None
+        if job.started_at:
+            end = job.finished_at or datetime.now()
+            elapsed = (end - job.started_at).total_seconds()
+            finished_this_run = sum(
+                1 for f in files if f.finished_at and f.finished_at >= job.started_at and f.status in JOB_FILE_DONE_STATUSES
+            )
+            if elapsed > 0 and finished_this_run:
+                throughput = finished_this_run / elapsed
+                if job.status == "running":
+                    eta_seconds = round(remaining / throughput, 1)
+        return {
+            "id": job.id,
+            "folder_id": job.folder_id,
+            "folder_name": job.folder_name,
+            "status": job.status,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            "total_files": len(files),
+            "done_files": done,
+            "remaining_files": remaining,
+            "counts": counts,
+            "files_per_second": round(throughput, 3) if throughput else None,
+            "eta_seconds": eta_seconds,
+            "files": [
+                {"id": f.drive_file_id, "name": f.file_name, "status": f.status, "message": f.message}
+                for f in files
+            ],
+        }
+    finally:
+        session.close()
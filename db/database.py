@@ -1,12 +1,67 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, ForeignKey, Boolean, Date, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import os
 
 Base = declarative_base()
-DATABASE_URL = "sqlite:///invoices_database.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///invoices_database.db")
 
-engine = create_engine(DATABASE_URL, echo=True)
+
+def sqlite_pragmas(profile=None):
+    """
+    PRAGMAs applied to every new SQLite connection for a DB_PROFILE.
+
+    "production" (default): WAL journaling so readers are not blocked while an
+    extraction run commits, synchronous=NORMAL (durable in WAL mode except on
+    power loss), a busy timeout so concurrent writers wait instead of failing
+    with "database is locked", and larger page cache and mmap for reads.
+    Each value can be overridden with the SQLITE_* variables.
+    "default": SQLite's own settings (rollback journal, synchronous=FULL).
+    """
+    profile = profile or os.getenv("DB_PROFILE", "production")
+    if profile == "default":
+        return {}
+    return {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, i.e. 64 MiB
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "temp_store": "MEMORY",
+    }
+
+
+def make_engine(url=DATABASE_URL, profile=None):
+    """
+    Creates the engine for a DB_PROFILE. For SQLite files, connections are
+    pooled (DB_POOL_SIZE, DB_MAX_OVERFLOW) and shared across the threads of
+    the Flask server and the extraction workers. SQL echo is off unless DB_ECHO=1.
+    """
+    options = {"echo": os.getenv("DB_ECHO", "0") == "1"}
+    is_sqlite_file = url.startswith("sqlite") and ":memory:" not in url and url not in ("sqlite://", "sqlite:///")
+    if is_sqlite_file:
+        options.update(
+            connect_args={"check_same_thread": False},
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        )
+    new_engine = create_engine(url, **options)
+
+    if url.startswith("sqlite"):
+        pragmas = sqlite_pragmas(profile)
+
+        @event.listens_for(new_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine)
 
 class LaptopInvoice(Base):
@@ -14,10 +69,12 @@ class LaptopInvoice(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     invoice_number = Column(String, index=True)
-    order_date = Column(String)
-    invoice_date = Column(String)
+    order_date = Column(Date)
+    invoice_date = Column(Date, index=True)
     order_number = Column(String)
     supplier_name = Column(String)
+    # Bumped by triggers whenever the invoice or its laptops change (see migration 4); drives incremental exports
+    revision = Column(Integer, nullable=False, default=0, server_default="0", index=True)
     # Relationship to laptop items
     items = relationship("LaptopItem", cascade="all, delete-orphan", backref="invoice")
 
@@ -36,8 +93,9 @@ class LaptopItem(Base):
     laptop_serial_number = Column(String, unique=True)
     warranty_duration = Column(Integer)
     laptop_price = Column(Float)
-    created_at = Column(String, default=None)
-    warranty_expiry = Column(String, nullable=True) 
+    created_at = Column(DateTime, default=None)
+    # invoice_date + warranty_duration months, set when the laptop is written (see app.core.warranty)
+    warranty_expiry = Column(Date, nullable=True)
     is_retired = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
     drive_file_id = Column(String, ForeignKey('drive_files.id'), nullable=True)  # Link to DriveFile if imported
@@ -56,16 +114,27 @@ class LaptopAssignment(Base):
     id = Column(Integer, primary_key=True, index=True)
     laptop_item_id = Column(Integer, ForeignKey("laptop_items.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    assigned_at = Column(String)
-    unassigned_at = Column(String, nullable=True)
+    assigned_at = Column(DateTime, index=True)
+    unassigned_at = Column(DateTime, nullable=True)
 
     laptop_item = relationship("LaptopItem", backref="assignments")
 
+class CurrentAssignment(Base):
+    # Current holder of each assigned laptop: one row per open LaptopAssignment, written in the
+    # same transaction as the assignment history (see crud.open_assignment/close_assignment)
+    __tablename__ = "current_assignments"
+    laptop_item_id = Column(Integer, ForeignKey("laptop_items.id"), primary_key=True, autoincrement=False)
+    assignment_id = Column(Integer, ForeignKey("laptop_assignments.id"), unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    assigned_at = Column(DateTime)
+
+    assignment = relationship("LaptopAssignment")
+
 class MaintenanceLog(Base):
     __tablename__ = "maintenance_logs"
     id = Column(Integer, primary_key=True, index=True)
     laptop_item_id = Column(Integer, ForeignKey("laptop_items.id"))
-    date = Column(String)
+    date = Column(DateTime)
     description = Column(String)
     performed_by = Column(String)
     laptop_item = relationship("LaptopItem", backref="maintenance_logs")
@@ -76,6 +145,88 @@ class DriveFile(Base):
     name = Column(String, index=True) # Indexing name can be useful for lookups
     last_edited = Column(DateTime, nullable=True) # Using DateTime for last_edited
 
+class DriveSyncState(Base):
+    __tablename__ = "drive_sync_state"
+    folder_id = Column(String, primary_key=True)  # Root folder that was synced
+    page_token = Column(String, nullable=False)  # Drive changes page token to resume from
+    synced_at = Column(DateTime)
+
+class DriveSyncNode(Base):
+    __tablename__ = "drive_sync_nodes"
+    root_folder_id = Column(String, primary_key=True)
+    id = Column(String, primary_key=True)  # Google Drive file or folder ID
+    parent_id = Column(String, index=True)
+    name = Column(String)
+    mime_type = Column(String)
+    modified_time = Column(String, nullable=True)  # As returned by Drive (ISO 8601)
+
+class ExtractionJob(Base):
+    __tablename__ = "extraction_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    folder_id = Column(String, nullable=False)
+    folder_name = Column(String, nullable=True)
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed, cancelled, interrupted
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    error = Column(String, nullable=True)
+    files = relationship("ExtractionJobFile", cascade="all, delete-orphan", backref="job")
+
+class ExtractionJobFile(Base):
+    __tablename__ = "extraction_job_files"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("extraction_jobs.id"), index=True)
+    drive_file_id = Column(String, nullable=False)
+    file_name = Column(String)
+    modified_time = Column(String, nullable=True)
+    status = Column(String, default="pending")  # pending, processing, inserted, empty, error, skipped, cancelled
+    message = Column(String, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class ExtractionCacheEntry(Base):
+    __tablename__ = "extraction_cache"
+    key = Column(String, primary_key=True)  # "pdf:<sha256>" or "text:<sha256>"
+    payload = Column(String, nullable=False)  # Parsed invoice JSON
+    size = Column(Integer, nullable=False)
+    fingerprint = Column(String, index=True)  # Model + prompt that produced the payload
+    created_at = Column(DateTime)
+    last_accessed = Column(DateTime, index=True)
+    hits = Column(Integer, default=0)
+
+class ExportFragment(Base):
+    __tablename__ = "export_fragments"
+    invoice_id = Column(Integer, primary_key=True, autoincrement=False)
+    revision = Column(Integer, nullable=False)  # Invoice revision the fragment was rendered from
+    json_fragment = Column(String, nullable=False)  # Invoice with its laptops, as one element of the JSON export
+    csv_fragment = Column(String, nullable=False)  # CSV rows of its laptops, without header
+
+class ExportState(Base):
+    __tablename__ = "export_state"
+    name = Column(String, primary_key=True)
+    # Highest invoice revision rendered into fragments; for the "invoice_revision" row, the last revision handed out
+    watermark = Column(Integer, nullable=False, default=0)
+    exported_at = Column(DateTime)
+
+class WarrantyDigest(Base):
+    __tablename__ = "warranty_digests"
+    digest_date = Column(Date, primary_key=True)
+    generated_at = Column(DateTime)
+    payload = Column(String, nullable=False)  # JSON: counts per window and the laptops expiring
+
+class FleetCounter(Base):
+    # Laptop counts and spend per dimension value, maintained by triggers (see migration 9)
+    __tablename__ = "fleet_counters"
+    dimension = Column(String, primary_key=True)  # model, status, supplier, month or warranty
+    key = Column(String, primary_key=True)  # "" when the laptop has no value for the dimension
+    laptops = Column(Integer, nullable=False, default=0)
+    spend = Column(Float, nullable=False, default=0)
+
 def init_db():
-    if not os.path.exists("invoices_database.db"):
-        Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    # create_all only creates missing tables, so it is safe on an existing database;
+    # columns and indexes added later come from the versioned migrations
+    from db.migrations import apply_migrations
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
\ No newline at end of file
@@ -0,0 +1,553 @@
+"""
+Versioned schema migrations, applied automatically by init_db().
+
+    python -m db.migrations          # apply pending migrations
+    python -m db.migrations --check  # also verify the hot queries use their indexes
+    python -m db.migrations --repair-assignments  # rebuild current_assignments from history
+    python -m db.migrations --rebuild-search      # recreate and refill the full-text search index
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Migrations must be idempotent (IF NOT EXISTS, column
+checks) so databases created by create_all, which already has the latest
+tables but no migration history, are handled too.
+"""
+import argparse
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import Date, DateTime, Float, bindparam, text
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+
+def _columns(conn, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+
+
+def _add_missing_columns(conn) -> None:
+    # Columns added to the models after the first releases; these used to be added by hand
+    for table, column, ddl in (
+        ("laptop_items", "is_active", "BOOLEAN DEFAULT 1"),
+        ("laptop_items", "drive_file_id", "VARCHAR REFERENCES drive_files (id)"),
+        ("users", "is_active", "BOOLEAN DEFAULT 1"),
+    ):
+        if column not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+HOT_PATH_INDEXES = [
+    # Active assignment of a laptop, and the unassigned-laptop lists (partial: open assignments only)
+    "CREATE INDEX IF NOT EXISTS ix_laptop_assignments_active ON laptop_assignments (laptop_item_id) "
+    "WHERE unassigned_at IS NULL",
+    # Assignment history of a laptop
+    "CREATE INDEX IF NOT EXISTS ix_laptop_assignments_laptop_item_id ON laptop_assignments (laptop_item_id)",
+    # Assignments of a user
+    "CREATE INDEX IF NOT EXISTS ix_laptop_assignments_user_id ON laptop_assignments (user_id, unassigned_at)",
+    # Laptops of an invoice and drive file (invoice persistence), and of a drive file (re-extraction)
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_invoice_file ON laptop_items (invoice_id, drive_file_id)",
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_drive_file_id ON laptop_items (drive_file_id)",
+    # Laptops in service (partial: not retired and active)
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_in_service ON laptop_items (id) "
+    "WHERE is_retired = 0 AND is_active = 1",
+    "CREATE INDEX IF NOT EXISTS ix_maintenance_logs_laptop_item_id ON maintenance_logs (laptop_item_id)",
+    # Extraction history of a drive file (skipping unchanged PDFs)
+    "CREATE INDEX IF NOT EXISTS ix_extraction_job_files_file ON extraction_job_files (drive_file_id, status)",
+]
+
+
+def _add_hot_path_indexes(conn) -> None:
+    for statement in HOT_PATH_INDEXES:
+        conn.execute(text(statement))
+
+
+def _populate_current_assignments(conn) -> None:
+    # The table itself comes from create_all; fill it from the open assignments (latest per laptop)
+    conn.execute(text(
+        "INSERT OR IGNORE INTO current_assignments (laptop_item_id, assignment_id, user_id, assigned_at) "
+        "SELECT laptop_item_id, id, user_id, assigned_at FROM laptop_assignments "
+        "WHERE id IN (SELECT MAX(id) FROM laptop_assignments WHERE unassigned_at IS NULL GROUP BY laptop_item_id)"
+    ))
+
+
+# Columns of laptop_items that appear in the invoice exports
+EXPORTED_LAPTOP_COLUMNS = (
+    "invoice_id, laptop_model, processor, ram, storage, model_color, screen_size, laptop_os, "
+    "laptop_os_version, laptop_serial_number, warranty_duration, laptop_price"
+)
+# Revisions come from a counter row in export_state that only goes up. MAX(revision) + 1 would hand
+# out a revision at or below the export watermark again after the newest invoice is deleted.
+REVISION_COUNTER = "invoice_revision"
+_SEED_REVISION = (f"(SELECT MAX(COALESCE((SELECT MAX(revision) FROM laptop_invoices), 0), "
+                  f"COALESCE((SELECT MAX(watermark) FROM export_state WHERE name != '{REVISION_COUNTER}'), 0)))")
+
+
+def _bump_revision(where: str) -> str:
+    return (f"INSERT INTO export_state (name, watermark) VALUES ('{REVISION_COUNTER}', {_SEED_REVISION} + 1) "
+            "ON CONFLICT (name) DO UPDATE SET watermark = watermark + 1; "
+            f"UPDATE laptop_invoices SET revision = (SELECT watermark FROM export_state "
+            f"WHERE name = '{REVISION_COUNTER}') WHERE {where};")
+
+
+INVOICE_REVISION_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS tr_laptop_invoices_insert_revision AFTER INSERT ON laptop_invoices BEGIN "
+    f"{_bump_revision('id = NEW.id')} END",
+    "CREATE TRIGGER IF NOT EXISTS tr_laptop_invoices_update_revision AFTER UPDATE OF "
+    "invoice_number, order_date, invoice_date, order_number, supplier_name ON laptop_invoices BEGIN "
+    f"{_bump_revision('id = NEW.id')} END",
+    "CREATE TRIGGER IF NOT EXISTS tr_laptop_items_insert_revision AFTER INSERT ON laptop_items "
+    "WHEN NEW.invoice_id IS NOT NULL BEGIN "
+    f"{_bump_revision('id = NEW.invoice_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS tr_laptop_items_update_revision AFTER UPDATE OF {EXPORTED_LAPTOP_COLUMNS} "
+    "ON laptop_items BEGIN "
+    f"{_bump_revision('id IN (OLD.invoice_id, NEW.invoice_id)')} END",
+    "CREATE TRIGGER IF NOT EXISTS tr_laptop_items_delete_revision AFTER DELETE ON laptop_items "
+    "WHEN OLD.invoice_id IS NOT NULL BEGIN "
+    f"{_bump_revision('id = OLD.invoice_id')} END",
+]
+
+
+def _add_invoice_revisions(conn) -> None:
+    # Every write is serialized by SQLite and the counter never goes back, so revisions
+    # increase in commit order and "revision > watermark" finds every invoice changed since an export
+    if "revision" not in _columns(conn, "laptop_invoices"):
+        conn.execute(text("ALTER TABLE laptop_invoices ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_laptop_invoices_revision ON laptop_invoices (revision)"))
+    conn.execute(text("UPDATE laptop_invoices SET revision = id WHERE revision = 0"))
+    for statement in INVOICE_REVISION_TRIGGERS:
+        conn.execute(text(statement))
+
+
+def _monotonic_invoice_revisions(conn) -> None:
+    # Revision triggers of migration 4 used MAX(revision) + 1; replace them with the counter-based ones
+    conn.execute(text(
+        f"INSERT OR IGNORE INTO export_state (name, watermark) VALUES ('{REVISION_COUNTER}', {_SEED_REVISION})"
+    ))
+    for statement in INVOICE_REVISION_TRIGGERS:
+        name = statement.split("IF NOT EXISTS ", 1)[1].split(" ", 1)[0]
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(statement))
+
+
+# Sort orders of the paginated /laptops and /users listings (keyset pagination on (column, id))
+LISTING_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_model_id ON laptop_items (laptop_model, id)",
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_warranty_id ON laptop_items (warranty_expiry, id)",
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_created_id ON laptop_items (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_laptop_items_price_id ON laptop_items (laptop_price, id)",
+    "CREATE INDEX IF NOT EXISTS ix_users_name_id ON users (name, id)",
+]
+
+
+def _add_listing_indexes(conn) -> None:
+    for statement in LISTING_INDEXES:
+        conn.execute(text(statement))
+
+
+def _backfill_warranty_expiry(conn) -> None:
+    # warranty_expiry was free-form text that nothing filled in; store it as an ISO date computed
+    # like at ingest, keep hand-entered values that parse as dates and clear the rest
+    from app.core.warranty import parse_date, warranty_expiry
+
+    rows = conn.execute(text(
+        "SELECT laptop_items.id, laptop_items.warranty_duration, laptop_items.warranty_expiry, "
+        "laptop_items.created_at, laptop_invoices.invoice_date FROM laptop_items "
+        "LEFT OUTER JOIN laptop_invoices ON laptop_invoices.id = laptop_items.invoice_id"
+    )).all()
+    updates = []
+    for laptop_id, months, stored, created_at, invoice_date in rows:
+        expiry = warranty_expiry(invoice_date or created_at, months) or parse_date(stored)
+        value = expiry.isoformat() if expiry else None
+        if value != stored:
+            updates.append({"id": laptop_id, "expiry": value})
+    if updates:
+        conn.execute(text("UPDATE laptop_items SET warranty_expiry = :expiry WHERE id = :id"), updates)
+
+
+# Columns that held date strings (ISO from datetime.now().isoformat(), DD-MM-YYYY from the
+# extractors) or prices as extracted, with their type and parser
+TYPED_COLUMNS = [
+    ("laptop_invoices", "order_date", Date, "parse_date"),
+    ("laptop_invoices", "invoice_date", Date, "parse_date"),
+    ("laptop_items", "created_at", DateTime, "parse_datetime"),
+    ("laptop_items", "laptop_price", Float, "parse_price"),
+    ("laptop_assignments", "assigned_at", DateTime, "parse_datetime"),
+    ("laptop_assignments", "unassigned_at", DateTime, "parse_datetime"),
+    ("current_assignments", "assigned_at", DateTime, "parse_datetime"),
+    ("maintenance_logs", "date", DateTime, "parse_datetime"),
+]
+TYPED_COLUMN_INDEXES = [
+    # Date-range filters of the invoice and assignment history downloads
+    "CREATE INDEX IF NOT EXISTS ix_laptop_invoices_invoice_date ON laptop_invoices (invoice_date)",
+    "CREATE INDEX IF NOT EXISTS ix_laptop_assignments_assigned_at ON laptop_assignments (assigned_at)",
+]
+
+
+def _convert_typed_columns(conn) -> None:
+    # SQLite keeps the declared column types, so only the values are rewritten, into the
+    # formats SQLAlchemy's Date and DateTime types store (which sort correctly as text);
+    # values that cannot be parsed become NULL
+    from app.core import normalize
+
+    for table, column, column_type, parser in TYPED_COLUMNS:
+        parse = getattr(normalize, parser)
+        rows = conn.execute(text(f"SELECT rowid, {column} FROM {table} WHERE {column} IS NOT NULL")).all()
+        if rows:
+            update = text(f"UPDATE {table} SET {column} = :value WHERE rowid = :id")\
+                .bindparams(bindparam("value", type_=column_type()))
+            conn.execute(update, [{"id": row_id, "value": parse(value)} for row_id, value in rows])
+    for statement in TYPED_COLUMN_INDEXES:
+        conn.execute(text(statement))
+
+
+# Full-text search over laptops, users and invoices (see app.core.search). Each source row is
+# one search_index row with rowid = id * SEARCH_ROWID_STRIDE + kind, so triggers can find it by rowid
+SEARCH_ROWID_STRIDE = 4
+SEARCH_SOURCES = {
+    # kind: (number, table, (name, code, detail) columns, rows indexed)
+    "laptop": (1, "laptop_items", ("laptop_model", "laptop_serial_number", "processor"), "is_active IS NOT 0"),
+    "user": (2, "users", ("name", "email", None), "is_active IS NOT 0"),
+    "invoice": (3, "laptop_invoices", ("supplier_name", "invoice_number", None), None),
+}
+# Matches in the code column (serial number, email, invoice number) rank highest
+SEARCH_RANK = "bm25(3.0, 5.0, 1.0)"
+
+
+def _search_insert(row: str, number: int, table: str, columns, condition) -> str:
+    values = ", ".join(f"{row}.{column}" if column else "NULL" for column in columns)
+    source = f" FROM {table}" if row == table else ""  # NEW in triggers, the whole table when refilling
+    where = f" WHERE {row}.{condition}" if condition else ""
+    return (f"INSERT INTO search_index (rowid, name, code, detail) "
+            f"SELECT {row}.id * {SEARCH_ROWID_STRIDE} + {number}, {values}{source}{where}")
+
+
+def _search_triggers() -> List[str]:
+    statements = []
+    for number, table, columns, condition in SEARCH_SOURCES.values():
+        watched = [column for column in columns if column] + (["is_active"] if condition else [])
+        delete_old = f"DELETE FROM search_index WHERE rowid = OLD.id * {SEARCH_ROWID_STRIDE} + {number}"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS tr_{table}_insert_search AFTER INSERT ON {table} BEGIN "
+            f"{_search_insert('NEW', number, table, columns, condition)}; END",
+            f"CREATE TRIGGER IF NOT EXISTS tr_{table}_update_search AFTER UPDATE OF {', '.join(watched)} "
+            f"ON {table} BEGIN {delete_old}; {_search_insert('NEW', number, table, columns, condition)}; END",
+            f"CREATE TRIGGER IF NOT EXISTS tr_{table}_delete_search AFTER DELETE ON {table} BEGIN {delete_old}; END",
+        ]
+    return statements
+
+
+def fts5_available(conn) -> bool:
+    return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+
+def rebuild_search_index(conn) -> None:
+    """Creates the search index and its triggers if missing, and refills it from the source tables."""
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "name, code, detail, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text(f"INSERT INTO search_index (search_index, rank) VALUES ('rank', '{SEARCH_RANK}')"))
+    for statement in _search_triggers():
+        conn.execute(text(statement))
+    conn.execute(text("DELETE FROM search_index"))
+    for number, table, columns, condition in SEARCH_SOURCES.values():
+        conn.execute(text(_search_insert(table, number, table, columns, condition)))
+    conn.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+
+
+def _create_search_index(conn) -> None:
+    if not fts5_available(conn):
+        logger.warning("This SQLite build has no FTS5; search is disabled. "
+                       "Run python -m db.migrations --rebuild-search on one that has it.")
+        return
+    rebuild_search_index(conn)
+
+
+# Dashboard aggregates (see app.core.stats). Each laptop in use (is_active) adds 1 and its price
+# to one fleet_counters row per dimension; the key expressions take the laptop row as {r} and its
+# invoice's supplier and date as {supplier} and {invoice_date}
+FLEET_DIMENSIONS = {
+    "model": ("COALESCE({r}.laptop_model, '')", None),
+    "status": ("CASE WHEN {r}.is_retired THEN 'retired' WHEN EXISTS (SELECT 1 FROM current_assignments "
+               "WHERE laptop_item_id = {r}.id) THEN 'assigned' ELSE 'unassigned' END", None),
+    "supplier": ("COALESCE({supplier}, '')", None),
+    # Month of purchase: the invoice date, or when the laptop was added by hand
+    "month": ("COALESCE(substr({invoice_date}, 1, 7), substr({r}.created_at, 1, 7), '')", None),
+    # Warranty expiry date of laptops in service; summed into buckets when read
+    "warranty": ("COALESCE({r}.warranty_expiry, '')", "NOT COALESCE({r}.is_retired, 0)"),
+}
+_ADD_TO_COUNTERS = ("ON CONFLICT (dimension, key) DO UPDATE SET "
+                    "laptops = laptops + excluded.laptops, spend = spend + excluded.spend")
+
+
+def _fleet_keys(r: str, supplier: Optional[str] = None, invoice_date: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    values = {
+        "r": r,
+        "supplier": supplier or f"(SELECT supplier_name FROM laptop_invoices WHERE id = {r}.invoice_id)",
+        "invoice_date": invoice_date or f"(SELECT invoice_date FROM laptop_invoices WHERE id = {r}.invoice_id)",
+    }
+    return {dimension: (key.format(**values), (condition or "1").format(**values))
+            for dimension, (key, condition) in FLEET_DIMENSIONS.items()}
+
+
+def fleet_counter_query(dimension: str) -> str:
+    """(dimension, key, laptops, spend) rows of a dimension, grouped from laptop_items."""
+    key, condition = _fleet_keys("r")[dimension]
+    return (f"SELECT '{dimension}', {key}, COUNT(*), SUM(COALESCE(r.laptop_price, 0)) FROM laptop_items AS r "
+            f"WHERE r.is_active IS NOT 0 AND {condition} GROUP BY 2")
+
+
+def _count_laptop(row: str, sign: int) -> str:
+    """Adds (sign 1) or removes (sign -1) the NEW or OLD laptop row from every dimension."""
+    keys = " UNION ALL ".join(f"SELECT '{dimension}' AS dimension, {key} AS key WHERE {condition}"
+                              for dimension, (key, condition) in _fleet_keys(row).items())
+    return (f"INSERT INTO fleet_counters (dimension, key, laptops, spend) "
+            f"SELECT dimension, key, {sign}, {sign} * COALESCE({row}.laptop_price, 0) FROM ({keys}) "
+            f"WHERE {row}.is_active IS NOT 0 {_ADD_TO_COUNTERS}")
+
+
+def _move_status(laptop_id: str, from_status: str, to_status: str) -> str:
+    return (f"INSERT INTO fleet_counters (dimension, key, laptops, spend) "
+            f"SELECT 'status', status, delta, delta * COALESCE(r.laptop_price, 0) FROM laptop_items AS r, "
+            f"(SELECT '{from_status}' AS status, -1 AS delta UNION ALL SELECT '{to_status}', 1) "
+            f"WHERE r.id = {laptop_id} AND r.is_active IS NOT 0 AND NOT COALESCE(r.is_retired, 0) {_ADD_TO_COUNTERS}")
+
+
+def _count_invoice_laptops(invoice_id: str, supplier: str, invoice_date: str, sign: int) -> List[str]:
+    """Adds or removes an invoice's laptops from the supplier and month dimensions, for given invoice values."""
+    keys = _fleet_keys("r", supplier, invoice_date)
+    return [
+        f"INSERT INTO fleet_counters (dimension, key, laptops, spend) "
+        f"SELECT '{dimension}', {keys[dimension][0]}, {sign} * COUNT(*), {sign} * SUM(COALESCE(r.laptop_price, 0)) "
+        f"FROM laptop_items AS r WHERE r.invoice_id = {invoice_id} AND r.is_active IS NOT 0 GROUP BY 2 "
+        f"{_ADD_TO_COUNTERS}"
+        for dimension in ("supplier", "month")
+    ]
+
+
+def _fleet_triggers() -> List[str]:
+    laptop_columns = "laptop_model, laptop_price, invoice_id, created_at, warranty_expiry, is_retired, is_active"
+    renamed = (_count_invoice_laptops("OLD.id", "OLD.supplier_name", "OLD.invoice_date", -1)
+               + _count_invoice_laptops("NEW.id", "NEW.supplier_name", "NEW.invoice_date", 1))
+    # Laptops left behind by a deleted invoice count as having no invoice
+    orphaned = (_count_invoice_laptops("OLD.id", "OLD.supplier_name", "OLD.invoice_date", -1)
+                + _count_invoice_laptops("OLD.id", "NULL", "NULL", 1))
+    return [
+        "CREATE TRIGGER IF NOT EXISTS tr_laptop_items_insert_fleet AFTER INSERT ON laptop_items BEGIN "
+        f"{_count_laptop('NEW', 1)}; END",
+        f"CREATE TRIGGER IF NOT EXISTS tr_laptop_items_update_fleet AFTER UPDATE OF {laptop_columns} "
+        f"ON laptop_items BEGIN {_count_laptop('OLD', -1)}; {_count_laptop('NEW', 1)}; END",
+        "CREATE TRIGGER IF NOT EXISTS tr_laptop_items_delete_fleet AFTER DELETE ON laptop_items BEGIN "
+        f"{_count_laptop('OLD', -1)}; END",
+        "CREATE TRIGGER IF NOT EXISTS tr_current_assignments_insert_fleet AFTER INSERT ON current_assignments BEGIN "
+        f"{_move_status('NEW.laptop_item_id', 'unassigned', 'assigned')}; END",
+        "CREATE TRIGGER IF NOT EXISTS tr_current_assignments_delete_fleet AFTER DELETE ON current_assignments BEGIN "
+        f"{_move_status('OLD.laptop_item_id', 'assigned', 'unassigned')}; END",
+        "CREATE TRIGGER IF NOT EXISTS tr_laptop_invoices_update_fleet AFTER UPDATE OF supplier_name, invoice_date "
+        f"ON laptop_invoices BEGIN {'; '.join(renamed)}; END",
+        "CREATE TRIGGER IF NOT EXISTS tr_laptop_invoices_delete_fleet AFTER DELETE ON laptop_invoices BEGIN "
+        f"{'; '.join(orphaned)}; END",
+    ]
+
+
+def rebuild_fleet_counters(conn) -> None:
+    """Creates the fleet counter triggers if missing and recomputes the counters from laptop_items."""
+    for statement in _fleet_triggers():
+        conn.execute(text(statement))
+    conn.execute(text("DELETE FROM fleet_counters"))
+    for dimension in FLEET_DIMENSIONS:
+        conn.execute(text(
+            f"INSERT INTO fleet_counters (dimension, key, laptops, spend) {fleet_counter_query(dimension)}"
+        ))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "add_missing_columns", _add_missing_columns),
+    (2, "hot_path_indexes", _add_hot_path_indexes),
+    (3, "populate_current_assignments", _populate_current_assignments),
+    (4, "invoice_revisions", _add_invoice_revisions),
+    (5, "listing_indexes", _add_listing_indexes),
+    (6, "warranty_expiry_dates", _backfill_warranty_expiry),
+    (7, "typed_columns", _convert_typed_columns),
+    (8, "search_index", _create_search_index),
+    (9, "fleet_counters", rebuild_fleet_counters),
+    (10, "monotonic_invoice_revisions", _monotonic_invoice_revisions),
+]
+
+
+def applied_versions(engine) -> List[int]:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)"
+        ))
+        return [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def apply_migrations(engine) -> List[int]:
+    """Applies pending migrations in version order. Returns the versions applied."""
+    done = set(applied_versions(engine))
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT OR IGNORE INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.now().isoformat()},
+            )
+        logger.info(f"Applied schema migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+# Hot queries (as the app issues them) and the index each must use
+HOT_QUERIES: Dict[str, Tuple[str, str]] = {
+    "active assignments": (
+        "SELECT laptop_item_id FROM laptop_assignments WHERE unassigned_at IS NULL",
+        "ix_laptop_assignments_active",
+    ),
+    "active assignment of a laptop": (
+        "SELECT * FROM laptop_assignments WHERE laptop_item_id = 1 AND unassigned_at IS NULL",
+        "ix_laptop_assignments_active",
+    ),
+    "unassigned laptops": (
+        "SELECT laptop_items.* FROM laptop_items LEFT OUTER JOIN current_assignments "
+        "ON current_assignments.laptop_item_id = laptop_items.id "
+        "WHERE current_assignments.laptop_item_id IS NULL AND laptop_items.is_retired = 0",
+        "current_assignments USING INTEGER PRIMARY KEY",
+    ),
+    "current holder of a laptop": (
+        "SELECT * FROM current_assignments WHERE laptop_item_id = 1",
+        "current_assignments USING INTEGER PRIMARY KEY",
+    ),
+    "invoices changed since an export": (
+        "SELECT * FROM laptop_invoices WHERE revision > 1",
+        "ix_laptop_invoices_revision",
+    ),
+    "laptop page by model": (
+        "SELECT laptop_items.id FROM laptop_items LEFT OUTER JOIN current_assignments "
+        "ON current_assignments.laptop_item_id = laptop_items.id "
+        "WHERE laptop_items.is_active = 1 AND laptop_items.is_retired = 0 "
+        "AND (laptop_items.laptop_model > 'x' OR (laptop_items.laptop_model = 'x' AND laptop_items.id > 1)) "
+        "ORDER BY laptop_items.laptop_model, laptop_items.id LIMIT 51",
+        "ix_laptop_items_model_id",
+    ),
+    "laptop page by warranty": (
+        "SELECT laptop_items.id FROM laptop_items WHERE laptop_items.is_active = 1 "
+        "ORDER BY laptop_items.warranty_expiry DESC, laptop_items.id DESC LIMIT 51",
+        "ix_laptop_items_warranty_id",
+    ),
+    "laptops expiring in a window": (
+        "SELECT laptop_items.id FROM laptop_items "
+        "LEFT OUTER JOIN current_assignments ON current_assignments.laptop_item_id = laptop_items.id "
+        "WHERE laptop_items.warranty_expiry >= '2025-01-01' AND laptop_items.warranty_expiry <= '2025-01-31' "
+        "AND laptop_items.is_active = 1 AND laptop_items.is_retired = 0 "
+        "ORDER BY laptop_items.warranty_expiry, laptop_items.id",
+        "ix_laptop_items_warranty_id (warranty_expiry>? AND warranty_expiry<?)",
+    ),
+    "invoices in a date range": (
+        "SELECT laptop_items.id FROM laptop_items "
+        "LEFT OUTER JOIN laptop_invoices ON laptop_invoices.id = laptop_items.invoice_id "
+        "WHERE laptop_invoices.invoice_date >= '2025-01-01' AND laptop_invoices.invoice_date <= '2025-01-31' "
+        "ORDER BY laptop_items.id",
+        "ix_laptop_invoices_invoice_date (invoice_date>? AND invoice_date<?)",
+    ),
+    "assignments in a date range": (
+        "SELECT laptop_assignments.id FROM laptop_assignments "
+        "WHERE laptop_assignments.assigned_at >= '2025-01-01 00:00:00.000000' "
+        "AND laptop_assignments.assigned_at < '2025-02-01 00:00:00.000000' "
+        "ORDER BY laptop_assignments.laptop_item_id, laptop_assignments.id",
+        "ix_laptop_assignments_assigned_at (assigned_at>? AND assigned_at<?)",
+    ),
+    "search": (
+        # ":M" in the plan means the FTS5 index answers the MATCH; a full scan shows no M
+        "SELECT rowid, name, code, detail FROM search_index WHERE search_index MATCH '\"mac\"*' "
+        "ORDER BY rank LIMIT 20",
+        ":M",
+    ),
+    "user page by name": (
+        "SELECT id, name, email FROM users WHERE is_active = 1 ORDER BY name, id LIMIT 51",
+        "ix_users_name_id",
+    ),
+    "assignments of a laptop": (
+        "SELECT * FROM laptop_assignments WHERE laptop_item_id = 1",
+        "ix_laptop_assignments_laptop_item_id",
+    ),
+    "assignments of a user": (
+        "SELECT * FROM laptop_assignments WHERE user_id = 1",
+        "ix_laptop_assignments_user_id",
+    ),
+    "laptops in service": (
+        "SELECT * FROM laptop_items WHERE is_retired = 0 AND is_active = 1",
+        "ix_laptop_items_in_service",
+    ),
+    "laptops of an invoice file": (
+        "SELECT id FROM laptop_items WHERE invoice_id = 1 AND drive_file_id = 'x'",
+        "ix_laptop_items_invoice_file",
+    ),
+    "laptops of a drive file": (
+        "DELETE FROM laptop_items WHERE drive_file_id IN ('x', 'y')",
+        "ix_laptop_items_drive_file_id",
+    ),
+    "maintenance logs of a laptop": (
+        "SELECT * FROM maintenance_logs WHERE laptop_item_id = 1",
+        "ix_maintenance_logs_laptop_item_id",
+    ),
+    "extraction history of files": (
+        "SELECT drive_file_id, modified_time FROM extraction_job_files "
+        "WHERE drive_file_id IN ('x', 'y') AND status IN ('inserted', 'empty', 'skipped')",
+        "ix_extraction_job_files_file",
+    ),
+}
+
+
+def check_query_plans(engine=None) -> List[Tuple[str, bool, str]]:
+    """
+    Returns (query name, uses expected index, plan) for each hot query.
+
+    By default the plans come from a fresh in-memory database with the full
+    schema. On a small real database SQLite may rightly prefer a table scan
+    once ANALYZE statistics exist, so pass ``engine`` only to inspect it.
+    """
+    if engine is None:
+        from sqlalchemy import create_engine
+        from db.database import Base
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        apply_migrations(engine)
+    results = []
+    with engine.connect() as conn:
+        for name, (sql, index) in HOT_QUERIES.items():
+            plan = " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            results.append((name, index in plan, plan))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="verify the hot queries use their indexes")
+    parser.add_argument("--live", action="store_true", help="check plans on the configured database itself")
+    parser.add_argument("--repair-assignments", action="store_true",
+                        help="rebuild current_assignments from the assignment history")
+    parser.add_argument("--rebuild-search", action="store_true", help="recreate and refill the search index")
+    args = parser.parse_args()
+
+    from db.database import init_db, engine
+    init_db()
+    print(f"Schema at version {max(applied_versions(engine), default=0)}")
+    if args.repair_assignments:
+        from db.crud import rebuild_current_assignments
+        print(f"current_assignments repaired: {rebuild_current_assignments()}")
+    if args.rebuild_search:
+        with engine.begin() as conn:
+            rebuild_search_index(conn)
+        print("Search index rebuilt")
+    if args.check:
+        failed = False
+        for name, ok, plan in check_query_plans(engine if args.live else None):
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {plan}")
+            failed = failed or not ok
+        sys.exit(1 if failed else 0)
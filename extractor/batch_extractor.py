@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Union
+from app.core.logger import setup_logger
+from extractor.laptop_extractor import EXTRACTION_INSTRUCTIONS, extract_laptop_information, generate
+
+logger = setup_logger()
+
+BATCH_PROMPT_TAIL = """
+You will receive several invoices, each starting with a line "=== INVOICE <n> ===".
+Extract every invoice separately, following the fields and rules above for each one.
+
+Return only a valid JSON array inside a markdown code block, with exactly one object per invoice.
+Each object must contain an additional key "Invoice Index" holding the <n> of the invoice it was extracted from, like this:
+
+```json
+[{ "Invoice Index": 1, ... }, { "Invoice Index": 2, ... }]
+```
+
+Invoices:
+"""
+
+INVOICE_SEPARATOR = "=== INVOICE {index} ==="
+
+# Invoices are about 4 characters per token; this only has to be a safe estimate
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+PROMPT_OVERHEAD_TOKENS = estimate_tokens(EXTRACTION_INSTRUCTIONS + BATCH_PROMPT_TAIL)
+
+
+def batch_token_budget() -> int:
+    """LLM_BATCH_TOKENS; 0 disables batching."""
+    return int(os.getenv("LLM_BATCH_TOKENS", "0"))
+
+
+def batch_max_invoices() -> int:
+    return int(os.getenv("LLM_BATCH_MAX_INVOICES", "8"))
+
+
+def build_batch_prompt(invoice_texts: List[str]) -> str:
+    parts = [EXTRACTION_INSTRUCTIONS, BATCH_PROMPT_TAIL]
+    for index, text in enumerate(invoice_texts, start=1):
+        parts.append(f'{INVOICE_SEPARATOR.format(index=index)}\n"""\n{text}\n"""\n')
+    return "\n".join(parts)
+
+
+def plan_batches(invoice_texts: List[str], token_budget: int, max_batch_size: int) -> List[List[int]]:
+    """
+    Groups invoice indexes into batches whose estimated prompt size stays within
+    token_budget. An invoice too large for any batch is sent on its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = PROMPT_OVERHEAD_TOKENS
+    for i, text in enumerate(invoice_texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], PROMPT_OVERHEAD_TOKENS
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(raw_response: str, batch_size: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Maps the JSON array returned for a batch back to 0-based invoice positions.
+    Objects with a missing or out-of-range "Invoice Index" are dropped.
+    """
+    match = re.search(r"```(?:json)?\s*(\[.*\])\s*```", raw_response, re.DOTALL)
+    if not match:
+        raise ValueError("Batch response did not contain a JSON array block")
+    items = json.loads(match.group(1))
+    if not isinstance(items, list):
+        raise ValueError("Batch response JSON is not an array")
+
+    mapped: Dict[int, Dict[str, Any]] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.pop("Invoice Index", None)
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= batch_size and index - 1 not in mapped:
+            mapped[index - 1] = item
+    return mapped
+
+
+def extract_laptop_information_batch(invoice_texts: List[str]) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Extracts several invoices with one model request.
+
+    Invoices the batch response does not cover, or all of them if the request
+    or parsing fails, are extracted again one by one. The result list matches
+    invoice_texts; an invoice whose per-invoice fallback also failed holds the
+    exception instead of a dict.
+    """
+    results: List[Union[Dict[str, Any], Exception, None]] = [None] * len(invoice_texts)
+    if len(invoice_texts) > 1:
+        logger.info(f"Sending batch of {len(invoice_texts)} invoices to the model.")
+        try:
+            mapped = parse_batch_response(generate(build_batch_prompt(invoice_texts)), len(invoice_texts))
+            for i, invoice in mapped.items():
+                results[i] = invoice
+        except Exception as e:
+            logger.warning(f"Batch extraction failed, falling back to per-invoice calls: {e}")
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing and len(invoice_texts) > 1:
+        logger.info(f"Extracting {len(missing)} invoices individually.")
+    for i in missing:
+        try:
+            results[i] = extract_laptop_information(invoice_texts[i])
+        except Exception as e:
+            logger.error(f"Failed to extract invoice {i + 1} of batch: {e}")
+            results[i] = e
+    return results
+
+
+def extract_many(invoice_texts: List[str], token_budget: Optional[int] = None,
+                 max_batch_size: Optional[int] = None) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Extracts a list of invoices, batching them up to token_budget per request.
+    With batching disabled (budget 0) every invoice gets its own request.
+    """
+    token_budget = batch_token_budget() if token_budget is None else token_budget
+    max_batch_size = max_batch_size or batch_max_invoices()
+    if token_budget <= 0:
+        batches = [[i] for i in range(len(invoice_texts))]
+    else:
+        batches = plan_batches(invoice_texts, token_budget, max_batch_size)
+
+    results: List[Union[Dict[str, Any], Exception, None]] = [None] * len(invoice_texts)
+    for batch in batches:
+        for i, result in zip(batch, extract_laptop_information_batch([invoice_texts[i] for i in batch])):
+            results[i] = result
+    logger.info(f"Extracted {len(invoice_texts)} invoices with {len(batches)} batches.")
+    return results
+
+
+class _PendingInvoice:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+
+
+class BatchingExtractor:
+    """
+    Collects invoices submitted concurrently by ingestion workers and sends
+    them to the model in batches.
+
+    ``extract`` blocks like extract_laptop_information. A batch is sent as soon
+    as it reaches the token budget or max_batch_size, or once the oldest
+    invoice has waited max_wait seconds.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, max_batch_size: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        self.token_budget = token_budget or batch_token_budget()
+        self.max_batch_size = max_batch_size or batch_max_invoices()
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("LLM_BATCH_MAX_WAIT", "1.0"))
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._pending: List[_PendingInvoice] = []
+        self._pending_tokens = PROMPT_OVERHEAD_TOKENS
+
+    def _take(self) -> List[_PendingInvoice]:
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = PROMPT_OVERHEAD_TOKENS
+        return batch
+
+    def _run(self, batch: List[_PendingInvoice]) -> None:
+        with self._lock:
+            self.requests += 1
+        try:
+            results = extract_laptop_information_batch([item.text for item in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for item, result in zip(batch, results):
+            if isinstance(result, Exception):
+                item.error = result
+            else:
+                item.result = result
+            item.done.set()
+
+    def extract(self, invoice_text: str) -> Dict[str, Any]:
+        item = _PendingInvoice(invoice_text)
+        ready = []
+        with self._lock:
+            if self._pending and self._pending_tokens + item.tokens > self.token_budget:
+                ready.append(self._take())
+            self._pending.append(item)
+            self._pending_tokens += item.tokens
+            if len(self._pending) >= self.max_batch_size or self._pending_tokens >= self.token_budget:
+                ready.append(self._take())
+        for batch in ready:
+            self._run(batch)
+
+        if not item.done.wait(self.max_wait):
+            with self._lock:
+                batch = self._take() if any(p is item for p in self._pending) else None
+            if batch:
+                self._run(batch)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
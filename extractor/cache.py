@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.exc import OperationalError
+from db.database import SessionLocal, ExtractionCacheEntry
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+
+def hash_bytes(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent cache of parsed invoice JSON, stored in the extraction_cache table.
+
+    Results are keyed both on the hash of the PDF bytes (skips parsing and the
+    LLM call) and on the hash of the formatted LLM input (skips the LLM call
+    when different bytes produce the same text). Entries are evicted least
+    recently used first once the total payload size exceeds ``max_bytes``.
+
+    Entries do not expire on their own. When the prompt or model changes, call
+    ``invalidate()`` (or ``python -m extractor.cache --invalidate-stale``).
+
+    Lookups only read. Hit counts and access times are kept in memory and
+    written in one statement once ``flush_every`` hits are pending or
+    ``flush_seconds`` have passed (and before eviction), so parallel workers
+    do not contend for SQLite's write lock on every hit. A flush that finds the
+    database locked is retried later; until then eviction may see older
+    access times.
+    """
+
+    def __init__(self, fingerprint: str, max_bytes: Optional[int] = None, enabled: Optional[bool] = None,
+                 flush_every: Optional[int] = None, flush_seconds: Optional[float] = None):
+        self.fingerprint = fingerprint
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("EXTRACTION_CACHE_MAX_MB", "64")) * 1024 * 1024)
+        if enabled is None:
+            enabled = os.getenv("EXTRACTION_CACHE_ENABLED", "1") == "1"
+        if flush_every is None:
+            flush_every = int(os.getenv("EXTRACTION_CACHE_FLUSH_EVERY", "50"))
+        if flush_seconds is None:
+            flush_seconds = float(os.getenv("EXTRACTION_CACHE_FLUSH_SECONDS", "30"))
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (hits not yet written, latest access time)
+        self._pending: Dict[str, Tuple[int, datetime]] = {}
+        self._pending_hits = 0
+        self._last_flush = time.monotonic()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        session = SessionLocal()
+        try:
+            payload = session.query(ExtractionCacheEntry.payload).filter_by(key=key).scalar()
+        finally:
+            session.close()
+        if payload is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            count, _ = self._pending.get(key, (0, None))
+            self._pending[key] = (count + 1, datetime.now())
+            self._pending_hits += 1
+            due = (self._pending_hits >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_seconds)
+            # Taken under the lock so only one of the concurrent hits writes the batch
+            pending = self._take_pending() if due else None
+        logger.info(f"Extraction cache hit for {key[:20]}...")
+        if pending:
+            self._write_pending(pending)
+        return json.loads(payload)
+
+    def _take_pending(self) -> Dict[str, Tuple[int, datetime]]:
+        pending, self._pending, self._pending_hits = self._pending, {}, 0
+        self._last_flush = time.monotonic()
+        return pending
+
+    def flush(self) -> int:
+        """Writes the pending hit counts and access times; returns the number of entries updated."""
+        with self._lock:
+            pending = self._take_pending()
+        return self._write_pending(pending) if pending else 0
+
+    def _write_pending(self, pending: Dict[str, Tuple[int, datetime]]) -> int:
+        stmt = update(ExtractionCacheEntry)\
+            .where(ExtractionCacheEntry.key == bindparam("entry_key"))\
+            .values(hits=func.coalesce(ExtractionCacheEntry.hits, 0) + bindparam("new_hits"),
+                    last_accessed=bindparam("accessed"))
+        session = SessionLocal()
+        try:
+            session.connection().execute(stmt, [
+                {"entry_key": key, "new_hits": count, "accessed": accessed}
+                for key, (count, accessed) in pending.items()
+            ])
+            session.commit()
+        except OperationalError as e:
+            # Best effort: keep the counts for the next flush rather than wait for the write lock
+            session.rollback()
+            with self._lock:
+                for key, (count, accessed) in pending.items():
+                    newer, latest = self._pending.get(key, (0, accessed))
+                    self._pending[key] = (count + newer, max(accessed, latest))
+                    self._pending_hits += count
+            logger.warning(f"Extraction cache hit statistics not written, will retry: {e}")
+            return 0
+        finally:
+            session.close()
+        return len(pending)
+
+    def get_by_pdf(self, pdf_bytes) -> Optional[Dict[str, Any]]:
+        return self._get(f"pdf:{hash_bytes(pdf_bytes)}")
+
+    def get_by_text(self, formatted_text: str) -> Optional[Dict[str, Any]]:
+        return self._get(f"text:{hash_text(formatted_text)}")
+
+    def put(self, invoice: Dict[str, Any], pdf_bytes=None, formatted_text: Optional[str] = None) -> None:
+        if not self.enabled or not invoice:
+            return
+        keys = []
+        if pdf_bytes is not None:
+            keys.append(f"pdf:{hash_bytes(pdf_bytes)}")
+        if formatted_text is not None:
+            keys.append(f"text:{hash_text(formatted_text)}")
+        payload = json.dumps(invoice)
+        now = datetime.now()
+        session = SessionLocal()
+        try:
+            for key in keys:
+                session.merge(ExtractionCacheEntry(
+                    key=key, payload=payload, size=len(payload), fingerprint=self.fingerprint,
+                    created_at=now, last_accessed=now, hits=0
+                ))
+            session.commit()
+            self._evict(session)
+        finally:
+            session.close()
+
+    def _evict(self, session) -> None:
+        # Least recently used is judged on the stored access times
+        self.flush()
+        total = session.query(func.coalesce(func.sum(ExtractionCacheEntry.size), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for key, size in session.query(ExtractionCacheEntry.key, ExtractionCacheEntry.size)\
+                .order_by(ExtractionCacheEntry.last_accessed).yield_per(500):
+            if total <= self.max_bytes:
+                break
+            to_delete.append(key)
+            total -= size
+        for i in range(0, len(to_delete), 500):
+            session.query(ExtractionCacheEntry).filter(
+                ExtractionCacheEntry.key.in_(to_delete[i:i + 500])).delete(synchronize_session=False)
+        session.commit()
+        logger.info(f"Evicted {len(to_delete)} extraction cache entries.")
+
+    def invalidate(self, stale_only: bool = False) -> int:
+        """Deletes all entries, or only those made with another model/prompt fingerprint."""
+        session = SessionLocal()
+        try:
+            query = session.query(ExtractionCacheEntry)
+            if stale_only:
+                query = query.filter(ExtractionCacheEntry.fingerprint != self.fingerprint)
+            deleted = query.delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+        logger.info(f"Invalidated {deleted} extraction cache entries.")
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush()
+        session = SessionLocal()
+        try:
+            entries, total, stale = session.query(
+                func.count(ExtractionCacheEntry.key),
+                func.coalesce(func.sum(ExtractionCacheEntry.size), 0),
+                func.count(ExtractionCacheEntry.key).filter(ExtractionCacheEntry.fingerprint != self.fingerprint),
+            ).one()
+        finally:
+            session.close()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "entries": entries,
+            "stale_entries": stale,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Returns the process-wide cache for the current model and prompt."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from extractor.laptop_extractor import PROMPT_FINGERPRINT
+            _cache = ExtractionCache(PROMPT_FINGERPRINT)
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the invoice extraction cache.")
+    parser.add_argument("--stats", action="store_true", help="Print cache statistics")
+    parser.add_argument("--invalidate", action="store_true", help="Delete every cached extraction")
+    parser.add_argument("--invalidate-stale", action="store_true",
+                        help="Delete extractions made with another model or prompt")
+    args = parser.parse_args()
+    cache = get_extraction_cache()
+    if args.invalidate or args.invalidate_stale:
+        print(f"Deleted {cache.invalidate(stale_only=not args.invalidate)} entries")
+    print(json.dumps(cache.stats(), indent=2))
@@ -1,60 +1,177 @@
+import csv
+import io
 import os
 import json
-import pandas as pd
-from sqlalchemy import create_engine
-from db.database import SessionLocal, LaptopInvoice, LaptopItem
+import tempfile
+import textwrap
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
+from db.database import SessionLocal, LaptopInvoice, ExportFragment, ExportState, engine
 from app.core.logger import setup_logger
+from app.core.normalize import format_invoice_date
 
 logger = setup_logger()
 
+EXPORT_NAME = "laptop_invoices"
+FRAGMENT_BATCH_SIZE = 500
+
+JSON_LAPTOP_FIELDS = {
+    "Lapotop Model": "laptop_model",
+    "Processor": "processor",
+    "RAM": "ram",
+    "Storage": "storage",
+    "Model Color": "model_color",
+    "Screen Size": "screen_size",
+    "Laptop OS": "laptop_os",
+    "Laptop OS Version": "laptop_os_version",
+    "Laptop Serial Number": "laptop_serial_number",
+    "Warranty Duration": "warranty_duration",
+    "Laptop Price": "laptop_price",
+}
+CSV_INVOICE_COLUMNS = ["invoice_number", "order_date", "invoice_date", "order_number", "supplier_name"]
+CSV_LAPTOP_COLUMNS = ["laptop_model", "processor", "ram", "storage", "model_color", "screen_size", "laptop_os",
+                      "laptop_os_version", "laptop_serial_number", "warranty_duration", "laptop_price"]
+
+_export_lock = threading.Lock()
+
+
+def _render_fragments(invoice: LaptopInvoice) -> Dict[str, str]:
+    """Renders one invoice as an element of the JSON export and as its rows of the CSV export."""
+    items = sorted(invoice.items, key=lambda item: item.id)
+    inv_dict = {
+        "Invoice Number": invoice.invoice_number,
+        "Order Date": format_invoice_date(invoice.order_date),
+        "Invoice Date": format_invoice_date(invoice.invoice_date),
+        "Order Number": invoice.order_number,
+        "Supplier (Vendor) Name": invoice.supplier_name,
+        "Laptops": [{key: getattr(item, column) for key, column in JSON_LAPTOP_FIELDS.items()} for item in items],
+    }
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    # Dates as DD-MM-YYYY, as extracted, in both exports
+    invoice_values = [inv_dict[key] for key in ("Invoice Number", "Order Date", "Invoice Date", "Order Number",
+                                                 "Supplier (Vendor) Name")]
+    for item in items:
+        writer.writerow(invoice_values + [getattr(item, column) for column in CSV_LAPTOP_COLUMNS])
+    return {
+        # Indented as an element of the top-level list, matching json.dump(..., indent=2)
+        "json_fragment": textwrap.indent(json.dumps(inv_dict, indent=2), "  "),
+        "csv_fragment": buffer.getvalue(),
+    }
+
+
+def _save_fragments(session, rows: list) -> None:
+    stmt = sqlite_insert(ExportFragment)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExportFragment.invoice_id],
+        set_={column: stmt.excluded[column] for column in ("revision", "json_fragment", "csv_fragment")},
+    )
+    session.execute(stmt, rows)
+
+
+def refresh_export_fragments(full: bool = False) -> Dict[str, int]:
+    """
+    Re-renders the export fragments of invoices changed since the last refresh.
+
+    Every change to an invoice or its laptops gives the invoice a new revision
+    from a counter that never goes back (see migrations 4 and 10), and the
+    highest revision rendered is kept as the watermark in
+    export_state, so only invoices above it are loaded. Fragments of deleted
+    invoices are dropped. ``full`` re-renders every invoice.
+    """
+    with _export_lock:
+        session = SessionLocal()
+        try:
+            state = session.get(ExportState, EXPORT_NAME)
+            watermark = 0 if full or state is None else state.watermark
+            target = session.execute(select(func.coalesce(func.max(LaptopInvoice.revision), 0))).scalar()
+            # Invoices changed after target are left for the next refresh
+            invoices = session.query(LaptopInvoice)\
+                .options(selectinload(LaptopInvoice.items))\
+                .filter(LaptopInvoice.revision > watermark, LaptopInvoice.revision <= target)\
+                .order_by(LaptopInvoice.id)\
+                .yield_per(FRAGMENT_BATCH_SIZE)
+            rows = []
+            rendered = 0
+            for invoice in invoices:
+                rows.append(dict(_render_fragments(invoice), invoice_id=invoice.id, revision=invoice.revision))
+                if len(rows) == FRAGMENT_BATCH_SIZE:
+                    _save_fragments(session, rows)
+                    rendered += len(rows)
+                    rows = []
+            if rows:
+                _save_fragments(session, rows)
+                rendered += len(rows)
+
+            removed = session.execute(
+                delete(ExportFragment).where(ExportFragment.invoice_id.notin_(select(LaptopInvoice.id)))
+            ).rowcount
+            if state is None:
+                state = ExportState(name=EXPORT_NAME)
+                session.add(state)
+            state.watermark = target if full else max(state.watermark or 0, target)
+            state.exported_at = datetime.now()
+            session.commit()
+        finally:
+            session.close()
+    logger.info(f"Export fragments refreshed: {rendered} rendered, {removed} removed, watermark {target}.")
+    return {"rendered": rendered, "removed": removed, "watermark": target}
+
+
+def _iter_fragments(column) -> Iterator[str]:
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=FRAGMENT_BATCH_SIZE).execute(
+            select(column).order_by(ExportFragment.invoice_id))
+        for (fragment,) in result:
+            yield fragment
+
+
+def _write_atomically(output_path: str, chunks: Iterable[str]) -> None:
+    """Writes to a temporary file next to output_path and renames it over the old file."""
+    directory = os.path.dirname(output_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(output_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _json_chunks(counter: list) -> Iterator[str]:
+    yield "["
+    for fragment in _iter_fragments(ExportFragment.json_fragment):
+        yield ("\n" if not counter else ",\n") + fragment
+        counter.append(1)
+    yield "\n]" if counter else "]"
+
+
 def export_all_laptop_invoices_json(output_path="output/assets/laptop_invoices.json"):
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    session = SessionLocal()
     logger.info("Starting export of all laptop invoices to JSON.")
-    all_invoices = session.query(LaptopInvoice).all()
-    export_data = []
-    for inv in all_invoices:
-        items = session.query(LaptopItem).filter_by(invoice_id=inv.id).all()
-        laptops = []
-        for item in items:
-            laptops.append({
-                "Lapotop Model": item.laptop_model,
-                "Processor": item.processor,
-                "RAM": item.ram,
-                "Storage": item.storage,
-                "Model Color": item.model_color,
-                "Screen Size": item.screen_size,
-                "Laptop OS": item.laptop_os,
-                "Laptop OS Version": item.laptop_os_version,
-                "Laptop Serial Number": item.laptop_serial_number,
-                "Warranty Duration": item.warranty_duration,
-                "Laptop Price": item.laptop_price,
-                # "Quantity": item.quantity
-            })
-        inv_dict = {
-            "Invoice Number": inv.invoice_number,
-            "Order Date": inv.order_date,
-            "Invoice Date": inv.invoice_date,
-            "Order Number": inv.order_number,
-            "Supplier (Vendor) Name": inv.supplier_name,
-            "Laptops": laptops
-        }
-        export_data.append(inv_dict)
-    session.close()
-    logger.info(f"Exported {len(export_data)} laptop invoices. Writing to {output_path}")
-    with open(output_path, "w") as f:
-        json.dump(export_data, f, indent=2)
-    logger.info(f"Exported {len(export_data)} laptop invoices to {output_path}")
+    refresh_export_fragments()
+    exported = []
+    _write_atomically(output_path, _json_chunks(exported))
+    logger.info(f"Exported {len(exported)} laptop invoices to {output_path}")
+
+
+def _csv_chunks(counter: list) -> Iterator[str]:
+    yield ",".join(CSV_INVOICE_COLUMNS + CSV_LAPTOP_COLUMNS) + "\n"
+    for fragment in _iter_fragments(ExportFragment.csv_fragment):
+        counter.append(fragment.count("\n"))
+        yield fragment
+
 
 def export_all_laptop_invoices_csv(output_path="output/assets/laptop_invoices.csv"):
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    engine = create_engine("sqlite:///invoices_database.db")
     logger.info("Exporting all laptop items to CSV.")
-    df = pd.read_sql("""
-        SELECT i.invoice_number, i.order_date, i.invoice_date, i.order_number, i.supplier_name,
-               l.laptop_model, l.processor, l.ram, l.storage, l.model_color, l.screen_size, l.laptop_os, l.laptop_os_version, l.laptop_serial_number, l.warranty_duration, l.laptop_price
-        FROM laptop_invoices i
-        JOIN laptop_items l ON i.id = l.invoice_id
-    """, engine)
-    df.to_csv(output_path, index=False)
-    logger.info(f"Exported {len(df)} laptop items to {output_path}")
\ No newline at end of file
+    refresh_export_fragments()
+    exported = []
+    _write_atomically(output_path, _csv_chunks(exported))
+    logger.info(f"Exported {sum(exported)} laptop items to {output_path}")
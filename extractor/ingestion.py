@@ -0,0 +1,270 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+@dataclass
+class IngestionLimits:
+    """
+    Concurrency limits for each stage of the ingestion engine.
+
+    download_workers: concurrent Drive downloads (network I/O).
+    parse_workers: concurrent PDF parses (CPU-bound).
+    llm_workers: concurrent LLM extraction calls.
+    parse_in_processes: run the parse stage in a process pool so it is not
+        serialized by the GIL.
+    """
+    download_workers: int = 8
+    parse_workers: int = max(1, (os.cpu_count() or 2) - 1)
+    llm_workers: int = 4
+    parse_in_processes: bool = False
+
+    @classmethod
+    def from_env(cls) -> "IngestionLimits":
+        defaults = cls()
+        return cls(
+            download_workers=_env_int("INGEST_DOWNLOAD_WORKERS", defaults.download_workers),
+            parse_workers=_env_int("INGEST_PARSE_WORKERS", defaults.parse_workers),
+            llm_workers=_env_int("INGEST_LLM_WORKERS", defaults.llm_workers),
+            parse_in_processes=os.getenv("INGEST_PARSE_IN_PROCESSES", "0") == "1",
+        )
+
+
+class StageStats:
+    """Thread-safe counters for a single pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True, nbytes: int = 0) -> None:
+        with self._lock:
+            self.busy_seconds += seconds
+            self.bytes += nbytes
+            if ok:
+                self.count += 1
+            else:
+                self.errors += 1
+
+    def as_dict(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "completed": self.count,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "avg_seconds": round(self.busy_seconds / self.count, 3) if self.count else None,
+            "items_per_second": round(self.count / wall_seconds, 3) if wall_seconds > 0 else None,
+            "bytes": self.bytes,
+        }
+
+
+@dataclass
+class IngestionResult:
+    file_id: str
+    file_name: str
+    status: str  # "inserted", "empty", "error" or "cancelled"
+    message: str = ""
+    invoice: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+
+def download_drive_file(service, file_id: str) -> memoryview:
+    """
+    Downloads a Drive file's content into memory.
+
+    Returns a read-only view of the download buffer instead of a copy of it.
+    """
+    from googleapiclient.http import MediaIoBaseDownload
+
+    request_file = service.files().get_media(fileId=file_id)
+    fh = io.BytesIO()
+    downloader = MediaIoBaseDownload(fh, request_file)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    return fh.getbuffer().toreadonly()
+
+
+def _parse_pdf_bytes(pdf_bytes, file_id: str) -> str:
+    """Parses in-memory PDF content. Runs in a worker thread or process."""
+    from extractor.run_extraction import parse_invoice
+
+    return parse_invoice(pdf_bytes)
+
+
+def _extract_text(formatted_invoice: str) -> Any:
+    from extractor.run_extraction import extract_invoice
+
+    return extract_invoice(formatted_invoice)
+
+
+def _persist(invoice: Dict[str, Any], file_id: str) -> None:
+    from db.crud import insert_or_replace_laptop_invoice
+
+    insert_or_replace_laptop_invoice(invoice, drive_file_id=file_id)
+
+
+class IngestionEngine:
+    """
+    Downloads, parses, extracts and persists Drive PDFs concurrently.
+
+    Each file flows through four stages. Every stage has its own limit, so a
+    slow LLM does not stop downloads and a burst of downloads does not starve
+    the CPU. Writes are serialized because SQLite allows a single writer.
+
+    With an ``ExtractionCache``, files whose bytes or formatted text were
+    extracted before skip the parse and/or LLM stages.
+
+    The Drive client is created per worker thread through ``service_factory``
+    because googleapiclient services are not thread-safe. All stage functions
+    can be replaced, which allows running the engine against a fake Drive
+    service and a stub model.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[], Any],
+        limits: Optional[IngestionLimits] = None,
+        download_fn: Callable[[Any, str], memoryview] = download_drive_file,
+        parse_fn: Callable[[memoryview, str], str] = _parse_pdf_bytes,
+        extract_fn: Callable[[str], Any] = _extract_text,
+        persist_fn: Callable[[Dict[str, Any], str], None] = _persist,
+        on_start: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_result: Optional[Callable[[IngestionResult], None]] = None,
+        cache=None,
+    ):
+        self.service_factory = service_factory
+        self.limits = limits or IngestionLimits.from_env()
+        self.download_fn = download_fn
+        self.parse_fn = parse_fn
+        self.extract_fn = extract_fn
+        self.persist_fn = persist_fn
+        self.on_start = on_start
+        self.on_result = on_result
+        self.cache = cache
+
+        self._download_sem = threading.BoundedSemaphore(self.limits.download_workers)
+        self._parse_sem = threading.BoundedSemaphore(self.limits.parse_workers)
+        self._llm_sem = threading.BoundedSemaphore(self.limits.llm_workers)
+        self._persist_lock = threading.Lock()
+        self._local = threading.local()
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._cancelled = threading.Event()
+
+        self.stats = {name: StageStats(name) for name in ("download", "parse", "llm", "persist")}
+        self.wall_seconds = 0.0
+
+    def cancel(self) -> None:
+        """Stops picking up new files. Files already in flight run to completion."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _service(self):
+        if not hasattr(self._local, "service"):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def _timed(self, stage: str, semaphore, fn, *args, nbytes_of=None):
+        with semaphore:
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception:
+                self.stats[stage].record(time.perf_counter() - start, ok=False)
+                raise
+            nbytes = nbytes_of(result) if nbytes_of else 0
+            self.stats[stage].record(time.perf_counter() - start, nbytes=nbytes)
+            return result
+
+    def _parse(self, pdf_bytes, file_id: str) -> str:
+        if self._parse_pool is not None:
+            # memoryviews cannot be pickled; crossing a process boundary needs a copy
+            return self._parse_pool.submit(self.parse_fn, bytes(pdf_bytes), file_id).result()
+        return self.parse_fn(pdf_bytes, file_id)
+
+    def process_file(self, file_item: Dict[str, Any]) -> IngestionResult:
+        file_id = file_item['id']
+        file_name = file_item.get('name', file_id)
+        if self.cancelled:
+            return IngestionResult(file_id, file_name, "cancelled", "Cancelled before start")
+        if self.on_start:
+            self.on_start(file_item)
+        try:
+            pdf_bytes = self._timed(
+                "download", self._download_sem, self.download_fn, self._service(), file_id, nbytes_of=len)
+            invoice = self.cache.get_by_pdf(pdf_bytes) if self.cache else None
+            if invoice is None:
+                formatted = self._timed("parse", self._parse_sem, self._parse, pdf_bytes, file_id)
+                invoice = self.cache.get_by_text(formatted) if self.cache else None
+                if invoice is None:
+                    invoice = self._timed("llm", self._llm_sem, self.extract_fn, formatted)
+                    if self.cache:
+                        self.cache.put(invoice, pdf_bytes=pdf_bytes, formatted_text=formatted)
+                elif self.cache:
+                    self.cache.put(invoice, pdf_bytes=pdf_bytes)
+            del pdf_bytes
+            if not invoice:
+                logger.warning(f"No data extracted from {file_name}. Skipping database insertion.")
+                return IngestionResult(file_id, file_name, "empty", "No data extracted. DB insert skipped.")
+            self._timed("persist", self._persist_lock, self.persist_fn, invoice, file_id)
+            logger.info(f"Inserted/replaced invoice data for {file_name}.")
+            return IngestionResult(file_id, file_name, "inserted", "Inserted/replaced invoice data", invoice)
+        except Exception as e:
+            logger.error(f"Error processing file {file_name} (ID: {file_id}): {e}")
+            return IngestionResult(file_id, file_name, "error", str(e))
+
+    def run(self, files: List[Dict[str, Any]]) -> List[IngestionResult]:
+        """
+        Processes all files and returns one result per file, in input order.
+        """
+        limits = self.limits
+        # Enough threads to keep every stage saturated at the same time.
+        pool_size = max(1, min(len(files), limits.download_workers + limits.parse_workers + limits.llm_workers))
+        logger.info(f"Ingesting {len(files)} files with limits {limits} ({pool_size} worker threads).")
+
+        results: Dict[str, IngestionResult] = {}
+        start = time.perf_counter()
+        if limits.parse_in_processes:
+            self._parse_pool = ProcessPoolExecutor(max_workers=limits.parse_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="ingest") as pool:
+                futures = {pool.submit(self.process_file, f): f['id'] for f in files}
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[futures[future]] = result
+                    if self.on_result:
+                        self.on_result(result)
+        finally:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+            self.wall_seconds = time.perf_counter() - start
+
+        logger.info(f"Ingestion finished in {self.wall_seconds:.2f}s: {self.throughput()}")
+        return [results[f['id']] for f in files]
+
+    def throughput(self) -> List[Dict[str, Any]]:
+        """Per-stage counts, busy time and items/second over the last run."""
+        return [s.as_dict(self.wall_seconds) for s in self.stats.values()]
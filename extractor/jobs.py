@@ -0,0 +1,147 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.drive import build_drive_service
+from app.core.drive_sync import sync_drive_folder
+from app.core.logger import setup_logger
+from db.crud import (
+    add_extraction_job_files, create_extraction_job, get_pending_job_files,
+    is_extraction_job_cancelled, request_extraction_job_cancel,
+    update_extraction_job, update_extraction_job_file, get_extraction_job_progress,
+    get_extracted_file_versions, get_imported_drive_file_versions, drive_file_last_edited,
+)
+from extractor.cache import get_extraction_cache
+from extractor.batch_extractor import BatchingExtractor, batch_token_budget
+from extractor.ingestion import IngestionEngine, IngestionLimits, IngestionResult
+from extractor.rule_extractor import get_rule_extractor
+from extractor.run_extraction import extract_invoice
+
+logger = setup_logger()
+
+
+def plan_folder_extraction(all_files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Selects the PDFs of a folder listing and marks the ones already extracted
+    at their current Drive modifiedTime as skipped, so only new and changed
+    PDFs are processed.
+
+    A file no extraction job has processed yet is only skipped if laptops were
+    already imported from it (a database from before job history) and
+    drive_files holds its current modifiedTime. drive_files alone proves
+    nothing: selecting the folder syncs it before the job starts.
+    """
+    pdf_files = [f for f in all_files if f.get('mimeType') == 'application/pdf']
+    file_ids = [f['id'] for f in pdf_files]
+    versions = get_extracted_file_versions(file_ids)
+    last_edited = get_imported_drive_file_versions([file_id for file_id in file_ids if file_id not in versions])
+
+    planned = []
+    for file_item in pdf_files:
+        entry = dict(file_item)
+        if file_item['id'] in versions:
+            if file_item.get('modifiedTime') in versions[file_item['id']]:
+                entry.update(status='skipped', message='Unchanged since last extraction')
+        elif last_edited.get(file_item['id']) is not None and \
+                last_edited[file_item['id']] == drive_file_last_edited(file_item.get('modifiedTime')):
+            entry.update(status='skipped', message='Imported before, unchanged since last sync')
+        planned.append(entry)
+    return planned
+
+
+class ExtractionJobRunner:
+    """
+    Runs folder extraction jobs on a local thread pool.
+
+    Job and per-file state live in the extraction_jobs tables, so progress can
+    be polled from any web worker, and a job interrupted by a crash or restart
+    can be resumed: files already finished are not processed again.
+    """
+
+    def __init__(self, max_jobs: Optional[int] = None):
+        if max_jobs is None:
+            max_jobs = int(os.getenv("EXTRACTION_JOB_WORKERS", "1"))
+        self._pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="extraction-job")
+        self._engines: Dict[int, IngestionEngine] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, folder_id: str, credentials: Dict[str, Any], folder_name: Optional[str] = None) -> int:
+        job_id = create_extraction_job(folder_id, folder_name)
+        self._pool.submit(self._run, job_id, folder_id, credentials)
+        logger.info(f"Queued extraction job {job_id} for folder {folder_id}.")
+        return job_id
+
+    def resume(self, job_id: int, credentials: Dict[str, Any]) -> bool:
+        progress = get_extraction_job_progress(job_id)
+        if not progress or progress["status"] not in ("interrupted", "failed", "cancelled"):
+            return False
+        update_extraction_job(job_id, status="queued", error=None, cancel_requested=False)
+        self._pool.submit(self._run, job_id, progress["folder_id"], credentials)
+        logger.info(f"Resuming extraction job {job_id}.")
+        return True
+
+    def cancel(self, job_id: int) -> bool:
+        if not request_extraction_job_cancel(job_id):
+            return False
+        with self._lock:
+            engine = self._engines.get(job_id)
+        if engine:
+            engine.cancel()
+        return True
+
+    def _run(self, job_id: int, folder_id: str, credentials: Dict[str, Any]) -> None:
+        if is_extraction_job_cancelled(job_id):
+            return
+        update_extraction_job(job_id, status="running", started_at=datetime.now(), finished_at=None)
+        try:
+            service = build_drive_service(credentials)
+            synced = sync_drive_folder(service, folder_id, lambda: build_drive_service(credentials))
+            planned = plan_folder_extraction(synced.files)
+            add_extraction_job_files(job_id, planned)
+            pending = get_pending_job_files(job_id)
+            # A changed file's earlier laptops are replaced when its new data is persisted
+            # (insert_or_replace_laptop_invoice), so a failed or cancelled file keeps them
+
+            def on_start(file_item: Dict[str, Any]) -> None:
+                update_extraction_job_file(job_id, file_item['id'], "processing")
+
+            def on_result(result: IngestionResult) -> None:
+                status = "pending" if result.status == "cancelled" else result.status
+                update_extraction_job_file(job_id, result.file_id, status, result.message)
+
+            engine_options = {}
+            if batch_token_budget() > 0:
+                # Let enough files reach the LLM stage at once to fill batches
+                batcher = BatchingExtractor()
+                limits = IngestionLimits.from_env()
+                limits.llm_workers *= batcher.max_batch_size
+                engine_options = {"extract_fn": lambda text: extract_invoice(text, llm_fn=batcher.extract),
+                                  "limits": limits}
+            engine = IngestionEngine(lambda: build_drive_service(credentials),
+                                     on_start=on_start, on_result=on_result,
+                                     cache=get_extraction_cache(), **engine_options)
+            with self._lock:
+                self._engines[job_id] = engine
+            if is_extraction_job_cancelled(job_id):
+                engine.cancel()
+            logger.info(f"Job {job_id}: {len(pending)} of {len(planned)} PDFs to process.")
+            engine.run(pending)
+
+            if engine.cancelled:
+                update_extraction_job(job_id, status="cancelled", finished_at=datetime.now())
+                return
+
+            from extractor.export import export_all_laptop_invoices_csv, export_all_laptop_invoices_json
+            export_all_laptop_invoices_json()
+            export_all_laptop_invoices_csv()
+            update_extraction_job(job_id, status="completed", finished_at=datetime.now())
+            logger.info(f"Job {job_id} completed: {engine.throughput()}")
+            logger.info(f"Extraction cache: {get_extraction_cache().stats()}")
+            logger.info(f"Rule extractor: {get_rule_extractor().hit_rates()}")
+        except Exception as e:
+            logger.error(f"Extraction job {job_id} failed: {e}")
+            update_extraction_job(job_id, status="failed", error=str(e), finished_at=datetime.now())
+        finally:
+            with self._lock:
+                self._engines.pop(job_id, None)
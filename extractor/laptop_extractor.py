@@ -1,10 +1,12 @@
+import hashlib
 import json
 import os
 import re
+import threading
 from dotenv import load_dotenv
 import google.generativeai as genai
 from app.core.logger import setup_logger
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 logger = setup_logger()
 
@@ -13,16 +15,15 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY not set in environment variables.")
-    raise ValueError("GEMINI_API_KEY not set in environment variables.")
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-flash")
+MODEL_NAME = "gemini-1.5-flash"
 
+model = None
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
+    model = genai.GenerativeModel(MODEL_NAME)
 
-def extract_laptop_information(invoice_text: str) -> Dict[str, Any]:
-    logger.info("Starting extraction of laptop invoice details from invoice text.")
-
-    prompt = f"""
+EXTRACTION_INSTRUCTIONS = """
     You are an assistant that extracts structured data from invoices (especially laptops).
 
     Extract these common fields exactly at the invoice level:
@@ -58,7 +59,9 @@ RULES:
 8. Do not think about the context of the invoice text, just extract the fields as they are in the format mentioned.
 9. Please strip unnecessary spaces before and after (or even between text).
 10. Columns like "laptop_model", "laptop_brand", "model_color" should be in propercase (e.g., "MacBook Pro", "Dell XPS 13", "HP Spectre x360"). Do not use all caps or all lowercase.
+"""
 
+PROMPT_TEMPLATE = EXTRACTION_INSTRUCTIONS + """
 Return only a valid JSON object inside markdown code block, like this:
 
 ```json
@@ -70,10 +73,57 @@ Invoice text:
 {invoice_text}
 \"\"\"
 """
-    logger.debug("Sending prompt to Gemini model.")
-    response = model.generate_content(prompt)
 
-    raw_response = response.candidates[0].content.parts[0].text.strip()
+# Identifies the model and prompt that produced a result. Cached extractions
+# made with another fingerprint must be invalidated explicitly.
+PROMPT_FINGERPRINT = hashlib.sha256(f"{MODEL_NAME}\n{PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:16]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Returns the shared async client (rate limiting, retries, timeouts and
+    request coalescing), configured from LLM_* environment variables.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from extractor.llm_client import client_from_env
+            _client = client_from_env(model)
+        return _client
+
+
+def _client_generate(prompt: str) -> str:
+    return get_llm_client().generate_sync(prompt)
+
+
+_generate: Callable[[str], str] = _client_generate
+
+
+def set_generate_fn(generate_fn: Optional[Callable[[str], str]]) -> None:
+    """
+    Replaces the function that sends a prompt to the model and returns the raw
+    response text, e.g. with a local stub in tests. Pass None to restore the
+    default client.
+    """
+    global _generate
+    _generate = generate_fn or _client_generate
+
+
+def generate(prompt: str) -> str:
+    """Sends a prompt to the configured model and returns the raw response text."""
+    return _generate(prompt)
+
+
+def extract_laptop_information(invoice_text: str) -> Dict[str, Any]:
+    logger.info("Starting extraction of laptop invoice details from invoice text.")
+
+    prompt = PROMPT_TEMPLATE.format(invoice_text=invoice_text)
+    logger.debug("Sending prompt to Gemini model.")
+    raw_response = generate(prompt)
     logger.debug("Received response from Gemini model.")
 
     match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", raw_response, re.DOTALL)
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+
+class TransientBackendError(Exception):
+    """A backend failure worth retrying (rate limited, overloaded, unavailable)."""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (TransientBackendError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    ))
+
+
+class GeminiBackend:
+    """Calls a google.generativeai model with its native async API."""
+
+    def __init__(self, model, timeout: float):
+        self.model = model
+        self.timeout = timeout
+
+    async def generate(self, prompt: str) -> str:
+        if self.model is None:
+            raise ValueError("GEMINI_API_KEY not set in environment variables.")
+        response = await self.model.generate_content_async(prompt, request_options={"timeout": self.timeout})
+        return response.candidates[0].content.parts[0].text.strip()
+
+
+class HttpBackend:
+    """
+    Posts {"prompt": ...} as JSON to a URL and reads {"text": ...} back.
+
+    Lets a local fake server stand in for the model. 429 and 5xx responses
+    are treated as transient.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, prompt: str) -> str:
+        body = json.dumps({"prompt": prompt}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))["text"]
+        except urllib.error.HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                raise TransientBackendError(f"HTTP {e.code} from {self.url}") from e
+            raise
+
+    async def generate(self, prompt: str) -> str:
+        return await asyncio.to_thread(self._post, prompt)
+
+
+class CallableBackend:
+    """Wraps a synchronous prompt -> text function, such as StubModel."""
+
+    def __init__(self, fn: Callable[[str], str]):
+        self.fn = fn
+
+    async def generate(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.fn, prompt)
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average, with bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncLLMClient:
+    """
+    asyncio client for LLM extraction calls.
+
+    Every call waits for the token bucket, runs under a concurrency limit and a
+    per-call timeout, and is retried with full-jitter exponential backoff on
+    transient errors. Identical prompts already in flight share one request.
+
+    The client owns an event loop on a background thread, so synchronous code
+    (ingestion worker threads) can call ``generate_sync``.
+    """
+
+    def __init__(self, backend, rate_per_minute: float = 60, burst: int = 5, max_concurrency: int = 8,
+                 timeout: float = 60, max_retries: int = 4, backoff_base: float = 1.0, backoff_cap: float = 30.0):
+        self.backend = backend
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0, "timeouts": 0, "coalesced": 0, "failures": 0}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._bucket: Optional[TokenBucket] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _ensure_primitives(self) -> None:
+        # asyncio primitives bind to the loop they are first used on
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.rate_per_minute / 60.0, self.burst)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _call(self, prompt: str) -> str:
+        self._ensure_primitives()
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    return await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                if not is_transient(e) or attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"Transient LLM error ({type(e).__name__}: {e}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str) -> str:
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(in_flight)
+        task = asyncio.ensure_future(self._call(prompt))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True).start()
+            return self._loop
+
+    def submit(self, prompt: str) -> Future:
+        """Schedules a call on the client's loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self.generate(prompt), self._get_loop())
+
+    def generate_sync(self, prompt: str) -> str:
+        return self.submit(prompt).result()
+
+
+def client_from_env(model=None) -> AsyncLLMClient:
+    """
+    Builds a client from LLM_* environment variables. LLM_BACKEND selects
+    "gemini" (default, using ``model``) or "http" (LLM_BACKEND_URL).
+    """
+    timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    if os.getenv("LLM_BACKEND", "gemini") == "http":
+        backend = HttpBackend(os.environ["LLM_BACKEND_URL"], timeout)
+    else:
+        backend = GeminiBackend(model, timeout)
+    return AsyncLLMClient(
+        backend,
+        rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", "60")),
+        burst=int(os.getenv("LLM_BURST", "5")),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        timeout=timeout,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+    )
@@ -1,24 +1,55 @@
-import fitz
 from typing import List
+from extractor.pdf_processing.pdf_source import PdfSource, describe_source, open_fitz
 from app.core.logger import setup_logger
 
 logger = setup_logger()
 
-def extract_blocks(pdf_path: str) -> List[str]:
+def extract_page_blocks(page, page_num: int) -> List[str]:
+    """
+    Extracts layout-aware text blocks from a single PyMuPDF page.
+
+    Args:
+        page: An open PyMuPDF page.
+        page_num (int): 1-based page number, used for logging.
+
+    Returns:
+        List[str]: The text blocks found on the page.
+    """
+    try:
+        blocks = page.get_text("dict")["blocks"]
+    except Exception as e:
+        logger.error(f"Failed to extract blocks from page {page_num}: {e}")
+        return []
+
+    logger.debug(f"Found {len(blocks)} blocks on page {page_num}")
+    page_blocks = []
+    for b_idx, b in enumerate(blocks):
+        if "lines" in b:
+            lines = []
+            for l_idx, l in enumerate(b["lines"]):
+                spans = [s["text"] for s in l["spans"] if s["text"].strip()]
+                if spans:
+                    lines.append(" ".join(spans))
+            if lines:
+                logger.debug(f"Block {b_idx} on page {page_num} has {len(lines)} lines")
+                page_blocks.append("\n".join(lines))
+    return page_blocks
+
+def extract_blocks(pdf_path: PdfSource) -> List[str]:
     """
     Extracts layout-aware text blocks from a PDF using PyMuPDF.
 
     Args:
-        pdf_path (str): Path to the PDF file.
+        pdf_path (PdfSource): Path to the PDF file, or its content as bytes or a buffer.
 
     Returns:
         List[str]: A list of extracted text blocks, each representing a logical section or paragraph from the PDF.
     """
-    logger.info(f"Opening PDF file: {pdf_path}")
+    logger.info(f"Opening PDF file: {describe_source(pdf_path)}")
     try:
-        doc = fitz.open(pdf_path)
+        doc = open_fitz(pdf_path)
     except Exception as e:
-        logger.error(f"Failed to open PDF file '{pdf_path}': {e}")
+        logger.error(f"Failed to open PDF file '{describe_source(pdf_path)}': {e}")
         raise
     
     all_blocks = []
@@ -26,23 +57,7 @@ def extract_blocks(pdf_path: str) -> List[str]:
 
     for page_num, page in enumerate(doc, start=1):
         logger.info(f"Processing page {page_num}")
-        try:
-            blocks = page.get_text("dict")["blocks"]
-        except Exception as e:
-            logger.error(f"Failed to extract blocks from page {page_num}: {e}")
-            continue
-
-        logger.debug(f"Found {len(blocks)} blocks on page {page_num}")
-        for b_idx, b in enumerate(blocks):
-            if "lines" in b:
-                lines = []
-                for l_idx, l in enumerate(b["lines"]):
-                    spans = [s["text"] for s in l["spans"] if s["text"].strip()]
-                    if spans:
-                        lines.append(" ".join(spans))
-                if lines:
-                    logger.debug(f"Block {b_idx} on page {page_num} has {len(lines)} lines")
-                    all_blocks.append("\n".join(lines))
+        all_blocks.extend(extract_page_blocks(page, page_num))
 
     logger.info(f"Extracted {len(all_blocks)} text blocks from PDF")
-    return all_blocks
\ No newline at end of file
+    return all_blocks
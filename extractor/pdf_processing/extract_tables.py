@@ -1,23 +1,24 @@
 import pdfplumber
 from typing import List
+from extractor.pdf_processing.pdf_source import PdfSource, describe_source, open_for_pdfplumber
 from app.core.logger import setup_logger
 
 logger = setup_logger()
 
-def extract_tables(pdf_path: str) -> List[List[List[str]]]:
+def extract_tables(pdf_path: PdfSource) -> List[List[List[str]]]:
     """
     Extracts tables from a PDF using pdfplumber.
 
     Args:
-        pdf_path (str): Path to the PDF file.
+        pdf_path (PdfSource): Path to the PDF file, or its content as bytes or a buffer.
 
     Returns:
         List[List[List[str]]]: A list of tables, where each table is a list of rows, and each row is a list of cell values.
     """
-    logger.info(f"Opening PDF file for table extraction: {pdf_path}")
+    logger.info(f"Opening PDF file for table extraction: {describe_source(pdf_path)}")
     tables = []
     try:
-        with pdfplumber.open(pdf_path) as pdf:
+        with pdfplumber.open(open_for_pdfplumber(pdf_path)) as pdf:
             logger.info(f"Number of pages in PDF: {len(pdf.pages)}")
             for page_num, page in enumerate(pdf.pages, start=1):
                 logger.info(f"Extracting tables from page {page_num}")
@@ -30,7 +31,7 @@ def extract_tables(pdf_path: str) -> List[List[List[str]]]:
                 except Exception as e:
                     logger.error(f"Failed to extract tables from page {page_num}: {e}")
     except Exception as e:
-        logger.error(f"Failed to open PDF file '{pdf_path}': {e}")
+        logger.error(f"Failed to open PDF file '{describe_source(pdf_path)}': {e}")
         raise
     logger.info(f"Extracted {len(tables)} tables from PDF")
     return tables
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+import fitz
+from typing import List, Optional, Tuple
+from app.core.logger import setup_logger
+from extractor.pdf_processing.extract_blocks import extract_page_blocks
+from extractor.pdf_processing.pdf_source import MemoryViewReader, PdfSource, as_memoryview, describe_source
+
+logger = setup_logger()
+
+TABLE_ENGINES = ("pdfplumber", "pymupdf")
+
+# Drawing operators that produce the ruling lines and cell edges table finders rely on
+_RULING_OPS = {"l", "re", "qu"}
+
+
+def has_ruled_layout(page, min_segments: int = 2) -> bool:
+    """
+    Returns True if the page draws enough lines or rectangles to contain a table.
+
+    Both pdfplumber and PyMuPDF detect tables from ruling lines by default, so a
+    page without any line or rectangle drawings cannot yield a table and table
+    detection can be skipped.
+    """
+    segments = 0
+    for path in page.get_drawings():
+        for item in path.get("items", []):
+            if item[0] in _RULING_OPS:
+                segments += 1
+                if segments >= min_segments:
+                    return True
+    return False
+
+
+def _find_tables_pymupdf(page, page_num: int) -> Optional[List[List[List[str]]]]:
+    """Returns the page's tables, or None if PyMuPDF's table finder is unavailable or fails."""
+    try:
+        found = page.find_tables()
+    except Exception as e:
+        logger.warning(f"PyMuPDF table finder failed on page {page_num}: {e}")
+        return None
+    return [table.extract() for table in found.tables]
+
+
+def _find_tables_pdfplumber(pdf_view: memoryview, page_numbers: List[int]) -> List[Tuple[int, List[List[List[str]]]]]:
+    import pdfplumber
+
+    results = []
+    with pdfplumber.open(MemoryViewReader(pdf_view), pages=page_numbers) as pdf:
+        for page in pdf.pages:
+            try:
+                results.append((page.page_number, page.extract_tables()))
+            except Exception as e:
+                logger.error(f"Failed to extract tables from page {page.page_number}: {e}")
+    return results
+
+
+def parse_pdf(pdf_path: PdfSource, table_engine: Optional[str] = None) -> Tuple[List[str], List[List[List[str]]]]:
+    """
+    Extracts text blocks and tables from a PDF in a single pass.
+
+    The content is read once (or used in place when given as bytes or a
+    buffer) and opened once with PyMuPDF. Table detection only runs on pages
+    with a ruled layout. Tables are found with pdfplumber on the same in-memory
+    buffer by default. With ``table_engine`` "pymupdf" (or PDF_TABLE_ENGINE=pymupdf)
+    PyMuPDF's faster table finder is used instead, falling back to pdfplumber on
+    pages where it fails or finds nothing. Its tables can differ from
+    pdfplumber's (it reports some ruled one-line boxes, such as page footers, as
+    tables), which changes the text sent to the LLM and its cache keys.
+
+    Args:
+        pdf_path (PdfSource): Path to the PDF file, or its content as bytes or a buffer.
+        table_engine (str): "pdfplumber" or "pymupdf".
+
+    Returns:
+        Tuple[List[str], List[List[List[str]]]]: The text blocks and the tables, in page order.
+    """
+    table_engine = table_engine or os.getenv("PDF_TABLE_ENGINE", "pdfplumber")
+    if table_engine not in TABLE_ENGINES:
+        raise ValueError(f"Unknown table engine '{table_engine}', expected one of {TABLE_ENGINES}")
+
+    logger.info(f"Opening PDF file: {describe_source(pdf_path)}")
+    try:
+        pdf_view = as_memoryview(pdf_path)
+        doc = fitz.open(stream=pdf_view, filetype="pdf")
+    except Exception as e:
+        logger.error(f"Failed to open PDF file '{describe_source(pdf_path)}': {e}")
+        raise
+
+    all_blocks: List[str] = []
+    tables_by_page = {}
+    fallback_pages: List[int] = []
+    skipped = 0
+    try:
+        logger.info(f"Number of pages in PDF: {len(doc)}")
+        for page_num, page in enumerate(doc, start=1):
+            all_blocks.extend(extract_page_blocks(page, page_num))
+
+            if not has_ruled_layout(page):
+                skipped += 1
+                continue
+            page_tables = _find_tables_pymupdf(page, page_num) if table_engine == "pymupdf" else None
+            if page_tables:
+                tables_by_page[page_num] = page_tables
+            else:
+                fallback_pages.append(page_num)
+    finally:
+        doc.close()
+
+    if fallback_pages:
+        logger.debug(f"Running pdfplumber on pages {fallback_pages}")
+        for page_num, page_tables in _find_tables_pdfplumber(pdf_view, fallback_pages):
+            tables_by_page[page_num] = page_tables
+
+    tables = [table for page_num in sorted(tables_by_page) for table in tables_by_page[page_num]]
+    logger.info(f"Extracted {len(all_blocks)} text blocks and {len(tables)} tables "
+                f"({skipped} pages without ruled layout skipped)")
+    return all_blocks, tables
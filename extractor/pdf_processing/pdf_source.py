@@ -0,0 +1,102 @@
+import io
+import os
+import fitz
+from typing import Union
+
+# A PDF can be given as a path or as its content already in memory
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, io.BytesIO]
+
+
+def is_path(source: PdfSource) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def describe_source(source: PdfSource) -> str:
+    """Returns a short label for log messages."""
+    if is_path(source):
+        return str(source)
+    return f"<in-memory PDF, {len(as_memoryview(source))} bytes>"
+
+
+def as_memoryview(source: PdfSource) -> memoryview:
+    """
+    Returns the PDF content as a read-only memoryview.
+
+    In-memory sources are wrapped without copying; a BytesIO is exposed through
+    its internal buffer. Paths are read from disk once.
+    """
+    if isinstance(source, memoryview):
+        return source if source.readonly else source.toreadonly()
+    if isinstance(source, (bytes, bytearray)):
+        return memoryview(source).toreadonly()
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer().toreadonly()
+    with open(source, "rb") as f:
+        return memoryview(f.read())
+
+
+def open_fitz(source: PdfSource):
+    """Opens a PDF with PyMuPDF from a path or directly from memory."""
+    if is_path(source):
+        return fitz.open(source)
+    return fitz.open(stream=as_memoryview(source), filetype="pdf")
+
+
+class MemoryViewReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over a memoryview.
+
+    Unlike ``io.BytesIO(data)``, it does not copy the buffer, so pdfplumber
+    can read the same bytes PyMuPDF already has in memory.
+    """
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view.cast("B") if view.format != "B" or view.ndim != 1 else view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        n = len(chunk)
+        buffer[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def readall(self) -> bytes:
+        return self.read(-1)
+
+
+def open_for_pdfplumber(source: PdfSource):
+    """Returns what pdfplumber.open expects: the path, or a zero-copy reader over the bytes."""
+    if is_path(source):
+        return source
+    return MemoryViewReader(as_memoryview(source))
@@ -0,0 +1,212 @@
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import yaml
+from app.core.logger import setup_logger
+
+logger = setup_logger()
+
+# Resolved from this file so templates load whatever the working directory is
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "config",
+                              "invoice_templates.yaml")
+
+INVOICE_FIELDS = ["Invoice Number", "Order Date", "Invoice Date", "Order Number", "Supplier (Vendor) Name"]
+REQUIRED_INVOICE_FIELDS = ["Invoice Number", "Invoice Date", "Supplier (Vendor) Name"]
+SCORED_LAPTOP_FIELDS = ["Lapotop Model", "Processor", "RAM", "Storage", "Laptop Price"]
+
+_BRANDS = ["Apple", "Dell", "HP", "Lenovo", "Asus", "Acer", "Microsoft", "Samsung", "MSI", "LG"]
+_MODEL = re.compile(
+    r"\b(MacBook (?:Air|Pro)|ThinkPad \w+|IdeaPad \w+|ThinkBook \w+|XPS \d+|Latitude \d+|Inspiron \d+|"
+    r"Vostro \d+|Precision \d+|Pavilion(?: \w+)?|EliteBook \w+|ProBook \w+|Spectre \w+|Envy \w+|"
+    r"ZenBook \w+|VivoBook \w+|Aspire \w+|Swift \w+|Surface Laptop(?: \d+)?|Galaxy Book\w*)\b", re.I)
+_PROCESSOR = re.compile(
+    r"\b(M[1-4](?: (?:Pro|Max|Ultra))?(?= chip|\b)|i[3579](?: \d+(?:st|nd|rd|th) Gen)?|"
+    r"Ryzen [3579](?: \d{4}\w*)?|Core Ultra [579])\b")
+_RAM = re.compile(r"\b(\d{1,3})\s?GB\s*(?:RAM|DDR\d\w*|/|Unified Memory)", re.I)
+_STORAGE = re.compile(r"\b(\d{1,4})\s?(GB|TB)\s*(?:/\s*)?(SSD|HDD|eMMC)", re.I)
+_SCREEN = re.compile(r"\b(\d{2}(?:\.\d)?)(?:-inch|\s?inch|\")", re.I)
+_OS = re.compile(r"\b(Mac ?OS(?: [A-Z][a-z]+)?|macOS(?: [A-Z][a-z]+)?|Windows \d+(?: Home| Pro)?|Chrome ?OS|Ubuntu|DOS)\b")
+_COLORS = ["Space Grey", "Space Gray", "Silver", "Gold", "Midnight", "Starlight", "Sky Blue", "Black",
+           "Grey", "Gray", "Blue", "White", "Platinum"]
+_WARRANTY = re.compile(r"(\d+)\s*(Year|Yr|Month)s?", re.I)
+
+
+def _to_number(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value.replace(",", "").replace("₹", "").strip())
+    except ValueError:
+        return None
+
+
+def _warranty_months(value: Optional[str]) -> Optional[int]:
+    match = _WARRANTY.search(value or "")
+    if not match:
+        return None
+    amount = int(match.group(1))
+    return amount * 12 if match.group(2).lower().startswith("y") else amount
+
+
+def parse_laptop_description(description: str) -> Dict[str, Any]:
+    """Parses laptop attributes out of a free-text product description."""
+    text = re.sub(r"\s+", " ", description).strip()
+    model = _MODEL.search(text)
+    processor = _PROCESSOR.search(text)
+    ram = _RAM.search(text)
+    storage = _STORAGE.search(text)
+    screen = _SCREEN.search(text)
+    os_match = _OS.search(text)
+    brand = next((b for b in _BRANDS if re.search(rf"\b{b}\b", text, re.I)), None)
+    color = next((c for c in _COLORS if re.search(rf"\b{c}\b", text, re.I)), None)
+    return {
+        "Lapotop Model": model.group(1).title().replace("Macbook", "MacBook") if model else None,
+        "Laptop Brand": brand,
+        "Processor": processor.group(1) if processor else None,
+        "RAM": f"{ram.group(1)}GB" if ram else None,
+        "Storage": f"{storage.group(1)}{storage.group(2).upper()} {storage.group(3).upper()}" if storage else None,
+        "Model Color": color,
+        "Screen Size": f"{screen.group(1)}-inch" if screen else None,
+        "Laptop OS": os_match.group(1) if os_match else None,
+        "Laptop OS Version": None,
+    }
+
+
+class InvoiceTemplate:
+    def __init__(self, config: Dict[str, Any]):
+        self.name = config["name"]
+        self.fingerprint = config["fingerprint"]
+        self.date_format = config.get("date_format")
+        self.fields = {key: re.compile(pattern) for key, pattern in config.get("fields", {}).items()}
+        self.line_items = re.compile(config["line_items"], re.S) if config.get("line_items") else None
+
+    def matches(self, text: str) -> bool:
+        return all(marker in text for marker in self.fingerprint)
+
+    def _date(self, value: str) -> str:
+        if not self.date_format:
+            return value
+        try:
+            return datetime.strptime(value, self.date_format).strftime("%d-%m-%Y")
+        except ValueError:
+            return value
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        invoice: Dict[str, Any] = {}
+        for key in INVOICE_FIELDS:
+            pattern = self.fields.get(key)
+            match = pattern.search(text) if pattern else None
+            value = match.group("value").strip() if match else None
+            if value and key.endswith("Date"):
+                value = self._date(value)
+            invoice[key] = value
+
+        laptops = []
+        for match in (self.line_items.finditer(text) if self.line_items else []):
+            groups = match.groupdict()
+            laptop = parse_laptop_description(groups.get("description") or "")
+            quantity = int(groups["quantity"]) if groups.get("quantity") else 1
+            price = _to_number(groups.get("unit_price"))
+            if price is None and groups.get("line_total"):
+                total = _to_number(groups["line_total"])
+                price = round(total / quantity, 2) if total is not None else None
+            serial = groups.get("serial")
+            laptop.update({
+                "Laptop Serial Number": re.sub(r"\s+", "", serial) if serial and serial.strip() else None,
+                "Warranty Duration": _warranty_months(groups.get("warranty")),
+                "Laptop Price": price,
+                "Quantity": quantity,
+            })
+            laptops.append(laptop)
+        invoice["Laptops"] = laptops
+        return invoice
+
+
+def score_invoice(invoice: Dict[str, Any]) -> float:
+    """
+    Confidence in [0, 1]: 0 when a required field or every laptop is missing,
+    otherwise the share of invoice and key laptop fields that were filled.
+    """
+    laptops = invoice.get("Laptops") or []
+    if not laptops or any(not invoice.get(key) for key in REQUIRED_INVOICE_FIELDS):
+        return 0.0
+    if any(not laptop.get("Lapotop Model") or laptop.get("Laptop Price") is None for laptop in laptops):
+        return 0.0
+    filled = sum(1 for key in INVOICE_FIELDS if invoice.get(key))
+    filled += sum(1 for laptop in laptops for key in SCORED_LAPTOP_FIELDS if laptop.get(key))
+    return filled / (len(INVOICE_FIELDS) + len(SCORED_LAPTOP_FIELDS) * len(laptops))
+
+
+class RuleExtractor:
+    """
+    Deterministic extraction tier run before the LLM.
+
+    Picks the first template whose supplier fingerprint appears in the
+    formatted invoice text and fills the same JSON schema the LLM returns.
+    Results below ``min_confidence`` are discarded so the caller falls back
+    to the LLM. Per-template hit and fallback counts are kept in ``stats``.
+    """
+
+    def __init__(self, templates: List[InvoiceTemplate], min_confidence: float = 0.8):
+        self.templates = templates
+        self.min_confidence = min_confidence
+        self.stats: Dict[str, Dict[str, int]] = {t.name: {"matched": 0, "accepted": 0, "fallback": 0} for t in templates}
+        self.unmatched = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_yaml(cls, path: str = TEMPLATES_PATH, min_confidence: Optional[float] = None) -> "RuleExtractor":
+        templates = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                config = yaml.safe_load(f) or {}
+            templates = [InvoiceTemplate(t) for t in config.get("templates", [])]
+        if min_confidence is None:
+            min_confidence = float(os.getenv("RULE_EXTRACTOR_MIN_CONFIDENCE", "0.8"))
+        return cls(templates, min_confidence)
+
+    def extract(self, invoice_text: str) -> Optional[Dict[str, Any]]:
+        template = next((t for t in self.templates if t.matches(invoice_text)), None)
+        if template is None:
+            with self._lock:
+                self.unmatched += 1
+            return None
+        try:
+            invoice = template.extract(invoice_text)
+            confidence = score_invoice(invoice)
+        except Exception as e:
+            logger.warning(f"Template '{template.name}' failed: {e}")
+            invoice, confidence = None, 0.0
+
+        accepted = confidence >= self.min_confidence
+        with self._lock:
+            self.stats[template.name]["matched"] += 1
+            self.stats[template.name]["accepted" if accepted else "fallback"] += 1
+        if not accepted:
+            logger.info(f"Template '{template.name}' confidence {confidence:.2f} too low, using the LLM.")
+            return None
+        logger.info(f"Extracted invoice with template '{template.name}' (confidence {confidence:.2f}).")
+        return invoice
+
+    def hit_rates(self) -> Dict[str, Any]:
+        with self._lock:
+            rates = {
+                name: dict(counts, hit_rate=round(counts["accepted"] / counts["matched"], 3) if counts["matched"] else None)
+                for name, counts in self.stats.items()
+            }
+            rates["_unmatched"] = self.unmatched
+        return rates
+
+
+_rule_extractor: Optional[RuleExtractor] = None
+_rule_extractor_lock = threading.Lock()
+
+
+def get_rule_extractor() -> RuleExtractor:
+    global _rule_extractor
+    with _rule_extractor_lock:
+        if _rule_extractor is None:
+            _rule_extractor = RuleExtractor.from_yaml()
+        return _rule_extractor
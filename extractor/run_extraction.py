@@ -1,29 +1,26 @@
-from typing import Any
-from extractor.pdf_processing.extract_tables import extract_tables
-from extractor.pdf_processing.extract_blocks import extract_blocks
+from typing import Any, Callable, Dict, List, Optional
+from extractor.pdf_processing.parse_document import parse_pdf
+from extractor.pdf_processing.pdf_source import PdfSource, as_memoryview, describe_source
 from extractor.laptop_extractor import extract_laptop_information
 from extractor.pdf_processing.format_invoices import format_invoices_for_llm
+from extractor.cache import get_extraction_cache
+from extractor.batch_extractor import extract_many
+from extractor.rule_extractor import get_rule_extractor
 from app.core.logger import setup_logger
 
 logger = setup_logger()
 
 
-def run_pipeline(pdf_path: str) -> Any:
-    logger.info(f"Starting pipeline for {pdf_path}...")
-    print(f"Processing {pdf_path}...")
-
-    try:
-        blocks = extract_blocks(pdf_path)
-        logger.info(f"Extracted {len(blocks)} text blocks from PDF.")
-    except Exception as e:
-        logger.error(f"Failed to extract text blocks: {e}")
-        raise
-
+def parse_invoice(pdf_path: PdfSource) -> str:
+    """
+    Runs the CPU-bound part of the pipeline: single-pass block and table
+    extraction, followed by formatting into the plain-text LLM input.
+    """
     try:
-        tables = extract_tables(pdf_path)
-        logger.info(f"Extracted {len(tables)} tables from PDF.")
+        blocks, tables = parse_pdf(pdf_path)
+        logger.info(f"Extracted {len(blocks)} text blocks and {len(tables)} tables from PDF.")
     except Exception as e:
-        logger.error(f"Failed to extract tables: {e}")
+        logger.error(f"Failed to parse PDF: {e}")
         raise
 
     try:
@@ -33,14 +30,108 @@ def run_pipeline(pdf_path: str) -> Any:
         logger.error(f"Failed to format invoice for LLM: {e}")
         raise
 
+    return formatted_invoices
+
+
+def extract_invoice(formatted_invoices: str, llm_fn: Optional[Callable[[str], Any]] = None) -> Any:
+    """
+    Runs the extraction part of the pipeline on already formatted invoice text.
+    Supplier templates (extractor.rule_extractor) are tried first; the LLM,
+    or ``llm_fn`` when given, is only called when no template is confident.
+    """
+    invoice_info = get_rule_extractor().extract(formatted_invoices)
+    if invoice_info is not None:
+        return invoice_info
     try:
         logger.info("Extracting entities from invoices.")
-        invoice_info = extract_laptop_information(formatted_invoices)
+        invoice_info = (llm_fn or extract_laptop_information)(formatted_invoices)
         logger.info(f"Invoice Extraction Results: {invoice_info}")
-        print(invoice_info)
     except Exception as e:
         logger.error(f"Failed to extract information from invoice: {e}")
         raise
+    return invoice_info
+
+
+def run_pipeline(pdf_path: PdfSource, use_cache: bool = True) -> Any:
+    """
+    Runs the full extraction pipeline on a PDF given as a path, bytes or a
+    buffer. In-memory content is shared as a read-only memoryview, never copied.
+    """
+    logger.info(f"Starting pipeline for {describe_source(pdf_path)}...")
+    print(f"Processing {describe_source(pdf_path)}...")
+
+    cache = get_extraction_cache() if use_cache else None
+    pdf_bytes = None
+    if cache and cache.enabled:
+        pdf_bytes = as_memoryview(pdf_path)
+        cached = cache.get_by_pdf(pdf_bytes)
+        if cached is not None:
+            logger.info("Pipeline served from extraction cache.")
+            return cached
+
+    formatted_invoices = parse_invoice(pdf_bytes if pdf_bytes is not None else pdf_path)
+    invoice_info = cache.get_by_text(formatted_invoices) if cache else None
+    if invoice_info is None:
+        invoice_info = extract_invoice(formatted_invoices)
+        if cache:
+            cache.put(invoice_info, pdf_bytes=pdf_bytes, formatted_text=formatted_invoices)
+    elif pdf_bytes is not None:
+        # Same text from new bytes (e.g. a re-saved copy): remember the new bytes too
+        cache.put(invoice_info, pdf_bytes=pdf_bytes)
+    print(invoice_info)
 
     logger.info("Pipeline completed successfully.")
-    return invoice_info
\ No newline at end of file
+    return invoice_info
+
+
+def run_batch_pipeline(pdf_paths: List[PdfSource], use_cache: bool = True) -> List[Any]:
+    """
+    Runs the pipeline on several PDFs, sending the invoices that are neither
+    cached nor handled by a supplier template to the model in batches (see
+    extractor.batch_extractor). Returns one result per input, None where
+    parsing or extraction failed.
+    """
+    cache = get_extraction_cache() if use_cache else None
+    rules = get_rule_extractor()
+    results: List[Any] = [None] * len(pdf_paths)
+    sources: Dict[int, Any] = {}
+    texts: Dict[int, str] = {}
+
+    for i, pdf_path in enumerate(pdf_paths):
+        logger.info(f"Starting pipeline for {describe_source(pdf_path)}...")
+        source = as_memoryview(pdf_path) if cache and cache.enabled else pdf_path
+        cached = cache.get_by_pdf(source) if cache and cache.enabled else None
+        if cached is not None:
+            results[i] = cached
+            continue
+        try:
+            formatted = parse_invoice(source)
+        except Exception as e:
+            logger.error(f"Failed to parse {describe_source(pdf_path)}: {e}")
+            continue
+        cached = cache.get_by_text(formatted) if cache else None
+        if cached is not None:
+            results[i] = cached
+            cache.put(cached, pdf_bytes=source if cache.enabled else None)
+            continue
+        from_rules = rules.extract(formatted)
+        if from_rules is not None:
+            results[i] = from_rules
+            if cache:
+                cache.put(from_rules, pdf_bytes=source if cache.enabled else None, formatted_text=formatted)
+            continue
+        sources[i] = source
+        texts[i] = formatted
+
+    order = list(texts)
+    for i, invoice_info in zip(order, extract_many([texts[i] for i in order])):
+        if isinstance(invoice_info, Exception):
+            logger.error(f"Failed to extract information from {describe_source(pdf_paths[i])}: {invoice_info}")
+            continue
+        results[i] = invoice_info
+        if cache:
+            pdf_bytes = sources[i] if isinstance(sources[i], memoryview) else None
+            cache.put(invoice_info, pdf_bytes=pdf_bytes, formatted_text=texts[i])
+
+    logger.info(f"Batch pipeline completed for {len(pdf_paths)} PDFs, {len(order)} sent to the LLM.")
+    return results
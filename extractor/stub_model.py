@@ -0,0 +1,52 @@
+import hashlib
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+_INVOICE_BLOCK = re.compile(r'=== INVOICE (\d+) ===\n"""\n(.*?)\n"""\n', re.DOTALL)
+_SINGLE_INVOICE = re.compile(r'Invoice text:\n"""\n(.*)\n"""\n', re.DOTALL)
+
+
+def default_stub_invoice(invoice_text: str) -> Dict[str, Any]:
+    """A deterministic invoice derived from the text, with no laptops."""
+    digest = hashlib.sha256(invoice_text.encode("utf-8")).hexdigest()[:12].upper()
+    return {
+        "Invoice Number": f"STUB-{digest}",
+        "Order Date": None,
+        "Invoice Date": None,
+        "Order Number": None,
+        "Supplier (Vendor) Name": None,
+        "Laptops": [],
+    }
+
+
+class StubModel:
+    """
+    Local stand-in for the Gemini model, answering single and batched
+    extraction prompts with JSON in the same format the real model returns.
+
+    Install it with ``laptop_extractor.set_generate_fn(StubModel())``. Each
+    invoice is answered by ``responder(invoice_text)``; ``prompts`` records
+    every prompt received, so tests can count requests.
+    """
+
+    def __init__(self, responder: Optional[Callable[[str], Dict[str, Any]]] = None):
+        self.responder = responder or default_stub_invoice
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def request_count(self) -> int:
+        return len(self.prompts)
+
+    def __call__(self, prompt: str) -> str:
+        with self._lock:
+            self.prompts.append(prompt)
+        blocks = _INVOICE_BLOCK.findall(prompt)
+        if blocks:
+            payload = [dict(self.responder(text), **{"Invoice Index": int(index)}) for index, text in blocks]
+        else:
+            match = _SINGLE_INVOICE.search(prompt)
+            payload = self.responder(match.group(1) if match else prompt)
+        return f"```json\n{json.dumps(payload, indent=2)}\n```"
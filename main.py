@@ -1,6 +1,8 @@
 from db.crud import insert_or_replace_laptop_invoice
 from db.database import init_db
-from extractor.run_extraction import run_pipeline
+from extractor.run_extraction import run_batch_pipeline
+from extractor.cache import get_extraction_cache
+from extractor.rule_extractor import get_rule_extractor
 from extractor.export import export_all_laptop_invoices_json, export_all_laptop_invoices_csv
 
 if __name__ == "__main__":
@@ -12,14 +14,16 @@ if __name__ == "__main__":
     ]
     
     print("--- Starting PDF Extraction and Database Storage ---")
-    for pdf_path in pdf_paths:
+    # Invoices are sent to the LLM in batches when LLM_BATCH_TOKENS is set
+    for pdf_path, pdf_text in zip(pdf_paths, run_batch_pipeline(pdf_paths)):
         print(f"Processing PDF: {pdf_path}")
-        pdf_text = run_pipeline(pdf_path) 
         if pdf_text: 
             insert_or_replace_laptop_invoice(pdf_text) 
         else:
             print(f"Warning: No data extracted from {pdf_path}. Skipping database insertion for this file.")
     print("--- PDF Extraction and Database Storage Complete ---")
+    print(f"Extraction cache: {get_extraction_cache().stats()}")
+    print(f"Rule extractor: {get_rule_extractor().hit_rates()}")
 
     print("\n--- Exporting Data to JSON and CSV ---")
     export_all_laptop_invoices_json() 